@@ -1,12 +1,36 @@
 """
 This module contains the components package, which includes various classes
 for controlling different components of a chopper wheel.
+
+The components are imported on first use and the DeviceManager is built on
+startup (see get_device_manager), so importing main stays cheap.
 """
+import importlib
+
+_lazy_attributes = {
+    "CWComponent": ".chopperwheel",
+    "CWConnectionManager": ".chopperwheel",
+    "EMConnectionManager": ".electrometer",
+    "ICComponent": ".electrometer",
+    "create_layout": ".page_layout",
+    "create_param_settings_row": ".param_settings_row",
+    "CombinedDataView": ".combined_data_view",
+    "FlashUI": ".flash_ui",
+}
+
+__all__ = [*_lazy_attributes, "get_device_manager"]
+
+
+def __getattr__(name: str):
+    if name in _lazy_attributes:
+        return getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_device_manager():
+    """
+    The DeviceManager singleton, built on the first call.
+    """
+    from components.device_manager import get_device_manager as get
 
-from .chopperwheel import *
-from .device_manager import device_manager
-from .electrometer import *
-from .page_layout import create_layout
-from .param_settings_row import *
-from .combined_data_view import *
-from .flash_ui import *
+    return get()
@@ -13,6 +13,7 @@ from components import param_settings_row
 from nicegui import ui, app
 from util.component_base import ComponentBase
 from util.data_file_handler import DataFileHandler
+from util.instrumentation import instrumented
 from util.settings_handler import SettingsHandler
 
 logger = logging.getLogger()
@@ -192,6 +193,7 @@ class CWComponent(ComponentBase):
                 "w-full gap-2 justify-items-stretch"
             ):
                 self.file_handler.download_file_button_ui()
+                self.file_handler.segments_button_ui()
                 self.file_handler.save_download_clear_button_ui()
                 self.file_handler.delete_file_button_ui()
 
@@ -261,6 +263,7 @@ class CWComponent(ComponentBase):
 
         return timestamps, velocities, angular_positions
 
+    @instrumented("CWComponent.update_plots", budget="update_plot_timer.interval")
     def update_plots(self):
 
         # Check if the file has been modified
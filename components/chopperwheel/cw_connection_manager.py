@@ -3,12 +3,12 @@
 import logging
 from pathlib import Path
 
-import serial.tools.list_ports  # type: ignore
 from components.chopperwheel.cw_component import CWComponent
 from controllers import ChopperWheel
 from nicegui import ui
 from util.connection_manager_base import ConnectionManagerBase
 from util.data_file_handler import DataFileHandler
+from util.device_discovery import device_discovery, list_serial_ports
 from util.settings_handler import SettingsHandler
 from static.global_ui_props import props_select
 
@@ -16,6 +16,17 @@ logger = logging.getLogger()
 main_working_directory = Path(__file__).parent.parent
 
 
+def format_bus_stats(status_data: dict) -> str:
+    bus = status_data.get("bus")
+    if not bus:
+        return "I don't know yet"
+    latencies = ", ".join(
+        f"{name}: {stats['mean_latency_ms']:.1f} ms"
+        for name, stats in bus["classes"].items()
+    )
+    return f"{bus['utilisation'] * 100:.0f}% busy ({bus['headroom'] * 100:.0f}% left) - {latencies}"
+
+
 class CWConnectionManager(ConnectionManagerBase):
     def __init__(self):
         super().__init__()
@@ -33,9 +44,19 @@ class CWConnectionManager(ConnectionManagerBase):
         self.component: CWComponent = CWComponent(
             self.pipe, self.data_file_handler, self.settings_handler
         )
-        self.ports = [port.device for port in serial.tools.list_ports.comports()]
+        device_discovery.register("serial", list_serial_ports, cheap=True, default=[])
+        device_discovery.subscribe(
+            "serial", self.connection_menu_ui.refresh  # pylint: disable=no-member
+        )
         self.status_data = {"are_we_home_yet": "I don't know yet"}
 
+    @property
+    def ports(self) -> list[str]:
+        ports = list(device_discovery.get("serial"))
+        if self.address and self.address not in ports:
+            ports.append(self.address)
+        return ports
+
     @ui.refreshable
     def connection_menu_ui(self):
         with ui.card().classes("w-full mb-2"):
@@ -61,10 +82,14 @@ class CWConnectionManager(ConnectionManagerBase):
         )
         self.connection_menu_ui()
 
-        with ui.grid(columns=2, rows=1).classes("gap-2"):
+        with ui.grid(columns=2, rows=2).classes("gap-2"):
             ui.label("Motor is at Home position: ")
             self.home_position_label = ui.label("I don't know yet").bind_text_from(
                 self, "status_data", backward=lambda x: str(x["are_we_home_yet"])
             )
+            ui.label("Serial bus usage: ")
+            ui.label("I don't know yet").bind_text_from(
+                self, "status_data", backward=format_bus_stats
+            ).tooltip("Utilisation of the TMCL serial interface and mean latency per transaction class")
 
         self.component.create_ui()
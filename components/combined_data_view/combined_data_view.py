@@ -2,18 +2,35 @@
 
 import logging
 from pathlib import Path
-from nicegui import ui
+from nicegui import run, ui
 import pandas as pd # type: ignore
 import plotly.graph_objects as go # type: ignore
 from static.global_ui_props import *
 from util.connection_manager_base import ConnectionManagerBase
-from datetime import datetime
+from components.combined_data_view.data_loader import DataLoader, align_sources
+import time
 
 
 
 logger = logging.getLogger()
 work_dir = Path(__file__).parent
 
+# seconds of data shown, None shows the whole files
+TIME_WINDOWS = {
+    None: "Everything",
+    600: "Last 10 minutes",
+    3600: "Last hour",
+    6 * 3600: "Last 6 hours",
+    24 * 3600: "Last 24 hours",
+}
+
+# name of the connection manager -> prefix of its columns in the aligned data
+SOURCE_NAMES = {
+    "Electrometer 1": "em 1",
+    "Electrometer 2": "em 2",
+    "Chopper Wheel": "cw",
+}
+
 
 class CombinedDataView:
     def __init__(self, connection_managers: list[ConnectionManagerBase]) -> None:
@@ -24,10 +41,13 @@ class CombinedDataView:
             self.connection_managers_dict[m] = m.name
 
         self.selected_c_managers: list[ConnectionManagerBase] = []
+        self.time_window: int | None = None  # seconds
 
         self.em_data1: pd.DataFrame = None
         self.em_data2: pd.DataFrame = None
         self.cw_data: pd.DataFrame = None
+        self.aligned_data: pd.DataFrame = pd.DataFrame(columns=["datetime"])
+        self.data_loader = DataLoader()
 
         self.plot_plotly: go.Figure = go.Figure()
         self.plot_nicegui: ui.plotly = None # type: ignore
@@ -38,6 +58,7 @@ class CombinedDataView:
         self.em_data1 = None
         self.em_data2 = None
         self.cw_data = None
+        self.aligned_data = pd.DataFrame(columns=["datetime"])
         self.create_ui.refresh() # pylint: disable=no-member
         self.create_plot_ui.refresh() # pylint: disable=no-member
 
@@ -63,6 +84,8 @@ class CombinedDataView:
                     ui.label("To add a datasource, select from the dropdown:").style("font-size: 14px; font-weight: bold;")
                     ui.select(options=self.connection_managers_dict, multiple=True, label="Datasource", on_change=callback, value=self.selected_c_managers).props(props_select + ' use-chips').classes("w-64").tooltip("Note that more than 2 components can lead to visual clutter and clipping in the ui ...")
 
+                ui.select(options=TIME_WINDOWS, label="Time window", on_change=self.update_plot_and_data).bind_value(self, "time_window").props(props_select).classes("w-40").tooltip("Only the rows of the time window are read from the files")
+
                 ui.button("Reset Datasources", on_click=self.reset_datasources).classes("m-1").props(props_button)
 
         self.create_plot_ui()
@@ -75,39 +98,38 @@ class CombinedDataView:
 
 
     async def update_plot_and_data(self):
-        plot = self.get_plotly_plot()
-        self.plot_nicegui.update_figure(plot)
+        await run.io_bound(self.load_data)
+        self.plot_nicegui.update_figure(self.build_figure())
 
     def get_plotly_plot(self):
+        self.load_data()
+        return self.build_figure()
 
-        self.em_data1 = None
-        self.em_data2 = None
-        self.cw_data = None
-
+    def load_data(self):
+        sources = {}
         for m in self.selected_c_managers:
-            match m.name:
-                case "Electrometer 1": self.em_data1 = pd.read_csv(m.data_file_handler.full_filename)
-                case "Electrometer 2": self.em_data2 = pd.read_csv(m.data_file_handler.full_filename)
-                case "Chopper Wheel": self.cw_data = pd.read_csv(m.data_file_handler.full_filename)
+            if m.name in SOURCE_NAMES:
+                sources[SOURCE_NAMES[m.name]] = self.read_data(m)
 
-        self.plot_plotly = go.Figure()
+        self.em_data1 = sources.get("em 1")
+        self.em_data2 = sources.get("em 2")
+        self.cw_data = sources.get("cw")
+        self.aligned_data = align_sources(sources)
 
-        if self.em_data1 is not None:
-            self.em_data1['time'] = [datetime.fromtimestamp(x) for x in self.em_data1['time']]
+    def build_figure(self) -> go.Figure:
+        data = self.aligned_data
+        self.plot_plotly = go.Figure()
 
-            self.plot_plotly.add_trace(go.Scatter(x=self.em_data1['time'], y=self.em_data1['current'], mode='lines', name='em 1 data'))
+        if "em 1 current" in data:
+            self.plot_plotly.add_trace(go.Scatter(x=data['datetime'], y=data['em 1 current'], mode='lines', connectgaps=True, name='em 1 data'))
             self.plot_plotly.update_layout(yaxis=dict(title='current [A]', autoshift=True, anchor='free',))
 
-        if self.em_data2 is not None:
-            self.em_data2['time'] = [datetime.fromtimestamp(x) for x in self.em_data2['time']]
-
-            self.plot_plotly.add_trace(go.Scatter(x=self.em_data2['time'], y=self.em_data2['current'], mode='lines', name='em 2 data'))
-
+        if "em 2 current" in data:
+            self.plot_plotly.add_trace(go.Scatter(x=data['datetime'], y=data['em 2 current'], mode='lines', connectgaps=True, name='em 2 data'))
 
-        if self.cw_data is not None:
-            self.cw_data['timestamp'] = [datetime.fromtimestamp(x) for x in self.cw_data['timestamp']]
-            self.plot_plotly.add_trace(go.Scatter(x=self.cw_data['timestamp'], y=self.cw_data['angular_position'], mode='lines', name='cw angular position', yaxis='y3'))
-            self.plot_plotly.add_trace(go.Scatter(x=self.cw_data['timestamp'], y=self.cw_data['velocity'], mode='lines', name='cw velocity', yaxis='y4'))
+        if "cw velocity" in data:
+            self.plot_plotly.add_trace(go.Scatter(x=data['datetime'], y=data['cw angular_position'], mode='lines', connectgaps=True, name='cw angular position', yaxis='y3'))
+            self.plot_plotly.add_trace(go.Scatter(x=data['datetime'], y=data['cw velocity'], mode='lines', connectgaps=True, name='cw velocity', yaxis='y4'))
             self.plot_plotly.update_layout(
                 yaxis3=dict(title='angular position [°]', overlaying='y', side='right', autoshift=True, anchor='free', showgrid=False),
                 yaxis4=dict(title='velocity [rps]', overlaying='y', side='right', autoshift=True, anchor='free', shift=20, showgrid=False),
@@ -121,7 +143,15 @@ class CombinedDataView:
             template='plotly_white'
         )
         return self.plot_plotly
-    
+
+    def read_data(self, m: ConnectionManagerBase) -> pd.DataFrame:
+        """
+        The sealed segments and the current file of the device as one table,
+        only the rows appended since the last call are parsed.
+        """
+        start_time = None if self.time_window is None else time.time() - self.time_window
+        return self.data_loader.load_source(m.data_file_handler, start_time)
+
     def set_dark_mode(self, value: bool):
         if value:
             self.plot_plotly.update_layout(template='plotly_dark')
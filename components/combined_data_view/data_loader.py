@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Cached loading of the data files for the combined data view.
+
+The parsed rows of every file are kept in memory together with the file
+identity and the position up to which the file was parsed, so refreshing the
+plot only parses the rows appended since. Sealed segments never change and
+are parsed once. The sources are aligned on the union of their timestamps:
+the rows of all sources are concatenated and grouped by timestamp and
+occurrence, so every row keeps its own time and sources sharing a timestamp
+end up in one row.
+"""
+import io
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+import pandas as pd  # type: ignore
+from dateutil import tz  # type: ignore
+
+logger = logging.getLogger()
+
+LOCAL_TIMEZONE = tz.tzlocal()
+
+
+@dataclass
+class CachedFile:
+    identity: tuple[int, int]  # device, inode; changes when the file is replaced
+    start_offset: int  # where parsing started, 0 includes the header
+    position: int  # bytes parsed so far
+    frames: list[pd.DataFrame] = field(default_factory=list)
+
+    def frame(self, headers: list[str]) -> pd.DataFrame:
+        if len(self.frames) > 1:
+            self.frames = [pd.concat(self.frames, ignore_index=True)]
+        return self.frames[0] if self.frames else pd.DataFrame(columns=headers)
+
+
+def to_local_datetime(timestamps: pd.Series) -> pd.Series:
+    """
+    Unix timestamps to naive local datetimes, like datetime.fromtimestamp but vectorized.
+    """
+    return (
+        pd.to_datetime(timestamps, unit="s", utc=True)
+        .dt.tz_convert(LOCAL_TIMEZONE)
+        .dt.tz_localize(None)
+    )
+
+
+class DataLoader:
+    def __init__(self):
+        self.cache: dict[str, CachedFile] = {}
+        self.lock = threading.Lock()  # the loader runs on the I/O executor
+
+    def load_source(self, handler, start_time: float | None = None) -> pd.DataFrame:
+        """
+        All rows of a DataFileHandler, i.e. of its sealed segments and its current
+        file, optionally only those from start_time on, with an added datetime column.
+        """
+        headers = handler.headers
+        frames = []
+        with self.lock:
+            files = handler.stream_files(start_time)
+            for path in files:
+                offset = 0
+                if start_time is not None and path == handler.full_filename:
+                    offset = handler.offset_for_time(start_time)
+                frames.append(self.load_file(path, headers, offset))
+            self.forget_except(files, handler)
+
+        frames = [frame for frame in frames if len(frame)]
+        data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=headers)
+        time_column = headers[0]
+        data[time_column] = pd.to_numeric(data[time_column], errors="coerce")
+        if start_time is not None:
+            data = data[data[time_column] >= start_time].reset_index(drop=True)
+        data["datetime"] = to_local_datetime(data[time_column])
+        return data
+
+    def load_file(self, path: str, headers: list[str], offset: int = 0) -> pd.DataFrame:
+        stat = os.stat(path)
+        identity = (stat.st_dev, stat.st_ino)
+        cached = self.cache.get(path)
+        if (
+            cached is None
+            or cached.identity != identity
+            or stat.st_size < cached.position
+            or offset < cached.start_offset
+        ):
+            cached = CachedFile(identity, offset, offset)
+            self.cache[path] = cached
+
+        if path.endswith(".gz"):
+            # sealed segments do not change, they are parsed once
+            if cached.position == 0:
+                cached.frames = [pd.read_csv(path)]
+                cached.position = stat.st_size
+            return cached.frame(headers)
+
+        if stat.st_size > cached.position:
+            with open(path, "rb") as f:
+                f.seek(cached.position)
+                chunk = f.read(stat.st_size - cached.position)
+            # only complete rows, the controller may be in the middle of one
+            complete = chunk[: chunk.rfind(b"\n") + 1]
+            if complete:
+                if cached.position == 0:
+                    new_rows = pd.read_csv(io.BytesIO(complete))
+                else:
+                    new_rows = pd.read_csv(io.BytesIO(complete), header=None, names=headers)
+                cached.frames.append(new_rows)
+                cached.position += len(complete)
+        return cached.frame(headers)
+
+    def forget_except(self, files: list[str], handler):
+        """
+        Drops the cached files of the handler's directory that are not part of its data anymore.
+        """
+        directory = os.path.dirname(handler.full_filename)
+        for path in list(self.cache):
+            if os.path.dirname(path) == directory and path not in files:
+                del self.cache[path]
+
+
+def align_sources(sources: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Puts the sources onto the union of their time axes, every row of every
+    source is kept. Rows of different sources at the same time are combined,
+    the columns of a source are NaN at the times of the other sources only.
+    Columns are named <source> <column>.
+    """
+    sources = {name: data for name, data in sources.items() if len(data)}
+    if not sources:
+        return pd.DataFrame(columns=["datetime"])
+
+    def prepared(name: str, data: pd.DataFrame) -> pd.DataFrame:
+        data = data.drop(columns=[data.columns[0]]).dropna(subset=["datetime"])
+        data = data.rename(columns={c: f"{name} {c}" for c in data.columns if c != "datetime"})
+        # several rows of a source at the same time are all kept
+        return data.assign(occurrence=data.groupby("datetime").cumcount())
+
+    aligned = pd.concat([prepared(name, data) for name, data in sources.items()], ignore_index=True)
+    aligned = aligned.groupby(["datetime", "occurrence"], sort=True).first().reset_index()
+    return aligned.drop(columns=["occurrence"])
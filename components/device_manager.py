@@ -1,17 +1,20 @@
 #!/usr/bin/env python3
 
+import asyncio
 import logging.config
+import time
 
 from components.chopperwheel import CWConnectionManager
 from components.electrometer import EMConnectionManager
 from components.flash_ui import FlashUI
 from components.combined_data_view import CombinedDataView
 from static.global_ui_props import *
-from nicegui import ui
+from nicegui import run, ui
 from components.stages.stages_connection_manager import StagesConnectionManager
 from components.lab_notes import LabNotes
 
 from util.connection_manager_base import ConnectionManagerBase
+from util.sampling_profiler import SamplingProfiler
 
 logger = logging.getLogger()
 
@@ -47,15 +50,47 @@ class DeviceManager:
             ]
 
         self.flash_ui_component = FlashUI(self.connection_managers_reduced)
+        self.stages_connection_manager.scan_planner.flash_action = (
+            self.flash_ui_component.one_flash_please
+        )
 
         self.combined_data_view = CombinedDataView(self.connection_managers_reduced)
 
+        self.profiler = SamplingProfiler("ORBITOS server")
+        self.profiling_started_at = 0.0
+
     def reset_connections(self):
         for m in self.connection_managers:
             m.kill_process()
             m.connection_menu_ui.refresh()  # pylint: disable=no-member
         logger.info("Connections reset")
 
+    def send_to_controllers(self, command: str):
+        for m in self.connection_managers:
+            if m.process is not None:
+                m.pipe.send(command)
+
+    def start_profiling(self):
+        """
+        Starts the sampling profiler in the server and in all running controller processes.
+        """
+        self.profiling_started_at = time.time()
+        self.profiler.start()
+        self.send_to_controllers("start_profiler")
+
+    async def stop_profiling(self, timeout: float = 15.0) -> list[str]:
+        """
+        Stops all profilers and waits until the controllers have replied with
+        their written profiles, returns the paths of the profiles.
+        """
+        controllers = [
+            m.stop_profiler(timeout) for m in self.connection_managers if m.process is not None
+        ]
+        server_profile, *profiles = await asyncio.gather(
+            run.io_bound(self.profiler.stop), *controllers
+        )
+        return [str(path) for path in [server_profile, *profiles] if path is not None]
+
     @ui.refreshable
     def chopper_wheel_ui(self):
         self.cw_connection_manager.create_ui()
@@ -133,4 +168,14 @@ class DeviceManager:
         self.combined_data_view.set_dark_mode(value)
 
 
-device_manager = DeviceManager()
+_device_manager: DeviceManager = None  # type: ignore
+
+
+def get_device_manager() -> DeviceManager:
+    """
+    Built on the first call instead of on import, main calls it on startup.
+    """
+    global _device_manager
+    if _device_manager is None:
+        _device_manager = DeviceManager()
+    return _device_manager
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Batch dosimetry of the film scans of an irradiation campaign.
+
+Scans are added by multi-file upload or from a folder on the server, uploads
+are spooled to a temporary folder so the workers only get paths. Every film
+is analysed in the process pool of the server (run.cpu_bound, one worker per
+core): decoding, finding the circle of interest unless one is given, and the
+dose extraction. At most one job per worker is in flight at a time. The
+results are shown in a summary table, selecting a film shows its heatmap and
+profile in the plots of the dose calibration page, and the summary and the
+profiles can be downloaded as combined CSV files.
+"""
+import asyncio
+import functools
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+from nicegui import events, run, ui
+from skimage import filters, measure
+from skimage import io as skimage_io
+
+from static.global_ui_props import *
+
+from .dose_extraction import CircleDose, extract_circle_dose, to_gray
+from .dose_lut import DoseLookupTable
+
+logger = logging.getLogger()
+
+SCAN_SUFFIXES = (".tif", ".tiff")
+DETECTION_SIZE = 1000  # px, longer side of the image the circle is detected on
+MAX_JOBS_IN_FLIGHT = os.cpu_count() or 1  # size of the process pool of the server
+
+
+@dataclass
+class FilmJob:
+    name: str
+    pars: np.ndarray  # of the film calibration
+    max_expected_dose: float
+    path: str  # scan on the server or spooled upload
+    center: tuple[float, float] | None = None  # detected if None
+    radius: float | None = None  # detected if None
+    roi_margin: float = 0.8  # detected radius is scaled by it to stay inside the spot
+    channel: int | None = None  # RGB channel of the dose, None for the weighted gray
+
+
+@dataclass
+class FilmResult:
+    name: str
+    center: tuple[float, float] | None = None
+    radius: float | None = None
+    dose: CircleDose | None = None
+    error: str | None = None
+
+    def summary_row(self) -> dict:
+        row = {"film": self.name, "error": self.error or ""}
+        if self.dose is not None:
+            row.update(
+                {
+                    "center x [px]": round(self.center[0], 1),  # type: ignore
+                    "center y [px]": round(self.center[1], 1),  # type: ignore
+                    "radius [px]": round(self.radius, 1),  # type: ignore
+                    "mean [Gy]": round(float(self.dose.mean), 4),
+                    "std [Gy]": round(float(self.dose.std), 4),
+                    "error [%]": round(float(self.dose.error_in_percent), 2),
+                }
+            )
+        return row
+
+
+@functools.cache
+def lookup_table(pars: tuple[float, ...]) -> DoseLookupTable:
+    # once per worker process and calibration
+    return DoseLookupTable(np.array(pars))
+
+
+def detect_circle(image: np.ndarray, margin: float = 0.8) -> tuple[tuple[float, float], float]:
+    """
+    Center and radius of the irradiated spot, the largest dark region not
+    touching the border of a downsampled grayscale of the scan.
+    """
+    step = max(1, max(image.shape[:2]) // DETECTION_SIZE)
+    gray = to_gray(image[::step, ::step])
+    regions = measure.regionprops(measure.label(gray < filters.threshold_otsu(gray)))
+    if not regions:
+        raise ValueError("no irradiated spot found")
+
+    def inside(region) -> bool:
+        min_row, min_col, max_row, max_col = region.bbox
+        return min_row > 0 and min_col > 0 and max_row < gray.shape[0] and max_col < gray.shape[1]
+
+    spot = max([r for r in regions if inside(r)] or regions, key=lambda r: r.area)
+    row, col = spot.centroid
+    radius = float(np.sqrt(spot.area / np.pi) * step * margin)
+    return (float(col * step), float(row * step)), radius
+
+
+def analyse_film(job: FilmJob) -> FilmResult:
+    """
+    Runs in a worker process.
+    """
+    try:
+        image = skimage_io.imread(job.path)
+        center, radius = job.center, job.radius
+        if center is None:
+            center, detected_radius = detect_circle(image, job.roi_margin)
+            radius = radius or detected_radius
+        elif radius is None:
+            raise ValueError("a given center needs a radius")
+        lut = lookup_table(tuple(job.pars))
+        dose = extract_circle_dose(
+            image, center, radius, lut.dose, job.max_expected_dose, channel=job.channel
+        )
+        return FilmResult(job.name, center, radius, dose)
+    except Exception as e:  # a broken scan must not stop the batch
+        return FilmResult(job.name, error=f"{type(e).__name__}: {e}")
+
+
+def spool(content, path: Path):
+    with open(path, "wb") as f:
+        shutil.copyfileobj(content, f)
+
+
+class BatchDosimetry:
+    def __init__(self, dose_calibration):
+        self.dose_calibration = dose_calibration
+        # film name -> path on the server or of the spooled upload
+        self.scans: dict[str, str] = {}
+        self.upload_dir: tempfile.TemporaryDirectory | None = None  # removed at exit
+        self.results: list[FilmResult] = []
+        self.use_drawn_circle: bool = False
+        self.folder: str = ""
+        self.running: bool = False
+        self.progress: str = ""
+
+    async def add_upload(self, e: events.UploadEventArguments):
+        if self.upload_dir is None:
+            self.upload_dir = tempfile.TemporaryDirectory(prefix="orbitos-films-")
+        path = Path(self.upload_dir.name) / Path(e.name).name
+        await run.io_bound(spool, e.content, path)
+        self.scans[e.name] = str(path)
+        self.queued_label.refresh()  # pylint: disable=no-member
+
+    def add_folder(self):
+        folder = Path(self.folder).expanduser()
+        if not folder.is_dir():
+            self.dose_calibration.log_and_notify(f"{folder} is not a folder")
+            return
+        paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in SCAN_SUFFIXES)
+        for path in paths:
+            self.scans[path.name] = str(path)
+        self.dose_calibration.log_and_notify(f"Added {len(paths)} scans from {folder}")
+        self.queued_label.refresh()  # pylint: disable=no-member
+
+    def clear(self):
+        if self.upload_dir is not None:
+            self.upload_dir.cleanup()
+            self.upload_dir = None
+        self.scans = {}
+        self.results = []
+        self.queued_label.refresh()  # pylint: disable=no-member
+        self.summary_table.refresh()  # pylint: disable=no-member
+
+    def create_jobs(self) -> list[FilmJob]:
+        dc = self.dose_calibration
+        center = radius = None
+        if self.use_drawn_circle and dc.selection_center is not None:
+            center, radius = dc.selection_center, dc.selection_radius
+        if dc.manual_circle_radius:
+            radius = dc.manual_circle_radius
+        jobs = []
+        for name, scan in self.scans.items():
+            jobs.append(
+                FilmJob(
+                    name=name,
+                    pars=dc.selected_film_calibration["pars"],
+                    max_expected_dose=dc.max_expected_dose,
+                    path=scan,
+                    center=center,
+                    radius=radius,
+                    channel=dc.channel,
+                )
+            )
+        return jobs
+
+    async def run_batch(self):
+        if self.running:
+            return
+        jobs = self.create_jobs()
+        if not jobs:
+            self.dose_calibration.log_and_notify("Add film scans first")
+            return
+        self.running = True
+        self.results = []
+        logger.info("Analysing %d film scans", len(jobs))
+        # the other jobs wait here, not in the queue of the pool
+        in_flight = asyncio.Semaphore(MAX_JOBS_IN_FLIGHT)
+
+        async def analyse(job: FilmJob) -> FilmResult | None:
+            async with in_flight:
+                return await run.cpu_bound(analyse_film, job)
+
+        try:
+            for done, finished in enumerate(asyncio.as_completed([analyse(job) for job in jobs]), 1):
+                result = await finished
+                if result is None:  # the server is shutting down
+                    return
+                if result.error:
+                    logger.warning("Film %s: %s", result.name, result.error)
+                self.results.append(result)
+                self.progress = f"{done} / {len(jobs)} films analysed"
+        finally:
+            self.running = False
+        self.results.sort(key=lambda result: result.name)
+        self.summary_table.refresh()  # pylint: disable=no-member
+
+    def show_film(self, e: events.TableSelectionEventArguments):
+        if not e.selection:
+            return
+        name = e.selection[0]["film"]
+        result = next((r for r in self.results if r.name == name), None)
+        if result is None or result.dose is None:
+            return
+        self.dose_calibration.create_heatmap_and_horizontal_profile(result.dose)
+        self.dose_calibration.calculate_dose_rate_stuff()
+
+    def summary_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([result.summary_row() for result in self.results])
+
+    def profiles_frame(self) -> pd.DataFrame:
+        frames = [
+            pd.DataFrame(
+                {
+                    "film": result.name,
+                    "x [mm]": result.dose.x_ticks_mm[: len(result.dose.profile)],
+                    "Dose [Gy]": result.dose.profile,
+                }
+            )
+            for result in self.results
+            if result.dose is not None
+        ]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def download_summary(self):
+        csv = self.summary_frame().to_csv(index=False).encode("utf-8")
+        ui.download(csv, "film_batch_summary.csv")
+
+    def download_profiles(self):
+        csv = self.profiles_frame().to_csv(index=False).encode("utf-8")
+        ui.download(csv, "film_batch_profiles.csv")
+
+    @ui.refreshable
+    def queued_label(self):
+        ui.label(f"{len(self.scans)} film scans queued")
+
+    @ui.refreshable
+    def summary_table(self):
+        rows = [result.summary_row() for result in self.results]
+        if not rows:
+            return
+        columns = [
+            {"name": key, "label": key, "field": key, "align": "left" if key == "film" else "right"}
+            for key in max(rows, key=len)
+        ]
+        ui.table(
+            columns=columns,
+            rows=rows,
+            row_key="film",
+            selection="single",
+            on_select=self.show_film,
+        ).props("dense flat").classes("w-full")
+        with ui.row():
+            ui.button("Summary CSV", icon="download", on_click=self.download_summary).props(
+                props_button
+            )
+            ui.button("Profiles CSV", icon="download", on_click=self.download_profiles).props(
+                props_button
+            )
+
+    def create_ui(self):
+        ui.upload(
+            label="Film scans",
+            auto_upload=True,
+            multiple=True,
+            on_upload=self.add_upload,
+        ).props("accept=.tif,.tiff").classes("w-full")
+        with ui.row(wrap=False).classes("w-full items-center"):
+            ui.input(label="Folder on the server").bind_value(self, "folder").classes(
+                "w-full"
+            ).props(props_input)
+            ui.button("Add folder", icon="folder_open", on_click=self.add_folder).props(
+                props_button
+            )
+        ui.switch("Use the drawn circle for every film (else detect it)").bind_value(
+            self, "use_drawn_circle"
+        )
+        with ui.row().classes("items-center"):
+            self.queued_label()
+            ui.button("Clear", icon="delete", on_click=self.clear).props(props_button)
+            ui.button("Analyse all", icon="calculate", on_click=self.run_batch).props(
+                props_button
+            ).bind_enabled_from(self, "running", backward=lambda running: not running)
+            ui.spinner().bind_visibility_from(self, "running")
+            ui.label().bind_text_from(self, "progress")
+        self.summary_table()
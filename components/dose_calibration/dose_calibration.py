@@ -1,17 +1,31 @@
 #!/usr/bin/env python3
 
+import functools
 import logging
+from collections import OrderedDict
 from pathlib import Path
 
 import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 import plotly.express as px  # type: ignore
 import plotly.graph_objects as go  # type: ignore
-from skimage import io
 from nicegui import events, ui, app
 from static.global_ui_props import *
 import asyncio
 
+from .batch_dosimetry import BatchDosimetry
+from .dose_extraction import CircleDose, extract_circle_dose
+from .dose_lut import CHANNELS, DoseLookupTable
+from .dose_map import DoseMapView
+from .image_pyramid import (
+    SHAPE_KEYS,
+    ImagePyramid,
+    pixel_coordinates,
+    tile_key,
+    zoomed_region,
+)
+from .scan_cache import scan_cache
+
 logger = logging.getLogger()
 work_dir = Path(__file__).parent
 
@@ -22,18 +36,49 @@ def float_if_present(value):
     return None
 
 
+def image_figure(image, scale: int, x0: int, y0: int) -> go.Figure:
+    """
+    Figure of a pyramid level, placed in full resolution pixel coordinates.
+    """
+    return px.imshow(
+        image,
+        x=pixel_coordinates(image.shape[1], scale, x0),
+        y=pixel_coordinates(image.shape[0], scale, y0),
+        binary_string=True,
+    )
+
+
 class DoseCalibration:
+    # browser tab -> instance, so reloading the page keeps the analysis and
+    # every tab has its own plots
+    sessions: OrderedDict[str, "DoseCalibration"] = OrderedDict()
+    max_sessions: int = 16
+
+    @classmethod
+    def for_session(cls, session_id: str) -> "DoseCalibration":
+        dc = cls.sessions.get(session_id)
+        if dc is None:
+            dc = cls.sessions[session_id] = cls()
+            while len(cls.sessions) > cls.max_sessions:
+                cls.sessions.popitem(last=False)
+        cls.sessions.move_to_end(session_id)
+        return dc
+
     def __init__(self):
 
         self.manual_circle_radius: float = None  # type: ignore
         self.max_expected_dose: float = 20
+        self.dose_channel: str = "weighted gray"  # key of CHANNELS
 
-        self.film_calibration_data = self.define_film_calibration_data()
+        self.film_calibration_data = define_film_calibration_data()
         self.selected_film_calibration = self.film_calibration_data[
             "EBT3_new_METAS_ImageJwRGB"
         ]
 
-        self.foil_image = io.imread(work_dir / "example_scan.tif")
+        self.scan_key, self.foil_image = scan_cache.decode_file(work_dir / "example_scan.tif")
+        # circles drawn in the scan view, kept when the view is zoomed or refreshed
+        self.drawn_shapes: list[dict] = []
+        self.shown_tile: tuple = ()  # tile_key of the image in the scan view
         self.create_plotly_image_view()
 
         self.selection_center: tuple[float, float] = (
@@ -62,36 +107,85 @@ class DoseCalibration:
         self.chopper_wheel_speed: float = 0.1
         self.number_of_rotations: int = 1
 
+        self.batch = BatchDosimetry(self)
+        self.dose_map_view = DoseMapView(self)
+
         self.calculate_dose_of_circle()
 
+    @property
+    def channel(self) -> int | None:
+        return CHANNELS[self.dose_channel]
+
+    @property
+    def pyramid(self) -> ImagePyramid:
+        return scan_cache.get(self.scan_key, "pyramid", lambda: ImagePyramid(self.foil_image))
+
     def create_plotly_image_view(self):
-        self.plotly_image_view = px.imshow(self.foil_image).update_layout(
-            go.Layout(
-                margin=dict(l=2, r=2, b=2, t=2, pad=2),
-                dragmode="drawcircle",
-                modebar=dict(add=["drawcircle", "eraseshape"]),
-                paper_bgcolor="rgba(0,0,0,0)",
-                plot_bgcolor="rgba(0,0,0,0)",
+        preview = self.pyramid.preview()
+
+        def create_figure():
+            return image_figure(*preview).update_layout(
+                go.Layout(
+                    margin=dict(l=2, r=2, b=2, t=2, pad=2),
+                    dragmode="drawcircle",
+                    modebar=dict(add=["drawcircle", "eraseshape"]),
+                    paper_bgcolor="rgba(0,0,0,0)",
+                    plot_bgcolor="rgba(0,0,0,0)",
+                )
             )
+
+        # the cached figure is shared, every session works on its own copy
+        self.plotly_image_view = go.Figure(
+            scan_cache.get(self.scan_key, "preview_figure", create_figure)
         )
+        self.drawn_shapes = []
+        self.shown_tile = tile_key(*preview)
 
     def upload_file(self, e: events.UploadEventArguments):
-        self.foil_image = io.imread(e.content)
-        # clear the plotly image view
-        self.plotly_image_view.data = []
+        self.scan_key, self.foil_image = scan_cache.decode(e.content.read())
         self.create_plotly_image_view()
         self.scan_image_plot.refresh()  # pylint: disable=no-member
+        self.dose_map_view.clear()
 
     def erase_drawed_shapes(self):
         self.plotly_image_view.data = [self.plotly_image_view.data[0]]
+        self.plotly_image_view.layout.shapes = ()
+        self.drawn_shapes = []
         self.selection_center = None
         self.scan_image_plot.refresh()  # pylint: disable=no-member
 
+    def on_relayout(self, e: events.GenericEventArguments):
+        self.on_lasso_draw(e)
+        self.on_zoom(e)
+
+    def on_zoom(self, e: events.GenericEventArguments):
+        """
+        Shows the visible region of the finest pyramid level that fits the view,
+        or the preview again when the zoom is reset.
+        """
+        zoomed = zoomed_region(self.pyramid, e.args)
+        if zoomed is None:
+            return
+        (image, scale, x0, y0), layout = zoomed
+        self.plotly_image_view.update_layout(**layout)
+        if tile_key(image, scale, x0, y0) == self.shown_tile:
+            return
+        self.shown_tile = tile_key(image, scale, x0, y0)
+        self.plotly_image_view.data = []
+        self.plotly_image_view.add_trace(image_figure(image, scale, x0, y0).data[0])
+        self.ui_image_view.update()
+
     def on_lasso_draw(self, e: events.GenericEventArguments):
         keys = e.args.keys()
         if "shapes" in keys:
             last_shape = e.args["shapes"][-1]
             if "type" in last_shape and last_shape["type"] == "circle":
+                # the axes are in full resolution pixels on every pyramid level
+                self.drawn_shapes = [
+                    {key: shape[key] for key in SHAPE_KEYS if key in shape}
+                    for shape in e.args["shapes"]
+                ]
+                self.plotly_image_view.update_layout(shapes=self.drawn_shapes)
                 p1 = last_shape["x0"], last_shape["y0"]
                 p2 = last_shape["x1"], last_shape["y1"]
                 self.selection_center = (p1[0] + p2[0]) / 2, (p1[1] + p2[1]) / 2
@@ -113,13 +207,15 @@ class DoseCalibration:
         if self.manual_circle_radius:
             self.selection_radius = self.manual_circle_radius
 
-        pixel_coords, pixel_values = self.mask_circle(
-            np.array(self.foil_image), self.selection_center, self.selection_radius
-        )
-        dose_values = self.inv_green_saunders(
-            pixel_values, *self.selected_film_calibration["pars"]
+        result = extract_circle_dose(
+            self.foil_image,
+            self.selection_center,
+            self.selection_radius,
+            self.selected_film_calibration["lut"].dose,
+            self.max_expected_dose,
+            channel=self.channel,
         )
-        self.create_heatmap_and_horizontal_profile(pixel_coords, dose_values)
+        self.create_heatmap_and_horizontal_profile(result)
 
         self.calculate_dose_rate_stuff()
 
@@ -143,7 +239,7 @@ class DoseCalibration:
     def scan_image_plot(self) -> ui.plotly:
         self.ui_image_view = (
             ui.plotly(self.plotly_image_view)
-            .on("plotly_relayout", self.on_lasso_draw)
+            .on("plotly_relayout", self.on_relayout)
             .classes("w-full")
         )
         self.ui_image_view._props["options"]["config"] = {"displaylogo": False}
@@ -217,6 +313,12 @@ class DoseCalibration:
                                     "manual_circle_radius",
                                     forward=float_if_present,
                                 ).classes("w-1/2").props(props_input)
+                                ui.select(
+                                    options=list(CHANNELS),
+                                    label="Dose channel",
+                                ).bind_value(self, "dose_channel").classes("w-1/2").props(
+                                    props_select
+                                ).tooltip("Weighted gray of the RGB channels or a single channel")
 
                             def select_film_calibration(
                                 e: events.ValueChangeEventArguments,
@@ -317,6 +419,24 @@ class DoseCalibration:
                                 backward=lambda x: f"Calculated dose rate: {x} Gy/s",
                             )
 
+                    with ui.card().classes("w-full mb-2"):
+                        with ui.expansion(
+                            text="Batch analysis",
+                            caption="Analyse the film scans of a whole campaign in parallel",
+                            icon="burst_mode",
+                            value=False,
+                        ).classes("w-full"):
+                            self.batch.create_ui()
+
+                    with ui.card().classes("w-full mb-2"):
+                        with ui.expansion(
+                            text="Full film dose map",
+                            caption="Dose of the whole film, line profiles, peak-to-valley ratios and ROI statistics",
+                            icon="grid_on",
+                            value=False,
+                        ).classes("w-full"):
+                            self.dose_map_view.create_ui()
+
                     with ui.card().classes("w-full mb-2"):
                         ui.button(
                             "Do It!",
@@ -340,39 +460,12 @@ class DoseCalibration:
             ) * self.number_of_rotations  # in seconds
         self.calculated_dose_rate = self.mean_dose / self.time_spent_in_slit_per_pixel
 
-    def create_heatmap_and_horizontal_profile(self, circle_coords, circle_pixels):
-        center_x, center_y = self.selection_center
-        radius = self.selection_radius
-
-        dpi = 400
-
-        # Find the minimum and maximum coordinates of the circle within the larger image
-        min_x, min_y = int(center_x - radius), int(center_y - radius)
-        max_x, max_y = int(center_x + radius), int(center_y + radius)
-
-        # Create a heatmap using the pixel values
-        heatmap = np.zeros((max_y - min_y + 1, max_x - min_x + 1))
-        for coords, value in zip(circle_coords, circle_pixels):
-            y, x = coords
-            if min_x < x < max_x and min_y < y < max_y:
-                if value < self.max_expected_dose:
-                    heatmap[y - min_y - 1, x - min_x - 1] = value
-                else:
-                    heatmap[y - min_y - 1, x - min_x - 1] = 0
-
-        # Convert pixel positions to mm positions
-        x_ticks_mm = np.linspace(
-            min_x / dpi * 25.4, max_x / dpi * 25.4, heatmap.shape[1]
-        )
-        y_ticks_mm = np.linspace(
-            min_y / dpi * 25.4, max_y / dpi * 25.4, heatmap.shape[0]
-        )
-
-        # Calculate mean and standard deviation of non-zero values in the heatmap
-        non_zero_values = heatmap[heatmap != 0]
-        self.mean_dose = np.mean(non_zero_values)
-        self.std_dose = np.std(non_zero_values)
-        error_in_percent = self.std_dose / self.mean_dose * 100
+    def create_heatmap_and_horizontal_profile(self, result: CircleDose):
+        heatmap = result.heatmap
+        x_ticks_mm, y_ticks_mm = result.x_ticks_mm, result.y_ticks_mm
+        self.mean_dose = result.mean
+        self.std_dose = result.std
+        error_in_percent = result.error_in_percent
 
         logger.info(
             f"Mean: {self.mean_dose:.5f} Gy, error: {self.std_dose:.5f}, error in percent: {error_in_percent:.3f}%"
@@ -399,9 +492,7 @@ class DoseCalibration:
         )
         self.dose_heatmap_plot.refresh()  # pylint: disable=no-member
 
-        profile_along_middle = heatmap[heatmap.shape[0] // 2, :]
-        # delete zero values
-        profile_along_middle = profile_along_middle[profile_along_middle != 0]
+        profile_along_middle = result.profile
 
         self.plotly_horizontal_profile = go.Figure(
             go.Scatter(
@@ -449,21 +540,6 @@ class DoseCalibration:
         self.dose_heatmap_plot.refresh()  # pylint: disable=no-member
         self.horizontal_profile_plot.refresh()  # pylint: disable=no-member
 
-    def mask_circle(self, image_np_rgb, center, radius):
-        center_x, center_y = center
-        image_gray = np.dot(image_np_rgb[..., :3], [0.2989, 0.5870, 0.1140])
-        # Create a grid of pixel coordinates
-        height, width = image_gray.shape
-        X, Y = np.meshgrid(np.arange(width), np.arange(height))
-        # Calculate squared distance from each pixel to the circle center
-        squared_distance = (X - center_x) ** 2 + (Y - center_y) ** 2
-        # Use the squared distance to create a mask for pixels within the circle
-        mask = squared_distance <= radius**2
-        # Use the mask to extract the pixels within the circle
-        circle_pixels = image_gray[mask]
-        circle_coords = np.column_stack((Y[mask], X[mask]))
-        return circle_coords, circle_pixels
-
     def log_and_notify(self, message: str):
         logger.info(message)
         ui.notify(message)
@@ -473,42 +549,45 @@ class DoseCalibration:
             dose == 0, 1e20, PVmin + (PVmax - PVmin) / (1 + (Do / dose) ** beta)
         )
 
-    def inv_green_saunders(self, pixel_value, Do, PVmin, PVmax, beta):
-        val = Do * ((pixel_value - PVmin) / (PVmax - pixel_value)) ** (1 / beta)
-        return np.nan_to_num(val)
-
-    def define_film_calibration_data(self):
-        return {
-            "EBT3_old_Bologna": {
-                "pars": np.array([4.7956, 45.5929, 159.0524, -0.9054]),
-                "calib_str": "\tOld EBT-3\n\tExp. 02.03.2023\n\tLot 030220102\n\tCalibration at Bologna with GammaCell\n\tdd.mm.2023",
-            },
-            "EBT3_new_Linac_ImageJ": {
-                "pars": np.array([5.62, 16.82, 159.27, -0.86]),
-                "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tCalibration at Inselspital with Clinical Linac (ImageJ non-weighted Pixel Values)\n\t25.09.2023",
-            },
-            "EBT3_new_Linac_Py": {
-                "pars": np.array([4.99, 11.73, 168.79, -0.88]),
-                "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tCalibration at Inselspital with Clinical Linac (Python weighted Pixel Values)\n\t25.09.2023",
-            },
-            "EBT3_new_METAS_ImageJwRGB": {
-                "pars": np.array([5.19, 8.40, 167.13, -0.87]),
-                "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tCalibration at METAS with 60-Co source (ImageJ weighted Pixel Values)\n\t07.11.2023",
-            },
-            "EBT3_old_METAS_ImageJwRGB": {
-                "pars": np.array([5.22, 16.46, 155.37, -0.87]),
-                "calib_str": "\tOld EBT-3\n\tExp. 02.03.2023\n\tLot 030220102\n\tCalibration at METAS with 60-Co source (ImageJ weighted Pixel Values)\n\t07.11.2023",
-            },
-            "EBT3_new_combinedLiMet_ImageJwRGB": {
-                "pars": np.array([5.09, 10.13, 167.96, -0.88]),
-                "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tFitted to METAS and Linac data combined (ImageJ weighted Pixel Values)\n\t15.11.2023",
-            },
-            "HDV2": {
-                "pars": np.array([144.58, 47.81, 211.03, -0.85]),
-                "calib_str": "\tNew HD-V2\n\tExp. __\n\tLot ___\n\tCalibration at ISOF Bologna with GammaCell (ImageJ weighted Pixel Values)\n\t19.12.2023",
-            },
-            "EBT3_hzdrE3_3FN_24h": {
-                "pars": np.array([1.74, 4.10, 168.40, -0.83]),
-                "calib_str": '\tEBT3\n\tExp. 02.10.2024\n\tLot 10032202\n Calibration at HZDR 8 MeV protons 24h scanning time \n\t08.02.2025',
-            },
-        }
+@functools.cache
+def define_film_calibration_data():
+    """
+    Film calibrations by name, built once per process with their dose lookup table.
+    """
+    data = {
+        "EBT3_old_Bologna": {
+            "pars": np.array([4.7956, 45.5929, 159.0524, -0.9054]),
+            "calib_str": "\tOld EBT-3\n\tExp. 02.03.2023\n\tLot 030220102\n\tCalibration at Bologna with GammaCell\n\tdd.mm.2023",
+        },
+        "EBT3_new_Linac_ImageJ": {
+            "pars": np.array([5.62, 16.82, 159.27, -0.86]),
+            "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tCalibration at Inselspital with Clinical Linac (ImageJ non-weighted Pixel Values)\n\t25.09.2023",
+        },
+        "EBT3_new_Linac_Py": {
+            "pars": np.array([4.99, 11.73, 168.79, -0.88]),
+            "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tCalibration at Inselspital with Clinical Linac (Python weighted Pixel Values)\n\t25.09.2023",
+        },
+        "EBT3_new_METAS_ImageJwRGB": {
+            "pars": np.array([5.19, 8.40, 167.13, -0.87]),
+            "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tCalibration at METAS with 60-Co source (ImageJ weighted Pixel Values)\n\t07.11.2023",
+        },
+        "EBT3_old_METAS_ImageJwRGB": {
+            "pars": np.array([5.22, 16.46, 155.37, -0.87]),
+            "calib_str": "\tOld EBT-3\n\tExp. 02.03.2023\n\tLot 030220102\n\tCalibration at METAS with 60-Co source (ImageJ weighted Pixel Values)\n\t07.11.2023",
+        },
+        "EBT3_new_combinedLiMet_ImageJwRGB": {
+            "pars": np.array([5.09, 10.13, 167.96, -0.88]),
+            "calib_str": "\tNew EBT-3\n\tExp. 02.10.2024\n\tLot 10032202\n\tFitted to METAS and Linac data combined (ImageJ weighted Pixel Values)\n\t15.11.2023",
+        },
+        "HDV2": {
+            "pars": np.array([144.58, 47.81, 211.03, -0.85]),
+            "calib_str": "\tNew HD-V2\n\tExp. __\n\tLot ___\n\tCalibration at ISOF Bologna with GammaCell (ImageJ weighted Pixel Values)\n\t19.12.2023",
+        },
+        "EBT3_hzdrE3_3FN_24h": {
+            "pars": np.array([1.74, 4.10, 168.40, -0.83]),
+            "calib_str": '\tEBT3\n\tExp. 02.10.2024\n\tLot 10032202\n Calibration at HZDR 8 MeV protons 24h scanning time \n\t08.02.2025',
+        },
+    }
+    for entry in data.values():
+        entry["lut"] = DoseLookupTable(entry["pars"])
+    return data
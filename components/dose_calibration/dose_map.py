@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Dose map of the whole film, e.g. for minibeam irradiations.
+
+The engine converts the scan to dose in tiles on a thread pool, the lookup
+table gather and the NaN masking release the GIL, so the tiles are converted
+in parallel without copying the scan to other processes. The map is cached
+per scan, calibration, dose channel and max expected dose. Line profiles,
+peak-to-valley ratios and ROI statistics are taken from the cached map, not
+recomputed from the pixels. Doses at or above the max expected dose are outside the
+calibrated range and NaN in the map. Like the scan view, the plot shows a
+preview of the map and the visible region in full resolution when zoomed in.
+"""
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
+import numpy as np  # type: ignore
+import plotly.graph_objects as go  # type: ignore
+from nicegui import events, run, ui
+from scipy import signal  # type: ignore
+from skimage import measure
+
+from static.global_ui_props import *
+
+from .dose_extraction import MM_PER_INCH
+from .dose_lut import DoseLookupTable
+from .image_pyramid import SHAPE_KEYS, ImagePyramid, pixel_coordinates, tile_key, zoomed_region
+from .scan_cache import scan_cache
+
+logger = logging.getLogger()
+
+
+class DoseMap:
+    def __init__(self, dose: np.ndarray, dpi: int = 400):
+        self.dose = dose  # Gy per full resolution pixel
+        self.dpi = dpi
+        # for the plot, smaller than the scan view because the dose is sent as floats
+        self.pyramid = ImagePyramid(dose, preview_size=512, tile_size=512)
+
+    @property
+    def nbytes(self) -> int:
+        return self.dose.nbytes + self.pyramid.nbytes
+
+    def to_mm(self, pixels):
+        return np.asarray(pixels) / self.dpi * MM_PER_INCH
+
+    def line_profile(
+        self, start: tuple[float, float], end: tuple[float, float], width: int = 1
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Distance along the line in mm and dose, interpolated at every pixel
+        step from start to end (x, y in pixels) and averaged over width pixels.
+        """
+        dose = measure.profile_line(
+            self.dose,
+            (start[1], start[0]),
+            (end[1], end[0]),
+            linewidth=width,
+            order=1,
+            mode="constant",
+            cval=np.nan,
+        )
+        length = math.hypot(end[0] - start[0], end[1] - start[1])
+        return self.to_mm(np.linspace(0, length, len(dose))), dose
+
+    def roi_stats(
+        self, x_range: tuple[float, float], y_range: tuple[float, float], ellipse: bool = False
+    ) -> dict:
+        """
+        Statistics of the calibrated pixels within the rectangle, or the
+        ellipse inscribed in it, given in pixels.
+        """
+        x_min, x_max = sorted(x_range)
+        y_min, y_max = sorted(y_range)
+        height, width = self.dose.shape
+        x0, x1 = max(math.ceil(x_min), 0), min(math.floor(x_max) + 1, width)
+        y0, y1 = max(math.ceil(y_min), 0), min(math.floor(y_max) + 1, height)
+        values = self.dose[y0:y1, x0:x1]
+        if ellipse and values.size:
+            xs = (np.arange(x0, x1) - (x_min + x_max) / 2) / max((x_max - x_min) / 2, 1e-9)
+            ys = (np.arange(y0, y1) - (y_min + y_max) / 2) / max((y_max - y_min) / 2, 1e-9)
+            values = values[xs[np.newaxis, :] ** 2 + ys[:, np.newaxis] ** 2 <= 1]
+        values = values[np.isfinite(values)]
+        if not values.size:
+            raise ValueError("no calibrated pixels in the region")
+        values = values.astype(np.float64)
+        return {
+            "mean": values.mean(),
+            "std": values.std(),
+            "min": values.min(),
+            "max": values.max(),
+            "pixels": values.size,
+        }
+
+    def peak_to_valley(self, distance_mm: np.ndarray, dose: np.ndarray, min_spacing: float = 0.2) -> dict:
+        """
+        Peak and valley doses of a profile across beamlets and their ratio (PVDR).
+        Peaks are at least min_spacing mm apart, only the valleys between the
+        outermost peaks count.
+        """
+        finite = np.isfinite(dose)
+        if finite.sum() < 3:
+            raise ValueError("the profile has no calibrated pixels")
+        profile = np.where(finite, dose, np.nanmin(dose))
+        step = distance_mm[1] - distance_mm[0] if len(distance_mm) > 1 else 1
+        distance = max(int(min_spacing / step), 1)
+        prominence = 0.1 * (profile.max() - profile.min())
+        peaks, _ = signal.find_peaks(profile, distance=distance, prominence=prominence)
+        valleys, _ = signal.find_peaks(-profile, distance=distance, prominence=prominence)
+        if len(peaks) >= 2:
+            valleys = valleys[(valleys > peaks[0]) & (valleys < peaks[-1])]
+        if not len(peaks) or not len(valleys):
+            raise ValueError("no peaks and valleys found in the profile")
+        peak, valley = profile[peaks].mean(), profile[valleys].mean()
+        return {
+            "peak": peak,
+            "valley": valley,
+            "pvdr": peak / valley if valley else math.inf,
+            "peaks": distance_mm[peaks],
+            "valleys": distance_mm[valleys],
+        }
+
+
+class DoseMapEngine:
+    def __init__(self, tile_size: int = 512, max_workers: int | None = None):
+        self.tile_size = tile_size  # px
+        self.executor = ThreadPoolExecutor(
+            max_workers or os.cpu_count(), thread_name_prefix="dose_map"
+        )
+
+    def compute(
+        self,
+        image: np.ndarray,
+        lut: DoseLookupTable,
+        max_expected_dose: float,
+        progress: Callable[[int, int], None] | None = None,
+        channel: int | None = None,
+    ) -> np.ndarray:
+        size = self.tile_size
+        height, width = image.shape[:2]
+        dose = np.empty((height, width), np.float32)
+        lut.channel_dose(image[:1, :1], channel)  # builds the table once, not in every thread
+
+        def convert(y: int, x: int):
+            values = lut.channel_dose(image[y : y + size, x : x + size], channel)
+            dose[y : y + size, x : x + size] = np.where(values < max_expected_dose, values, np.nan)
+
+        futures = [
+            self.executor.submit(convert, y, x)
+            for y in range(0, height, size)
+            for x in range(0, width, size)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if progress is not None:
+                progress(done, len(futures))
+        return dose
+
+    def dose_map(
+        self,
+        scan_key: str,
+        image: np.ndarray,
+        lut: DoseLookupTable,
+        max_expected_dose: float,
+        progress: Callable[[int, int], None] | None = None,
+        channel: int | None = None,
+    ) -> DoseMap:
+        name = f"dose_map {tuple(lut.pars)} {max_expected_dose} {channel}"
+        return scan_cache.get(
+            scan_key,
+            name,
+            lambda: DoseMap(self.compute(image, lut, max_expected_dose, progress, channel)),
+        )
+
+
+dose_map_engine = DoseMapEngine()
+
+
+def heatmap(image: np.ndarray, scale: int, x0: int, y0: int) -> go.Heatmap:
+    """
+    Heatmap of a pyramid level of the map, placed in full resolution pixel coordinates.
+    The dose is rounded to mGy to keep the JSON sent to the browser short.
+    """
+    return go.Heatmap(
+        z=np.round(image, 3).astype(np.float32),
+        x=pixel_coordinates(image.shape[1], scale, x0),
+        y=pixel_coordinates(image.shape[0], scale, y0),
+        colorscale="viridis",
+        colorbar=dict(title="Dose (Gy)"),
+    )
+
+
+class DoseMapView:
+    def __init__(self, dose_calibration):
+        self.dose_calibration = dose_calibration
+        self.dose_map: DoseMap | None = None
+        self.shown_tile: tuple = ()  # tile_key of the image in the plot
+        self.running: bool = False
+        self.progress: str = ""
+        self.profile_width: int = 1  # px
+        self.min_peak_spacing: float = 0.2  # mm
+        self.result: str = ""
+
+        self.plotly_dose_map = go.Figure()
+        self.plotly_profile = go.Figure()
+        self.ui_dose_map: ui.plotly = None  # type: ignore
+
+    def clear(self):
+        """
+        Drops the map and its results, e.g. when another scan was loaded.
+        """
+        self.dose_map = None
+        self.plotly_profile = go.Figure()
+        self.result = ""
+        self.dose_map_plot.refresh()  # pylint: disable=no-member
+        self.profile_plot.refresh()  # pylint: disable=no-member
+
+    async def compute(self):
+        if self.running:
+            return
+        dc = self.dose_calibration
+        self.running = True
+
+        def progress(done: int, total: int):
+            self.progress = f"{done} / {total} tiles"
+
+        scan_key = dc.scan_key
+        try:
+            dose_map = await run.io_bound(
+                dose_map_engine.dose_map,
+                scan_key,
+                dc.foil_image,
+                dc.selected_film_calibration["lut"],
+                dc.max_expected_dose,
+                progress,
+                dc.channel,
+            )
+        finally:
+            self.running = False
+        self.progress = ""
+        if dose_map is None or scan_key != dc.scan_key:
+            return  # the server is stopping or another scan was loaded meanwhile
+        self.dose_map = dose_map
+        self.create_dose_map_figure()
+        self.dose_map_plot.refresh()  # pylint: disable=no-member
+
+    def create_dose_map_figure(self):
+        preview = self.dose_map.pyramid.preview()  # type: ignore
+        self.shown_tile = tile_key(*preview)
+        self.plotly_dose_map = (
+            go.Figure(heatmap(*preview))
+            .update_yaxes(autorange="reversed", scaleanchor="x")
+            .update_layout(
+                title="Dose map - draw a line for a profile, a rectangle or circle for statistics",
+                dragmode="drawline",
+                modebar=dict(add=["drawline", "drawrect", "drawcircle", "eraseshape"]),
+                margin=dict(l=40, r=40, t=40, b=40),
+            )
+        )
+
+    def on_relayout(self, e: events.GenericEventArguments):
+        self.on_shape(e)
+        self.on_zoom(e)
+
+    def on_zoom(self, e: events.GenericEventArguments):
+        """
+        Shows the visible region of the map in the finest resolution that fits
+        the view, or the preview again when the zoom is reset.
+        """
+        if self.dose_map is None:
+            return
+        zoomed = zoomed_region(self.dose_map.pyramid, e.args)
+        if zoomed is None:
+            return
+        tile, layout = zoomed
+        self.plotly_dose_map.update_layout(**layout)
+        if tile_key(*tile) == self.shown_tile:
+            return
+        self.shown_tile = tile_key(*tile)
+        self.plotly_dose_map.data = []
+        self.plotly_dose_map.add_trace(heatmap(*tile))
+        self.ui_dose_map.update()
+
+    def on_shape(self, e: events.GenericEventArguments):
+        shapes = e.args.get("shapes")
+        if not shapes or self.dose_map is None:
+            return
+        # the axes are in full resolution pixels on every level of the map
+        self.plotly_dose_map.update_layout(
+            shapes=[{key: shape[key] for key in SHAPE_KEYS if key in shape} for shape in shapes]
+        )
+        shape = shapes[-1]
+        x_range, y_range = (shape["x0"], shape["x1"]), (shape["y0"], shape["y1"])
+        try:
+            if shape.get("type") == "line":
+                self.show_profile(x_range, y_range)
+            elif shape.get("type") in ("rect", "circle"):
+                stats = self.dose_map.roi_stats(x_range, y_range, ellipse=shape["type"] == "circle")
+                self.result = (
+                    f"ROI: {stats['mean']:.3f} ± {stats['std']:.3f} Gy, "
+                    f"min {stats['min']:.3f} Gy, max {stats['max']:.3f} Gy, {stats['pixels']} px"
+                )
+        except ValueError as error:
+            self.result = str(error)
+        logger.info(self.result)
+
+    def show_profile(self, x_range: tuple[float, float], y_range: tuple[float, float]):
+        start, end = (x_range[0], y_range[0]), (x_range[1], y_range[1])
+        distance, dose = self.dose_map.line_profile(start, end, self.profile_width)  # type: ignore
+        self.plotly_profile = go.Figure(go.Scatter(x=distance, y=dose, mode="lines")).update_layout(
+            title="Line Profile",
+            xaxis_title="Distance [mm]",
+            yaxis_title="Dose [Gy]",
+            margin=dict(l=40, r=40, t=40, b=40),
+        )
+        self.profile_plot.refresh()  # pylint: disable=no-member
+        pvdr = self.dose_map.peak_to_valley(distance, dose, self.min_peak_spacing)  # type: ignore
+        self.result = (
+            f"{len(pvdr['peaks'])} peaks, mean peak {pvdr['peak']:.3f} Gy, "
+            f"mean valley {pvdr['valley']:.3f} Gy, PVDR {pvdr['pvdr']:.2f}"
+        )
+
+    @ui.refreshable
+    def dose_map_plot(self):
+        if self.dose_map is None:
+            return
+        self.ui_dose_map = (
+            ui.plotly(self.plotly_dose_map)
+            .on("plotly_relayout", self.on_relayout)
+            .classes("w-full")
+        )
+
+    @ui.refreshable
+    def profile_plot(self):
+        if self.plotly_profile.data:
+            ui.plotly(self.plotly_profile).classes("w-full")
+
+    def create_ui(self):
+        with ui.row(wrap=False).classes("w-full items-center"):
+            ui.button("Compute dose map", icon="grid_on", on_click=self.compute).props(
+                props_button
+            ).bind_enabled_from(self, "running", backward=lambda running: not running)
+            ui.spinner().bind_visibility_from(self, "running")
+            ui.label().bind_text_from(self, "progress")
+        with ui.row(wrap=False).classes("w-full"):
+            ui.number(label="Profile width [px]", min=1, step=1, format="%d").bind_value(
+                self, "profile_width", forward=lambda x: int(x or 1)
+            ).classes("w-1/2").props(props_input)
+            ui.number(label="Min. peak spacing [mm]", min=0, step=0.05).bind_value(
+                self, "min_peak_spacing", forward=lambda x: float(x or 0)
+            ).classes("w-1/2").props(props_input)
+        self.dose_map_plot()
+        ui.label().bind_text_from(self, "result")
+        self.profile_plot()
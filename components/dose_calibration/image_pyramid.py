@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Multi-resolution pyramid of a film scan for the interactive scan view.
+
+Level 0 is the scan, every further level halves both sides by averaging 2x2
+blocks. The view gets the coarsest level that still fills the preview size,
+zooming in replaces it by the visible region of the finest level that stays
+within the tile size. Images are placed on the axes in full resolution pixel
+coordinates (x0/dx of the image trace), so circles drawn on any level are
+already in full resolution coordinates.
+"""
+import math
+
+import numpy as np  # type: ignore
+
+# of the shapes drawn on a view, kept in the figure when its image is replaced
+SHAPE_KEYS = ("type", "xref", "yref", "x0", "y0", "x1", "y1")
+
+
+class ImagePyramid:
+    def __init__(self, image: np.ndarray, preview_size: int = 1024, tile_size: int = 1024):
+        self.preview_size = preview_size  # px, longer side of the preview
+        self.tile_size = tile_size  # px, longer side of a zoomed tile
+        self.levels: list[np.ndarray] = [image]
+        while max(self.levels[-1].shape[:2]) > min(preview_size, tile_size):
+            self.levels.append(downsample(self.levels[-1]))
+
+    @property
+    def nbytes(self) -> int:
+        # level 0 is the scan itself, which is accounted for separately
+        return sum(level.nbytes for level in self.levels[1:])
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self.levels[0].shape
+
+    def level_for(self, width: float, height: float, size: int) -> int:
+        """
+        The finest level on which width x height full resolution pixels fit in size.
+        """
+        if max(width, height) <= size:
+            return 0
+        return min(math.ceil(math.log2(max(width, height) / size)), len(self.levels) - 1)
+
+    def preview(self) -> tuple[np.ndarray, int, int, int]:
+        """
+        Image, scale and full resolution origin (x, y) of the preview.
+        """
+        height, width = self.shape[:2]
+        level = self.level_for(width, height, self.preview_size)
+        return self.levels[level], 2**level, 0, 0
+
+    def tile(
+        self, x_range: tuple[float, float], y_range: tuple[float, float]
+    ) -> tuple[np.ndarray, int, int, int]:
+        """
+        Image, scale and full resolution origin (x, y) of the visible region
+        given in full resolution coordinates.
+        """
+        x_min, x_max = sorted(x_range)
+        y_min, y_max = sorted(y_range)
+        level = self.level_for(x_max - x_min, y_max - y_min, self.tile_size)
+        scale = 2**level
+        image = self.levels[level]
+        height, width = image.shape[:2]
+        # at least 2 x 2 pixels, the pixel spacing of the trace is taken from them
+        x0 = min(max(math.floor(x_min / scale), 0), max(width - 2, 0))
+        x1 = min(max(math.ceil(x_max / scale) + 1, x0 + 2), width)
+        y0 = min(max(math.floor(y_min / scale), 0), max(height - 2, 0))
+        y1 = min(max(math.ceil(y_max / scale) + 1, y0 + 2), height)
+        return image[y0:y1, x0:x1], scale, x0 * scale, y0 * scale
+
+
+def downsample(image: np.ndarray) -> np.ndarray:
+    """
+    Halves both sides by averaging 2x2 blocks, an odd last row or column is dropped.
+    """
+    height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    blocks = image[:height, :width].reshape(height // 2, 2, width // 2, 2, *image.shape[2:])
+    mean = blocks.mean(axis=(1, 3))
+    if np.issubdtype(image.dtype, np.integer):
+        return np.rint(mean).astype(image.dtype)
+    return mean.astype(image.dtype)
+
+
+def zoomed_region(pyramid: ImagePyramid, relayout: dict) -> tuple[tuple, dict] | None:
+    """
+    The (image, scale, x0, y0) to show after a plotly_relayout event and the
+    layout that keeps the zoom of the client, None if the event is no zoom.
+    """
+    if relayout.get("xaxis.autorange") or relayout.get("yaxis.autorange"):
+        return pyramid.preview(), dict(xaxis_autorange=True, yaxis_autorange="reversed")
+    if "xaxis.range[0]" in relayout and "yaxis.range[0]" in relayout:
+        x_range = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+        y_range = relayout["yaxis.range[0]"], relayout["yaxis.range[1]"]
+        # the client keeps the zoom when the figure is sent again
+        layout = dict(xaxis_range=list(x_range), yaxis_range=list(y_range))
+        return pyramid.tile(x_range, y_range), layout
+    return None
+
+
+def tile_key(image, scale: int, x0: int, y0: int) -> tuple:
+    return scale, x0, y0, image.shape
+
+
+def pixel_coordinates(length: int, scale: int, origin: int) -> np.ndarray:
+    """
+    Full resolution coordinates of the pixel centers of a level, the center
+    of a block of scale x scale pixels is in its middle.
+    """
+    return origin + np.arange(length) * scale + (scale - 1) / 2
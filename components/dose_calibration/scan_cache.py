@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+LRU cache of decoded film scans and of what is derived from them.
+
+Scans are keyed by the hash of their file content, so uploading the same film
+again or reloading the page reuses the decoded image, its pyramid, the
+preview figure and the dose maps. Entries are evicted least recently used
+first once the arrays held exceed max_bytes.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+import numpy as np  # type: ignore
+from skimage import io as skimage_io
+
+logger = logging.getLogger()
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ScanCache:
+    def __init__(self, max_bytes: int = 1024 * 2**20):
+        self.max_bytes = max_bytes
+        # scan key -> derived name -> value, most recently used last
+        self.entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self.sizes: dict[str, int] = {}
+        # path -> (size, mtime, key), so files are only hashed again when they change
+        self.file_keys: dict[str, tuple[int, float, str]] = {}
+        self.lock = threading.RLock()
+
+    def get(self, key: str, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        The value derived from the scan under name, created by factory on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and name in entry:
+                self.entries.move_to_end(key)
+                return entry[name]
+        value = factory()
+        with self.lock:
+            entry = self.entries.setdefault(key, {})
+            entry[name] = value
+            self.entries.move_to_end(key)
+            self.sizes[key] = self.sizes.get(key, 0) + getattr(value, "nbytes", 0)
+            self.evict()
+        return value
+
+    def evict(self):
+        while len(self.entries) > 1 and sum(self.sizes.values()) > self.max_bytes:
+            key, _ = self.entries.popitem(last=False)
+            self.sizes.pop(key, None)
+            logger.debug("Scan %s evicted from the cache", key)
+
+    def decode(self, data: bytes) -> tuple[str, np.ndarray]:
+        """
+        Key and decoded image of the content of a scan file.
+        """
+        key = content_key(data)
+        image = self.get(key, "image", lambda: skimage_io.imread(io.BytesIO(data)))
+        return key, image
+
+    def decode_file(self, path) -> tuple[str, np.ndarray]:
+        path = str(path)
+        stat = os.stat(path)
+        with self.lock:
+            known = self.file_keys.get(path)
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime):
+            key = known[2]
+            return key, self.get(key, "image", lambda: skimage_io.imread(path))
+        with open(path, "rb") as f:
+            key, image = self.decode(f.read())
+        with self.lock:
+            self.file_keys[path] = (stat.st_size, stat.st_mtime, key)
+        return key, image
+
+
+scan_cache = ScanCache()
@@ -8,6 +8,7 @@ from controllers import KeysightEM
 from nicegui import ui
 from util.connection_manager_base import ConnectionManagerBase
 from util.data_file_handler import DataFileHandler
+from util.device_discovery import device_discovery, list_visa_resources
 from util.settings_handler import SettingsHandler
 from static.global_ui_props import *
 
@@ -33,6 +34,23 @@ class EMConnectionManager(ConnectionManagerBase):
             self.pipe, self.data_file_handler, self.settings_handler, name
         )
         self.address = default_address
+        self.known_addresses = ["192.168.113.72", "192.168.113.73"]
+
+        device_discovery.register("visa", list_visa_resources, default=[])
+        device_discovery.subscribe(
+            "visa", self.connection_menu_ui.refresh  # pylint: disable=no-member
+        )
+
+    def address_options(self) -> list[str]:
+        options = list(self.known_addresses)
+        for resource in device_discovery.get("visa"):
+            # e.g. TCPIP0::192.168.113.72::5025::SOCKET
+            parts = resource.split("::")
+            if parts[0].startswith("TCPIP") and len(parts) > 1 and parts[1] not in options:
+                options.append(parts[1])
+        if self.address and self.address not in options:
+            options.append(self.address)
+        return options
 
     @ui.refreshable
     def connection_menu_ui(self):
@@ -40,7 +58,7 @@ class EMConnectionManager(ConnectionManagerBase):
             with ui.row().classes("w-full items-center no-wrap"):
                 ui.label("IC: ")
                 label = ui.select(
-                    options=["192.168.113.72", "192.168.113.73"],
+                    options=self.address_options(),
                     label="ip address",
                     value=self.address,
                 ).props(props_select)
@@ -14,6 +14,7 @@ import plotly.graph_objects as go  # type: ignore
 from nicegui import ui, app
 from util import ComponentBase
 from util.data_file_handler import DataFileHandler
+from util.instrumentation import instrumented
 from util.settings_handler import SettingsHandler
 from static.global_ui_props import *
 
@@ -71,6 +72,9 @@ class ICComponent(ComponentBase):
 
         self.disable_plot_update = False
 
+        # read new data as soon as the file watcher sees it, the timer is the fallback
+        self.file_handler.add_data_listener(self.receive_data)
+
         self.plot_plotly = go.Figure(
             go.Scattergl(
                 x=[0],
@@ -86,7 +90,9 @@ class ICComponent(ComponentBase):
 
     def show_current_data_in_new_window(self):
         fig = go.Figure()
-        copy_filename = self.file_handler.copy_current_data_to_new_temp_file()
+        # the download is cut at the time of the click
+        snapshot_time = time.time()
+        page_name = Path(self.file_handler.filename).stem + time.strftime("_%H-%M-%S")
         fig.add_trace(
             go.Scattergl(
                 x=self.time_list,
@@ -102,34 +108,39 @@ class ICComponent(ComponentBase):
             template="plotly_dark" if self.dark_mode else "seaborn",
         )
 
-        @ui.page("/em/{file_name}")
+        @ui.page(f"/em/{page_name}")
         def page():
             ui.plotly(fig).classes("w-full h-100")
             ui.button(
-                "Download CSV", on_click=lambda: ui.download(copy_filename)
+                "Download CSV",
+                on_click=lambda: self.file_handler.download_file(end=snapshot_time),
             ).props(props_button)
 
-        ui.navigate.to(f"/em/{os.path.basename(copy_filename)}", new_tab=True)
+        ui.navigate.to(f"/em/{page_name}", new_tab=True)
 
     def close_connection_to_keysight_em(self):
         self.pipe.send("exit")
 
     def read_data_from_file(self):
-        data = []
+        # the rows of a segment sealed since the last read, the lists are kept
+        data = self.file_handler.read_sealed_rows()
         times = []
         currents = []
-        
+
         # Open the file and seek to the last position
         with open(self.file_handler.full_filename, "r", newline="", encoding="utf-8") as f:
-            f.seek(self.file_handler.last_position_read)  # Go to the last read position
-            
-            # Use csv reader to process only new lines
-            reader = csv.reader(f)
-            if self.file_handler.last_position_read == 0:  # Skip header only when first time
-                next(reader)
+            start = self.file_handler.last_position_read
+            if start == 0:
                 # clear the data lists
                 self.time_list.clear()
                 self.current_list.clear()
+                start = self.window_start_offset()
+            f.seek(start)  # Go to the last read position
+
+            # Use csv reader to process only new lines
+            reader = csv.reader(f)
+            if start == 0:  # Skip header only when reading from the start
+                next(reader, None)
             
             # Append new lines from file
             new_data = list(reader)
@@ -151,6 +162,20 @@ class ICComponent(ComponentBase):
         self.current_list.extend(currents)
 
 
+    def window_start_offset(self) -> int:
+        """
+        With the x-axis range control only the displayed window is loaded, the
+        time index of the data file tells where it starts.
+        """
+        if not self.xaxis_range_control_enabled or self.xaxis_range_scale_factor is None:
+            return 0
+        latest = self.file_handler.latest_indexed_time()
+        if latest is None:
+            return 0
+        window = self.xaxis_range_scale_factor * self.xaxis_range_slider_value
+        return self.file_handler.offset_for_time(latest - window)
+
+    @instrumented("ICComponent.receive_data", budget="update_plot_interval")
     async def receive_data(self):
         if self.file_handler.new_data_or_new_file():
             await self.do_receive_data()
@@ -163,6 +188,7 @@ class ICComponent(ComponentBase):
 
         self.is_there_new_data = True        
 
+    @instrumented("ICComponent.update_plot", budget="update_plot_interval")
     async def update_plot(self):
         if self.is_there_new_data and not self.disable_plot_update:
             await self.do_update_plot()
@@ -537,6 +563,7 @@ class ICComponent(ComponentBase):
             self.file_handler.alternative_filename_ui()
             with ui.grid(columns=4).classes("w-full justify-items-stretch p-4"):
                 self.file_handler.download_file_button_ui()
+                self.file_handler.segments_button_ui()
                 self.file_handler.save_download_clear_button_ui()
                 ui.button(
                     "Show current data",
@@ -3,8 +3,10 @@ import asyncio
 import logging
 import logging.config
 from pathlib import Path
-from components import device_manager
+from components import get_device_manager
 from nicegui import app, run, ui
+from util.instrumentation import metrics
+from util.sampling_profiler import list_profiles
 from util.simple_auth import logout_buttons
 from static.global_ui_props import *
 import os
@@ -17,6 +19,7 @@ app.add_media_files("/audio", local_directory=media_directory)
 
 
 def create_layout(further_components=[]):
+    device_manager = get_device_manager()
 
     # apply css styles
     ui.add_head_html(
@@ -177,6 +180,53 @@ def create_layout(further_components=[]):
 
         ui.separator()
 
+        def toggle_diagnostics(e):
+            diagnostics_timer.active = e.value
+
+        with ui.expansion(
+            "Diagnostics", icon="speed", value=False, on_value_change=toggle_diagnostics
+        ).classes("w-full justify-items-center"):
+            ui.link("Prometheus metrics", "/metrics", new_tab=True)
+            diagnostics_timer = metrics.create_ui()
+            diagnostics_timer.active = False
+
+        ui.separator()
+
+        with ui.expansion("Profiler", icon="local_fire_department", value=False).classes(
+            "w-full justify-items-center"
+        ):
+            ui.label(
+                "Samples the server and all connected controllers, the profiles can be opened on speedscope.app"
+            ).classes("text-xs")
+
+            @ui.refreshable
+            def profile_downloads():
+                for profile in list_profiles(newer_than=device_manager.profiling_started_at - 1):
+                    ui.button(
+                        profile.name, icon="download", on_click=lambda p=profile: ui.download(p)
+                    ).props("flat dense no-caps")
+
+            async def toggle_profiler():
+                if device_manager.profiler.running:
+                    profiler_button.props("loading")
+                    await device_manager.stop_profiling()
+                    profiler_button.props(remove="loading")
+                    profile_downloads.refresh()
+                else:
+                    device_manager.start_profiling()
+                profiler_button.text = (
+                    "Stop profiler" if device_manager.profiler.running else "Start profiler"
+                )
+
+            profiler_button = ui.button(
+                "Stop profiler" if device_manager.profiler.running else "Start profiler",
+                icon="local_fire_department",
+                on_click=toggle_profiler,
+            ).props(props_button)
+            profile_downloads()
+
+        ui.separator()
+
         with ui.expansion("User", icon="manage_accounts").classes(
             "w-full justify-items-center"
         ):
@@ -1,3 +1,4 @@
 #!/usr/bin/env python3
 
+from .stage_proxy import StageProxy
 from .stages_component import StagesComponent
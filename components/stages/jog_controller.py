@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import logging
+import time
+from multiprocessing.connection import Connection
+
+from nicegui import ui
+
+logger = logging.getLogger()
+
+
+class AxisJogState:
+    def __init__(self):
+        self.target = 0.0  # mm/s, latest velocity requested by the joystick
+        self.sent = 0.0  # mm/s, last velocity sent to the controller
+        self.last_send_time = 0.0
+        self.in_flight: dict[int, float] = {}  # seq -> send time of unacknowledged commands
+
+
+class JogController:
+    """
+    Turns joystick events into jog commands for the stages controller. Events
+    only update the target velocity per axis; a timer sends at most one command
+    per axis and control period, and only if the target changed or the jog has
+    to be kept alive. The axes are stopped if no joystick event arrives within
+    the deadman timeout.
+    """
+
+    def __init__(
+        self,
+        pipe: Connection,
+        max_speed: float = 3.0,  # mm/s
+        control_period: float = 0.1,  # seconds
+        deadman_timeout: float = 2.0,  # seconds, a held joystick sends no events
+        keepalive_interval: float = 0.4,  # seconds, below the controller jog timeout
+        velocity_resolution: float = 0.05,  # mm/s
+        ack_timeout: float = 1.0,  # seconds
+    ):
+        self.pipe = pipe
+        self.max_speed = max_speed
+        self.control_period = control_period
+        self.deadman_timeout = deadman_timeout
+        self.keepalive_interval = keepalive_interval
+        self.velocity_resolution = velocity_resolution
+        self.ack_timeout = ack_timeout
+
+        self.axes = {"x": AxisJogState(), "y": AxisJogState()}
+        self.seq = 0
+        self.active = False
+        self.last_event_time = 0.0
+
+        self.events_received = 0
+        self.commands_sent = 0
+        self.latencies: list[float] = []  # seconds, of the last acknowledged commands
+        self.max_latencies = 100
+        self.stats_text = "No jog commands sent yet"
+
+        self.timer = ui.timer(self.control_period, self.tick, active=False)
+
+    def start(self):
+        self.active = True
+        self.last_event_time = time.monotonic()
+        self.timer.active = True
+
+    def set_target(self, x: float, y: float):
+        """
+        Called for every joystick event with the deflection in [-1, 1].
+        """
+        self.events_received += 1
+        self.last_event_time = time.monotonic()
+        self.axes["x"].target = self.quantize(x * self.max_speed)
+        self.axes["y"].target = self.quantize(y * self.max_speed)
+
+    def end(self):
+        self.active = False
+        for state in self.axes.values():
+            state.target = 0.0
+        self.tick()
+
+    def quantize(self, velocity: float) -> float:
+        return round(velocity / self.velocity_resolution) * self.velocity_resolution
+
+    def tick(self):
+        now = time.monotonic()
+        if self.active and now - self.last_event_time > self.deadman_timeout:
+            # the joystick is still held but silent, e.g. the browser lost the connection
+            for state in self.axes.values():
+                state.target = 0.0
+
+        for axis, state in self.axes.items():
+            # drop commands whose acknowledgement is lost
+            for seq, sent_time in list(state.in_flight.items()):
+                if now - sent_time > self.ack_timeout:
+                    del state.in_flight[seq]
+
+            changed = state.target != state.sent
+            keepalive = state.sent != 0 and now - state.last_send_time > self.keepalive_interval
+            # a stop is always sent, otherwise wait for the previous command
+            if (changed or keepalive) and (not state.in_flight or state.target == 0):
+                self.send(axis, state, state.target, now)
+
+        if not self.active and all(
+            state.sent == 0 and not state.in_flight for state in self.axes.values()
+        ):
+            self.timer.active = False
+
+    def send(self, axis: str, state: AxisJogState, velocity: float, now: float):
+        self.seq += 1
+        self.pipe.send(f"jog {axis} {velocity} {self.seq}")
+        state.in_flight[self.seq] = now
+        state.sent = velocity
+        state.last_send_time = now
+        self.commands_sent += 1
+
+    def on_ack(self, event: dict):
+        state = self.axes.get(event["axis"])
+        if state is None:
+            return
+        sent_time = state.in_flight.pop(event["seq"], None)
+        if sent_time is not None:
+            self.latencies.append(time.monotonic() - sent_time)
+            del self.latencies[: -self.max_latencies]
+            self.update_stats_text()
+        if event.get("error"):
+            logger.error("Jog of axis %s failed: %s", event["axis"], event["error"])
+
+    def update_stats_text(self):
+        mean = sum(self.latencies) / len(self.latencies) * 1e3
+        worst = max(self.latencies) * 1e3
+        self.stats_text = (
+            f"{self.commands_sent} commands for {self.events_received} events, "
+            f"latency mean {mean:.0f} ms, max {worst:.0f} ms"
+        )
+
+    def reset(self):
+        self.active = False
+        self.timer.active = False
+        for state in self.axes.values():
+            state.target = 0.0
+            state.sent = 0.0
+            state.in_flight.clear()
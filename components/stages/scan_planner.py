@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import re
+import time
+from typing import Awaitable, Callable
+
+import plotly.graph_objects as go  # type: ignore
+from nicegui import ui
+
+from components.stages.stage_proxy import StageProxy
+from static.global_ui_props import *
+
+logger = logging.getLogger()
+
+# well centres relative to well A1, columns run along x and rows along y
+PLATE_FORMATS = {
+    "96-well": {"rows": 8, "columns": 12, "pitch": 9.0},
+    "384-well": {"rows": 16, "columns": 24, "pitch": 4.5},
+}
+
+ScanPoint = tuple[str, float, float]  # label, x [mm], y [mm]
+
+
+def grid_positions(
+    origin_x: float,
+    origin_y: float,
+    columns: int,
+    rows: int,
+    pitch_x: float,
+    pitch_y: float,
+) -> list[ScanPoint]:
+    return [
+        (f"{row + 1},{column + 1}", origin_x + column * pitch_x, origin_y + row * pitch_y)
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+def well_label(row: int, column: int) -> str:
+    letters = ""
+    row += 1
+    while row > 0:
+        row, rest = divmod(row - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return f"{letters}{column + 1}"
+
+
+def parse_well_label(label: str) -> tuple[int, int]:
+    match = re.fullmatch(r"([A-Za-z]+)\s*(\d+)", label.strip())
+    if not match:
+        raise ValueError(f"'{label}' is not a well name like A1 or H12")
+    row = 0
+    for letter in match.group(1).upper():
+        row = row * 26 + ord(letter) - ord("A") + 1
+    return row - 1, int(match.group(2)) - 1
+
+
+def well_positions(
+    plate_format: str, wells: str, origin_x: float, origin_y: float
+) -> list[ScanPoint]:
+    """
+    Returns the positions of the given wells, e.g. "A1, A2, B1-B12", or of all
+    wells of the plate if wells is empty.
+    """
+    plate = PLATE_FORMATS[plate_format]
+    if wells.strip():
+        selected = []
+        for item in re.split(r"[,;\s]+", wells.strip()):
+            if not item:
+                continue
+            if "-" in item:
+                start, end = (parse_well_label(x) for x in item.split("-", 1))
+                for row in range(min(start[0], end[0]), max(start[0], end[0]) + 1):
+                    for column in range(
+                        min(start[1], end[1]), max(start[1], end[1]) + 1
+                    ):
+                        selected.append((row, column))
+            else:
+                selected.append(parse_well_label(item))
+    else:
+        selected = [
+            (row, column)
+            for row in range(plate["rows"])
+            for column in range(plate["columns"])
+        ]
+
+    points = []
+    for row, column in dict.fromkeys(selected):
+        if row >= plate["rows"] or column >= plate["columns"]:
+            raise ValueError(f"Well {well_label(row, column)} is not on a {plate_format} plate")
+        points.append(
+            (
+                well_label(row, column),
+                origin_x + column * plate["pitch"],
+                origin_y + row * plate["pitch"],
+            )
+        )
+    return points
+
+
+def travel_distance(a: tuple[float, float], b: tuple[float, float]) -> float:
+    # both axes move at the same time, so the longer axis determines the travel time
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+def serpentine_order(points: list[ScanPoint]) -> list[ScanPoint]:
+    rows: dict[float, list[ScanPoint]] = {}
+    for point in points:
+        rows.setdefault(round(point[2], 3), []).append(point)
+    ordered = []
+    for i, y in enumerate(sorted(rows)):
+        ordered.extend(sorted(rows[y], key=lambda p: p[1], reverse=i % 2 == 1))
+    return ordered
+
+
+def nearest_neighbour_order(
+    points: list[ScanPoint], start: tuple[float, float]
+) -> list[ScanPoint]:
+    remaining = list(points)
+    ordered = []
+    current = start
+    while remaining:
+        nearest = min(remaining, key=lambda p: travel_distance(current, (p[1], p[2])))
+        remaining.remove(nearest)
+        ordered.append(nearest)
+        current = (nearest[1], nearest[2])
+    return ordered
+
+
+def path_length(points: list[ScanPoint], start: tuple[float, float]) -> float:
+    length = 0.0
+    current = start
+    for _, x, y in points:
+        length += travel_distance(current, (x, y))
+        current = (x, y)
+    return length
+
+
+class ScanPlanner:
+    """
+    Plans and runs raster scans over a grid or a list of wells. Both axes are
+    moved together and every point waits for the position reached event of
+    the stages controller before the action at that point is run.
+    """
+
+    def __init__(
+        self,
+        move_xy: Callable[[float, float], Awaitable[dict]],
+        stage_x: StageProxy,
+        stage_y: StageProxy,
+    ):
+        self.move_xy = move_xy
+        self.stage_x = stage_x
+        self.stage_y = stage_y
+        # set by the device manager, creates one flash with the selected devices
+        self.flash_action: Callable[[], Awaitable] = None  # type: ignore
+
+        self.mode = "Well plate"
+        self.plate_format = "96-well"
+        self.wells = ""
+        self.origin_x = 0.0
+        self.origin_y = 0.0
+        self.columns = 12
+        self.rows = 8
+        self.pitch_x = 9.0
+        self.pitch_y = 9.0
+        self.order = "Serpentine"
+        self.action = "Dwell"
+        self.dwell_time = 1.0  # seconds, also the waiting time after a flash
+
+        self.planned_points: list[ScanPoint] = []
+        self.planned_length = 0.0
+        self.running = False
+        self.progress_text = "No scan planned"
+
+        self.path_plot = go.Figure().update_layout(
+            margin=dict(l=2, r=2, b=2, t=2, pad=2),
+            xaxis_title="x [mm]",
+            yaxis_title="y [mm]",
+            height=300,
+        )
+        self.path_plot_nicegui: ui.plotly = None  # type: ignore
+
+    def current_position(self) -> tuple[float, float]:
+        if self.stage_x.position is None or self.stage_y.position is None:
+            return (0.0, 0.0)
+        return (self.stage_x.position, self.stage_y.position)
+
+    def plan(self) -> list[ScanPoint]:
+        if self.mode == "Well plate":
+            points = well_positions(
+                self.plate_format, self.wells, self.origin_x, self.origin_y
+            )
+        else:
+            points = grid_positions(
+                self.origin_x,
+                self.origin_y,
+                int(self.columns),
+                int(self.rows),
+                self.pitch_x,
+                self.pitch_y,
+            )
+
+        start = self.current_position()
+        if self.order == "Serpentine":
+            self.planned_points = serpentine_order(points)
+        else:
+            self.planned_points = nearest_neighbour_order(points, start)
+        self.planned_length = path_length(self.planned_points, start)
+        self.progress_text = f"{len(self.planned_points)} points planned, {self.planned_length:.1f} mm of travel"
+        self.update_path_plot()
+        return self.planned_points
+
+    def plan_with_feedback(self):
+        try:
+            self.plan()
+        except (ValueError, TypeError) as e:
+            self.log_and_notify(f"Could not plan the scan: {e}")
+
+    def update_path_plot(self, done: int = 0):
+        xs = [p[1] for p in self.planned_points]
+        ys = [p[2] for p in self.planned_points]
+        labels = [p[0] for p in self.planned_points]
+        self.path_plot.data = []
+        self.path_plot.add_trace(
+            go.Scatter(x=xs, y=ys, text=labels, mode="lines+markers", name="planned")
+        )
+        self.path_plot.add_trace(
+            go.Scatter(x=xs[:done], y=ys[:done], mode="markers", name="done")
+        )
+        if self.path_plot_nicegui is not None:
+            self.path_plot_nicegui.update()
+
+    async def run_action(self):
+        if self.action == "Flash":
+            if self.flash_action is None:
+                raise RuntimeError("No flash action available")
+            await self.flash_action()
+        await asyncio.sleep(self.dwell_time)
+
+    async def run(self):
+        if self.running:
+            return
+        if not self.planned_points:
+            self.plan_with_feedback()
+        if not self.planned_points:
+            return
+
+        self.running = True
+        start_time = time.perf_counter()
+        total = len(self.planned_points)
+        logger.info("Starting scan over %s points", total)
+        try:
+            for i, (label, x, y) in enumerate(self.planned_points):
+                if not self.running:
+                    self.log_and_notify(f"Scan stopped after {i} of {total} points")
+                    return
+                self.progress_text = f"Moving to {label} ({i + 1}/{total})"
+                await self.move_xy(x, y)
+                self.progress_text = f"{self.action} at {label} ({i + 1}/{total})"
+                await self.run_action()
+                self.update_path_plot(done=i + 1)
+            self.log_and_notify(
+                f"Scan over {total} points finished in {time.perf_counter() - start_time:.1f} s"
+            )
+        except (RuntimeError, asyncio.TimeoutError) as e:
+            self.log_and_notify(f"Scan aborted: {e}")
+        finally:
+            self.running = False
+            self.progress_text = f"Last scan: {total} points, {time.perf_counter() - start_time:.1f} s"
+
+    def stop(self):
+        self.running = False
+
+    def create_ui(self):
+        with ui.grid(columns=2).classes("w-full gap-2 items-center"):
+            ui.select(
+                ["Well plate", "Grid"], label="Scan type", on_change=self.plan_with_feedback
+            ).bind_value(self, "mode").props(props_select)
+            ui.select(
+                ["Serpentine", "Nearest neighbour"],
+                label="Visiting order",
+                on_change=self.plan_with_feedback,
+            ).bind_value(self, "order").props(props_select)
+
+            ui.number(label="Origin x [mm]").bind_value(self, "origin_x").props(props_input)
+            ui.number(label="Origin y [mm]").bind_value(self, "origin_y").props(props_input)
+
+            ui.select(list(PLATE_FORMATS), label="Plate format").bind_value(
+                self, "plate_format"
+            ).bind_visibility_from(self, "mode", lambda x: x == "Well plate").props(props_select)
+            ui.input(label="Wells (empty for all), e.g. A1-A12, C3").bind_value(
+                self, "wells"
+            ).bind_visibility_from(self, "mode", lambda x: x == "Well plate").props(props_input)
+
+            for label, attribute in [
+                ("Columns", "columns"),
+                ("Rows", "rows"),
+                ("Pitch x [mm]", "pitch_x"),
+                ("Pitch y [mm]", "pitch_y"),
+            ]:
+                ui.number(label=label).bind_value(self, attribute).bind_visibility_from(
+                    self, "mode", lambda x: x == "Grid"
+                ).props(props_input)
+
+            ui.select(["Dwell", "Flash"], label="Action at each point").bind_value(
+                self, "action"
+            ).props(props_select).tooltip("Flash uses the devices selected on the Flash UI page")
+            ui.number(label="Dwell / wait after flash [s]", min=0).bind_value(
+                self, "dwell_time"
+            ).props(props_input)
+
+        with ui.row().classes("w-full items-center"):
+            ui.button("Plan", on_click=self.plan_with_feedback).props(props_button)
+            ui.button("Start scan", on_click=self.run, color="positive").props(
+                props_button
+            ).bind_enabled_from(self, "running", lambda x: not x)
+            ui.button("Stop scan", on_click=self.stop, color="warning").props(
+                props_button
+            ).bind_enabled_from(self, "running")
+            ui.label().bind_text_from(self, "progress_text")
+
+        self.path_plot_nicegui = ui.plotly(self.path_plot).classes("w-full")
+
+    def log_and_notify(self, message: str):
+        logger.info(message)
+        ui.notify(message)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import logging
+from multiprocessing.connection import Connection
+
+logger = logging.getLogger()
+
+
+class StageProxy:
+    """
+    UI side stand-in for an ArcusPerformaxDMXJSAStage running in the stages
+    controller process. Attributes are updated from the published status
+    snapshots, methods send commands through the pipe.
+    """
+
+    snapshot_keys = (
+        "connected",
+        "healthy",
+        "position",
+        "moving",
+        "axis_status",
+        "current_limit_errors",
+        "axis_speed",
+    )
+
+    def __init__(self, axis: str, pipe: Connection):
+        self.axis = axis
+        self.pipe = pipe
+        self.name = f"Stage {axis.upper()}"
+        self.reset()
+
+    def reset(self):
+        self.connected = False
+        self.healthy = False
+        self.position = None
+        self.moving = None
+        self.axis_status = None
+        self.current_limit_errors = None
+        self.axis_speed = None
+
+    def update(self, snapshot: dict):
+        for key in self.snapshot_keys:
+            setattr(self, key, snapshot.get(key))
+
+    def send(self, command: str, *args):
+        self.pipe.send(" ".join([command, self.axis, *map(str, args)]))
+
+    def move_by(self, dist_in_mm):
+        if dist_in_mm is None:
+            return
+        self.send("move_by", dist_in_mm)
+
+    def move_to(self, pos_in_mm):
+        if pos_in_mm is None:
+            return
+        self.send("move_to", pos_in_mm)
+
+    def set_zero(self):
+        self.send("set_zero")
@@ -6,15 +6,17 @@ from pathlib import Path
 import numpy as np  # type: ignore
 import plotly.express as px  # type: ignore
 import plotly.graph_objects as go  # type: ignore
-import asyncio
 from nicegui import events, ui, app
 from util import ComponentBase
 from datetime import datetime
 import csv
 
-from controllers.stage import ArcusPerformaxDMXJSAStage
+from components.stages.jog_controller import JogController
+from components.stages.scan_planner import ScanPlanner
+from components.stages.stage_proxy import StageProxy
 from util.settings_handler import SettingsHandler
 from util.data_file_handler import DataFileHandler
+from util.instrumentation import instrumented
 from static.global_ui_props import *
 
 logger = logging.getLogger()
@@ -26,19 +28,17 @@ class StagesComponent(ComponentBase):
         self,
         datafile_handler: DataFileHandler,
         settings_handler: SettingsHandler,
-        stage_x: ArcusPerformaxDMXJSAStage,
-        stage_y: ArcusPerformaxDMXJSAStage,
+        stage_x: StageProxy,
+        stage_y: StageProxy,
+        scan_planner: ScanPlanner,
+        jog_controller: JogController,
     ):
         super().__init__(None, datafile_handler, settings_handler)  # type: ignore
 
         self.stage_x = stage_x
         self.stage_y = stage_y
-
-        self.joy_x = 0.0
-        self.joy_y = 0.0
-        self.using_joystick = False
-        self.joystick_max_movement_speed = 3  # mm/s
-        self.move_task: asyncio.Task = None  # type: ignore
+        self.scan_planner = scan_planner
+        self.jog_controller = jog_controller
 
         self.HALF_STAGE_WIDTH = 150  # mm
 
@@ -63,9 +63,13 @@ class StagesComponent(ComponentBase):
         self.x_prev = None
         self.y_prev = None
 
-        # log position every 5 seconds
-        ui.timer(5, self.log_position)
+        # last logged position per log file, so the log file never has to be read again
+        self.last_logged_position: tuple[float, float] = None  # type: ignore
+        self.last_logged_filename: str = None  # type: ignore
+        # an emptied file is read again, so its first position is logged
+        self.file_handler.add_clear_listener(self.forget_last_logged_position)
 
+    @instrumented("StagesComponent.update_plot", budget=0.1)
     def update_plot(self):
         
         if self.stage_x.position is None or self.stage_y.position is None:
@@ -110,31 +114,21 @@ class StagesComponent(ComponentBase):
 
     def create_ui(self):
 
-        async def move_stages():
-            sleep_time = 0.5  # seconds
-            distance_at_max_speed = self.joystick_max_movement_speed * sleep_time
-            while self.using_joystick and self.fully_connected():
-                self.stage_x.move_by(-self.joy_x * distance_at_max_speed)
-                self.stage_y.move_by(-self.joy_y * distance_at_max_speed)
-                logger.info(
-                    f"Moving stages by x: {(self.joy_x * distance_at_max_speed):.2f}, y: {(self.joy_y * distance_at_max_speed):.2f}"
-                )
-                await asyncio.sleep(sleep_time)
-
         def on_start(e: events.JoystickEventArguments):
-            self.using_joystick = True
-            self.move_task = asyncio.create_task(move_stages())
+            if self.fully_connected():
+                self.jog_controller.start()
 
         def on_move(e: events.JoystickEventArguments):
+            if not self.jog_controller.active:
+                return
             if e.x is None or e.y is None:
-                self.joy_x = 0
-                self.joy_y = 0
+                self.jog_controller.set_target(0, 0)
             else:
-                self.joy_x = e.x
-                self.joy_y = e.y
+                # the stage moves the sample, so the axes are inverted
+                self.jog_controller.set_target(-e.x, -e.y)
 
         def on_end(e: events.JoystickEventArguments):
-            self.using_joystick = False
+            self.jog_controller.end()
 
         with ui.splitter(value=40).classes("w-full") as splitter:
             with splitter.before:
@@ -151,6 +145,10 @@ class StagesComponent(ComponentBase):
                         ui.label("Stage Y").classes("center justify-self-center")
                         self.stage_ui(self.stage_y, "y")
                 
+                    with ui.card().classes("w-full mb-2"):
+                        with ui.expansion("Raster / Grid Scan", icon="grid_on", value=False).classes("w-full justify-items-center"):
+                            self.scan_planner.create_ui()
+
                     with ui.card().classes("w-full mb-2"):
                         with ui.expansion("Position Log File Settings", icon="analytics", value=False).classes( "w-full justify-items-center"):
                             self.file_handler.alternative_filename_ui()
@@ -176,8 +174,11 @@ class StagesComponent(ComponentBase):
                         ui.query(f"#c{self.joystick.id} > div").style(
                             "background-color:unset;"
                         )
+                        ui.label().bind_text_from(
+                            self.jog_controller, "stats_text"
+                        ).classes("text-xs")
 
-    def stage_ui(self, stage: ArcusPerformaxDMXJSAStage, axis: str):
+    def stage_ui(self, stage: StageProxy, axis: str):
         with ui.grid(columns=2).classes("m-1 w-full justify-center"):
             ui.label('Axis status:')
             ui.label().bind_text_from(stage, "axis_status", backward=str)
@@ -252,25 +253,49 @@ class StagesComponent(ComponentBase):
         except AttributeError as e:
             pass
 
+    def on_status_update(self):
+        """
+        Called for every status snapshot of the stages controller. The position
+        is logged once a move has completed, i.e. when the stages stand still
+        at a position that has not been logged yet.
+        """
+        if self.stage_x.moving or self.stage_y.moving:
+            return
+        self.log_position()
+
+    def read_last_logged_position(self):
+        self.last_logged_filename = self.file_handler.full_filename
+        self.last_logged_position = None  # type: ignore
+        last_row = self.file_handler.read_last_row()
+        try:
+            _, x, y = last_row  # type: ignore
+            self.last_logged_position = (float(x), float(y))
+        except (TypeError, ValueError):
+            pass
+
+    def forget_last_logged_position(self):
+        self.last_logged_filename = None  # type: ignore
+
     def log_position(self):
-        if self.fully_connected():
-            filename = self.file_handler.full_filename
-            # check positions of last log
-            x = 0
-            y = 0
-            with open(filename, "r", newline="", encoding="utf-8") as f:
-                lines = f.readlines()
-                if len(lines) > 1:
-                    last_line = lines[-1]
-                    _, x, y = last_line.split(",")
-                    x = float(x)
-                    y = float(y)
-
-            # compare with current position
-            if x != self.stage_x.position or y != self.stage_y.position:
-                with open(filename, "a", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    writer.writerow([datetime.now(), self.stage_x.position, self.stage_y.position])
+        if not self.fully_connected():
+            return
+        if self.stage_x.position is None or self.stage_y.position is None:
+            return
+
+        if self.last_logged_filename != self.file_handler.full_filename:
+            self.read_last_logged_position()
+
+        position = (self.stage_x.position, self.stage_y.position)
+        if position == self.last_logged_position:
+            return
+
+        with self.file_handler.write_access() as writable:
+            if not writable:
+                return  # logged with the next snapshot after the file operation
+            with open(self.file_handler.full_filename, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow([datetime.now(), *position])
+        self.last_logged_position = position
 
     def main_page_ui(self):
         pass
@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 
+import asyncio
 import logging
+import time
 from pathlib import Path
 
+from components.stages.jog_controller import JogController
+from components.stages.scan_planner import ScanPlanner
+from components.stages.stage_proxy import StageProxy
 from components.stages.stages_component import StagesComponent
 from nicegui import ui
 from controllers.stage.arcus_performax_DMX_J_SA_stage import ArcusPerformaxDMXJSAStage
+from controllers.stage.stages_controller import StagesController
 from util.connection_manager_base import ConnectionManagerBase
 from util.connection_status_chip import ConnectionStatusChip
 from util.data_file_handler import DataFileHandler
+from util.device_discovery import device_discovery
+from util.instrumentation import instrumented, metrics
 from util.settings_handler import SettingsHandler
 
 from static.global_ui_props import props_select
@@ -21,6 +29,7 @@ class StagesConnectionManager(ConnectionManagerBase):
     def __init__(self, additional_path="stages", name="Stages"):
         super().__init__()
         self.name = name
+        self.target = StagesController
         self.settings_handler = SettingsHandler(
             "stages_settings.json", None, additional_path=additional_path
         )
@@ -31,18 +40,33 @@ class StagesConnectionManager(ConnectionManagerBase):
             headers=["time", "x", "y"],
         )
 
-        self.stage_x = ArcusPerformaxDMXJSAStage("Stage X")
-        self.stage_y = ArcusPerformaxDMXJSAStage("Stage Y")
+        # the stages live in the controller process, the UI only works on the snapshots
+        self.stage_x = StageProxy("x", self.pipe)
+        self.stage_y = StageProxy("y", self.pipe)
 
         self.healthy_x: ReactiveHealthIndicator = ReactiveHealthIndicator(False)
         self.healthy_y: ReactiveHealthIndicator = ReactiveHealthIndicator(False)
 
+        self.move_counter = 0
+        self.pending_moves: dict[int, asyncio.Future] = {}
+        self.xy_move_eta = 0.0  # seconds until a running xy move arrives
+
+        self.scan_planner = ScanPlanner(self.move_xy, self.stage_x, self.stage_y)
+        self.jog_controller = JogController(self.pipe)
+
         self.component: StagesComponent = StagesComponent(
-            self.data_file_handler, self.settings_handler, self.stage_x, self.stage_y
+            self.data_file_handler,
+            self.settings_handler,
+            self.stage_x,
+            self.stage_y,
+            self.scan_planner,
+            self.jog_controller,
         )
 
-        self.check_health_x_timer = ui.timer(1, self.check_health_x, active=False)
-        self.check_health_y_timer = ui.timer(1, self.check_health_y, active=False)
+        # reading the snapshots never blocks, so they can be picked up often
+        self.status_data_timer.interval = 0.1
+        self.snapshot_timeout = 3  # seconds
+        self.last_snapshot_time = 0.0
 
         self.port_x = None
         self.port_y = None
@@ -50,13 +74,35 @@ class StagesConnectionManager(ConnectionManagerBase):
         self.select_x = None
         self.select_y = None
 
+        # the DLL scan is slow, the menus only read the cached result
+        device_discovery.register(
+            "usb_performax",
+            ArcusPerformaxDMXJSAStage.list_usb_performax_devices,
+            default={},
+        )
+        device_discovery.subscribe(
+            "usb_performax",
+            self.connection_menu_ui.refresh,  # pylint: disable=no-member
+        )
+
+    def device_options(self, port) -> dict:
+        options = dict(device_discovery.get("usb_performax"))
+        # keep a selected device that was unplugged, the select would reject it otherwise
+        if port is not None and port not in options:
+            options[port] = f"{port} (not found)"
+        return options
+
     @ui.refreshable
     def connection_menu_ui(self):
-        ui.label("Stages Connections")
+        with ui.row().classes("w-full items-center no-wrap"):
+            ui.label("Stages Connections")
+            ui.button(
+                icon="refresh", on_click=device_discovery.invalidate
+            ).props("flat dense round").tooltip("Search for USB devices again")
         with ui.row().classes("w-full items-center no-wrap"):
             ui.label("X: ")
             self.select_x = ui.select(
-                options=self.stage_x.list_usb_performax_devices(),
+                options=self.device_options(self.port_x),
                 label="Select device",
                 value=self.port_x,
                 on_change=self.connect_x,
@@ -67,7 +113,7 @@ class StagesConnectionManager(ConnectionManagerBase):
         with ui.row().classes("w-full items-center no-wrap"):
             ui.label("Y: ")
             self.select_y = ui.select(
-                options=self.stage_x.list_usb_performax_devices(),
+                options=self.device_options(self.port_y),
                 label="Select device",
                 value=self.port_y,
                 on_change=self.connect_y,
@@ -92,29 +138,96 @@ class StagesConnectionManager(ConnectionManagerBase):
         self.connection_menu_ui()
         self.component.create_ui()
 
-    async def check_health_x(self):
-        self.healthy_x.value = self.stage_x.is_healthy()
-        self.chip_x.update()
-        self.health_check_indicator_x.refresh()  # pylint: disable=no-member
+    @instrumented(
+        "StagesConnectionManager.recv_status_data", budget="status_data_timer.interval"
+    )
+    async def recv_status_data(self):
+        # only keep the newest snapshot, older ones are outdated anyway
+        snapshot = None
+        depth = 0
+        while self.pipe.poll():
+            answer = self.pipe.recv()
+            depth += 1
+            if isinstance(answer, dict) and "status_data" in answer:
+                snapshot = answer
+            elif isinstance(answer, dict) and answer.get("event") == "position_reached":
+                self.on_position_reached(answer)
+            elif isinstance(answer, dict) and answer.get("event") == "jog_ack":
+                self.jog_controller.on_ack(answer)
+            elif isinstance(answer, dict) and answer.get("event") == "profile_written":
+                self.on_profile_written(answer)
+
+        metrics.set_pipe_depth(self.name, depth)
 
-    async def check_health_y(self):
-        self.healthy_y.value = self.stage_y.is_healthy()
-        self.chip_y.update()
-        self.health_check_indicator_y.refresh()  # pylint: disable=no-member
+        if snapshot is not None:
+            self.last_snapshot_time = time.monotonic()
+            self.status_data = snapshot["status_data"]
+            self.xy_move_eta = snapshot.get("xy_move_eta", 0.0)
+            self.stage_x.update(self.status_data["x"])
+            self.stage_y.update(self.status_data["y"])
+            self.component.on_status_update()
+        elif time.monotonic() - self.last_snapshot_time > self.snapshot_timeout:
+            self.stage_x.healthy = False
+            self.stage_y.healthy = False
+
+        self.update_health_indicator(self.healthy_x, self.stage_x.healthy, "x")
+        self.update_health_indicator(self.healthy_y, self.stage_y.healthy, "y")
+
+    async def move_xy(self, x: float, y: float, timeout: float = 120) -> dict:
+        """
+        Moves both axes concurrently, scaled so that they arrive together, and
+        waits until the controller reports that the target has been reached.
+        The result contains the final position and the predicted and actual
+        duration of the move.
+        """
+        self.move_counter += 1
+        move_id = self.move_counter
+        future = asyncio.get_running_loop().create_future()
+        self.pending_moves[move_id] = future
+        self.pipe.send(f"move_xy {move_id} {x} {y}")
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending_moves.pop(move_id, None)
+        if "error" in result:
+            raise RuntimeError(f"xy move failed: {result['error']}")
+        return result
+
+    def on_position_reached(self, event: dict):
+        future = self.pending_moves.get(event["move_id"])
+        if future is not None and not future.done():
+            future.set_result(event)
+
+    def update_health_indicator(self, indicator, value: bool, axis: str):
+        if indicator.value == bool(value):
+            return
+        indicator.value = bool(value)
+        if axis == "x":
+            self.chip_x.update()
+            self.health_check_indicator_x.refresh()  # pylint: disable=no-member
+        else:
+            self.chip_y.update()
+            self.health_check_indicator_y.refresh()  # pylint: disable=no-member
+
+    def connect_axis(self, axis: str, idx):
+        if self.process is None:
+            self.address = "arcus"
+            self.start_process()
+        self.pipe.send(f"connect {axis} {idx}")
 
     def connect_x(self, e):
-        idx = e.value
-        self.stage_x.connect(idx)
+        if e.value is None:
+            return
+        self.connect_axis("x", e.value)
         self.port_x = e.value
         logger.info("Selected port: %s", e.value)
         self.refresh_stuff()
-        self.check_health_x_timer.active = True
         ui.timer(0.01, lambda: self.wait_for_connection("x_stage", condition_func=lambda: self.healthy_x.value), once=True)
 
     def connect_y(self, e):
-        idx = e.value
-        self.stage_y.connect(idx)
-        self.check_health_y_timer.active = True
+        if e.value is None:
+            return
+        self.connect_axis("y", e.value)
         self.port_y = e.value
         logger.info("Selected port: %s", e.value)
         self.refresh_stuff()
@@ -125,20 +238,18 @@ class StagesConnectionManager(ConnectionManagerBase):
         self.main_page_ui.refresh()  # pylint: disable=no-member
         self.create_ui.refresh()  # pylint: disable=no-member
 
-    def start_process(self):
-        raise NotImplementedError
-
     def kill_process(self):
-        self.stage_x.close()
-        self.stage_y.close()
-        self.check_health_x_timer.active = False
-        self.check_health_y_timer.active = False
+        for future in self.pending_moves.values():
+            if not future.done():
+                future.set_exception(RuntimeError("stages controller stopped"))
+        self.jog_controller.reset()
+        self.stage_x.reset()
+        self.stage_y.reset()
         self.healthy_x.value = False
         self.healthy_y.value = False
         self.port_x = None
         self.port_y = None
-
-
+        super().kill_process()
 
     def set_dark_mode(self, value: bool):
         self.component.set_dark_mode(value)
@@ -8,10 +8,12 @@ import logging
 import os
 import time
 from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Lock
 from typing import Callable
 
 from pytrinamic.connections import ConnectionManager  # type: ignore
 from pytrinamic.modules import TMCM1021  # type: ignore
+from controllers.tmcl_bus_arbiter import MOTION, STATUS, TELEMETRY, TMCLBusArbiter
 from util.controller_base import ControllerBase
 from util.settings_handler import SettingsHandler
 
@@ -21,7 +23,11 @@ logger = logging.getLogger()
 class ChopperWheel(ControllerBase):
 
     def __init__(
-        self, address: str, pipe: Connection, settings_handler: SettingsHandler
+        self,
+        address: str,
+        pipe: Connection,
+        settings_handler: SettingsHandler,
+        write_lock: Lock | None = None,
     ) -> None:
         """
         Initializes a ChopperWheel instance.
@@ -29,7 +35,7 @@ class ChopperWheel(ControllerBase):
         Args:
             interface_args: The interface arguments for connecting to the device.
         """
-        super().__init__(address, pipe, settings_handler)
+        super().__init__(address, pipe, settings_handler, write_lock)
 
         self.timestamp: list[float] = []
         self.velocity_list: list[float] = []
@@ -50,6 +56,11 @@ class ChopperWheel(ControllerBase):
 
         self.direction_modifier = -1
 
+        # all TMCL transactions go through the arbiter, status queries are served
+        # from telemetry if it is younger than this
+        self.bus = TMCLBusArbiter()
+        self.telemetry_max_age = 1.0  # seconds
+
         try:
             self.connect()
             self.initialize_motor_settings()
@@ -101,28 +112,32 @@ class ChopperWheel(ControllerBase):
                     logger.info("Received command: find_home")
                     await self.exec_rotation_command(self.find_home)
                 case "get_settings":
-                    self.print_settings()
+                    await self.print_settings()
                 case "settings_changed":
-                    self.settings_changed()
+                    await self.settings_changed()
+                case "start_profiler":
+                    self.start_profiler()
+                case "stop_profiler":
+                    self.stop_profiler()
                 case "exit":
                     logger.info("exiting...")
                     break
                 case _:
                     logger.info("Unknown command")
 
-    def settings_changed(self):
+    async def settings_changed(self):
         self.settings_handler.read_settings()
         changed_settings = self.settings_handler.get_changed_settings()
         for setting, value in changed_settings.items():
             match setting:
                 case "max_velocity":
-                    self.set_max_velocity(value)
+                    await self.bus.transact(MOTION, self.set_max_velocity, value)
                     logger.info("Setting max_velocity to %s", value)
                 case "max_acceleration":
-                    self.set_acceleration(value)
+                    await self.bus.transact(MOTION, self.set_acceleration, value)
                     logger.info("Setting max_acceleration to %s", value)
                 case "max_current":
-                    self.motor.drive_settings.max_current = value
+                    await self.bus.transact(MOTION, self.set_max_current, value)
                     logger.info("Setting max_current to %s", value)
 
     async def exec_rotation_command(self, func: Callable):
@@ -141,9 +156,9 @@ class ChopperWheel(ControllerBase):
             await self.save_data_to_file()
             await asyncio.sleep(0.2)
 
-    def print_settings(self):
-        print(
-            {
+    async def print_settings(self):
+        def read_settings_from_device():
+            return {
                 "max_velocity": self.get_max_velocity(),
                 "max_acceleration": self.get_max_acceleration(),
                 "max_current": self.motor.drive_settings.max_current,
@@ -151,14 +166,21 @@ class ChopperWheel(ControllerBase):
                 "boost_current": self.motor.drive_settings.boost_current,
                 "filename": self.settings_handler.settings["filename"],
             }
-        )
+
+        print(await self.bus.transact(STATUS, read_settings_from_device))
 
     async def send_status_data(self):
         while True:
             self.pipe.send(
                 {
                     "status_data": {
-                        "are_we_home_yet": self.are_we_home_yet(),
+                        "are_we_home_yet": await self.bus.query(
+                            STATUS,
+                            "are_we_home_yet",
+                            self.are_we_home_yet,
+                            max_age=self.telemetry_max_age,
+                        ),
+                        "bus": self.bus.get_stats(),
                     },
                     "healthy": await self.health_check(),
                 }
@@ -166,31 +188,50 @@ class ChopperWheel(ControllerBase):
             await asyncio.sleep(self.send_status_data_timeout)
 
     async def save_data_to_file(self):
-        if not os.path.isfile(self.settings_handler.settings["filename"]):
-            logger.warning("File does not exist, data not saved")
-            return
-
-        with open(
-            self.settings_handler.settings["filename"],
-            "a",
-            newline="",
-            encoding="utf-8",
-        ) as f:
-            writer = csv.writer(f)
-            writer.writerows(
-                zip(self.timestamp, self.velocity_list, self.angular_position_list)
-            )
-
-        self.velocity_list.clear()
-        self.angular_position_list.clear()
-        self.timestamp.clear()
+        with self.data_file_access() as allowed:
+            if not allowed:
+                # the UI is working on the file, the rows are written with the next batch
+                return
+            if not os.path.isfile(self.settings_handler.settings["filename"]):
+                logger.warning("File does not exist, data not saved")
+                return
+
+            with open(
+                self.settings_handler.settings["filename"],
+                "a",
+                newline="",
+                encoding="utf-8",
+            ) as f:
+                offset = f.tell()
+                writer = csv.writer(f)
+                writer.writerows(
+                    zip(self.timestamp, self.velocity_list, self.angular_position_list)
+                )
+                end_offset = f.tell()
+
+            if self.timestamp:
+                self.rows_appended(
+                    self.settings_handler.settings["filename"],
+                    offset,
+                    end_offset,
+                    self.timestamp[0],
+                    self.timestamp[-1],
+                    len(self.timestamp),
+                )
+
+            self.velocity_list.clear()
+            self.angular_position_list.clear()
+            self.timestamp.clear()
 
     async def acquire_data(self):
         logger.info("Acquiring data during rotation task started")
         while True:
-            self.timestamp.append(time.time())
-            self.velocity_list.append(self.get_actual_velocity())
-            self.angular_position_list.append(self.get_angular_position())
+            timestamp = time.time()
+            velocity, angular_position = await self.bus.transact(TELEMETRY, self.read_telemetry)
+            self.bus.remember("angular_position", angular_position)
+            self.timestamp.append(timestamp)
+            self.velocity_list.append(velocity)
+            self.angular_position_list.append(angular_position)
             await asyncio.sleep(1e-6)
 
     def connect(self) -> None:
@@ -206,7 +247,13 @@ class ChopperWheel(ControllerBase):
 
     async def health_check(self) -> bool:
         try:
-            self.motor.actual_position
+            # a fresh telemetry sample proves the device is answering
+            await self.bus.query(
+                STATUS,
+                "angular_position",
+                self.get_angular_position,
+                max_age=self.telemetry_max_age,
+            )
             return True
         except Exception as e:
             logger.error("Error during health check: %s", e)
@@ -251,51 +298,60 @@ class ChopperWheel(ControllerBase):
         Performs a rotation demo.
         """
         logger.info("Rotating...")
-        self.motor.rotate(self.direction_modifier * self.motor.linear_ramp.max_velocity)
+        await self.bus.transact(
+            MOTION,
+            lambda: self.motor.rotate(
+                self.direction_modifier * self.motor.linear_ramp.max_velocity
+            ),
+        )
         await asyncio.sleep(2)
         logger.info("Stopping...")
-        self.motor.stop()
+        await self.bus.transact(MOTION, self.motor.stop)
         await asyncio.sleep(self.wait_time_after_rotation)
-        logger.info("Actual position: %s", self.motor.actual_position)
+        logger.info(
+            "Actual position: %s",
+            await self.bus.transact(STATUS, lambda: self.motor.actual_position),
+        )
 
     async def one_rotation(self) -> None:
         """
         Rotates the motor by one rotation.
         """
-        self.motor.move_by(-self.steps_per_rotation)
+        await self.bus.transact(MOTION, self.motor.move_by, -self.steps_per_rotation)
         await asyncio.sleep(self.wait_time_after_rotation)
 
     async def one_flash_please(self) -> None:
         """
         Creates flash beam.
         """
-        if not self.are_we_home_yet():
+        if not await self.home_check():
             logger.warning("Motor is not at home position, abort flash")
             return
 
-        self.rotate_by_angle(360 + self.free_rot_angle)
+        await self.bus.transact(MOTION, self.rotate_by_angle, 360 + self.free_rot_angle)
         await self.wait_for_rotation()
-        prev_accel = self.motor.linear_ramp.max_acceleration
-        self.set_acceleration(2)
-        self.rotate_by_angle(-self.free_rot_angle)
+        prev_accel = await self.bus.transact(
+            MOTION, lambda: self.motor.linear_ramp.max_acceleration
+        )
+        await self.bus.transact(MOTION, self.set_acceleration, 2)
+        await self.bus.transact(MOTION, self.rotate_by_angle, -self.free_rot_angle)
         await self.wait_for_rotation()
 
-        if not self.are_we_home_yet():
+        if not await self.home_check():
             logger.warning("Caution! Motor has not reached home position after flash!")
         else:
             logger.info("Flash beam created")
-            self.motor.stop()
-            self.motor.actual_position = 0
+            await self.bus.transact(MOTION, self.stop_and_zero)
 
         await asyncio.sleep(self.wait_time_after_rotation)
 
-        self.motor.linear_ramp.max_acceleration = prev_accel
+        await self.bus.transact(MOTION, self.set_raw_acceleration, prev_accel)
 
     async def wait_for_rotation(self) -> None:
         """
         Waits for the motor to stop rotating.
         """
-        while not self.motor.get_position_reached():
+        while not await self.bus.transact(MOTION, self.motor.get_position_reached):
             await asyncio.sleep(0.5)
 
     async def find_home(self) -> None:
@@ -303,36 +359,42 @@ class ChopperWheel(ControllerBase):
         Reinitialize the motor position to zero.
         """
         logger.info("start finding home ...")
-        prev_curr = self.motor.drive_settings.max_current
-        prev_accel = self.motor.linear_ramp.max_acceleration
-        self.motor.drive_settings.max_current = 600
-        self.motor.linear_ramp.max_acceleration = 25600
+        prev_curr, prev_accel = await self.bus.transact(
+            MOTION,
+            lambda: (
+                self.motor.drive_settings.max_current,
+                self.motor.linear_ramp.max_acceleration,
+            ),
+        )
+        await self.bus.transact(MOTION, self.set_max_current, 600)
+        await self.bus.transact(MOTION, self.set_raw_acceleration, 25600)
 
         homing_speed = 0.1  # rps
         speed = -int(homing_speed * self.steps_per_rotation)
 
         zero_reached = False
-        self.motor.rotate(speed)
+        await self.bus.transact(MOTION, self.motor.rotate, speed)
         await asyncio.sleep(0.1)  # ensure motor has moved past sensor
 
+        def move_back_from_sensor():
+            self.motor.stop()
+            sign_of_speed = 1 if speed > 0 else -1
+            move_back = int(-sign_of_speed * 400)  # move back parameter (fine tuned)
+            self.motor.actual_position = 0
+            self.motor.move_to(move_back)
+            self.motor.actual_position = 0
+
         while not zero_reached:
-            if self.are_we_home_yet():
-                self.motor.stop()
+            if await self.home_check():
+                await self.bus.transact(MOTION, move_back_from_sensor)
                 zero_reached = True
-                sign_of_speed = 1 if speed > 0 else -1
-                move_back = int(
-                    -sign_of_speed * 400
-                )  # move back parameter (fine tuned)
-                self.motor.actual_position = 0
-                self.motor.move_to(move_back)
-                self.motor.actual_position = 0
             await asyncio.sleep(0.001)
 
         await asyncio.sleep(0.5)
-        self.motor.drive_settings.max_current = prev_curr
-        self.motor.linear_ramp.max_acceleration = prev_accel
+        await self.bus.transact(MOTION, self.set_max_current, prev_curr)
+        await self.bus.transact(MOTION, self.set_raw_acceleration, prev_accel)
 
-        if not self.are_we_home_yet():
+        if not await self.home_check():
             logger.warning("Failed to find home position")
         else:
             logger.info("Home position found")
@@ -343,6 +405,22 @@ class ChopperWheel(ControllerBase):
         """
         return self.module.get_digital_input(1) == 0
 
+    async def home_check(self) -> bool:
+        """
+        Reads the home sensor as part of a motion sequence and refreshes the
+        cached value used by the status updates.
+        """
+        return await self.bus.transact(
+            MOTION, self.are_we_home_yet, cache_key="are_we_home_yet"
+        )
+
+    def stop_and_zero(self) -> None:
+        """
+        Stops the motor and sets the current position as zero.
+        """
+        self.motor.stop()
+        self.motor.actual_position = 0
+
     def rotate_by_steps(self, steps: int) -> None:
         """
         Rotates the motor by the specified number of steps.
@@ -384,6 +462,13 @@ class ChopperWheel(ControllerBase):
         pos = pos - int(pos)
         return self.direction_modifier * pos * 360
 
+    def read_telemetry(self) -> tuple[float, float]:
+        """
+        Reads the velocity in rps and the angular position in degrees in one
+        bus transaction.
+        """
+        return self.get_actual_velocity(), self.get_angular_position()
+
     def get_angular_position(self) -> float:
         """
         Gets the angular position of the motor.
@@ -423,6 +508,24 @@ class ChopperWheel(ControllerBase):
             acceleration * self.steps_per_rotation
         )
 
+    def set_raw_acceleration(self, acceleration: int) -> None:
+        """
+        Sets the acceleration of the motor in device units.
+
+        Args:
+            acceleration: The acceleration of the motor in microsteps per second squared.
+        """
+        self.motor.linear_ramp.max_acceleration = acceleration
+
+    def set_max_current(self, current: int) -> None:
+        """
+        Sets the maximum current of the motor.
+
+        Args:
+            current: The maximum current in device units.
+        """
+        self.motor.drive_settings.max_current = current
+
     def get_max_acceleration(self) -> float:
         """
         Gets the maximum acceleration of the motor.
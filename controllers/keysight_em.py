@@ -7,6 +7,7 @@ import os
 import numpy as np
 import time
 from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Lock
 from pathlib import Path
 
 import pyvisa
@@ -20,8 +21,14 @@ main_working_directory = Path(__file__).parent.parent
 OVERFLOW_UPPER_LIMIT = 1e+35
 
 class KeysightEM(ControllerBase):
-    def __init__(self, address, pipe: Connection, settings_handler: SettingsHandler):
-        super().__init__(address, pipe, settings_handler)
+    def __init__(
+        self,
+        address,
+        pipe: Connection,
+        settings_handler: SettingsHandler,
+        write_lock: Lock | None = None,
+    ):
+        super().__init__(address, pipe, settings_handler, write_lock)
 
         self.rm = pyvisa.ResourceManager("@py")
         self.my_instrument: TCPIPSocket = self.connect_to_keysight_em(self.address)  # type: ignore
@@ -99,6 +106,10 @@ class KeysightEM(ControllerBase):
                     await self.settings_changed()
                 case "init_trigger_based_measurement":
                     await self.init_trigger_based_measurement()
+                case "start_profiler":
+                    self.start_profiler()
+                case "stop_profiler":
+                    self.stop_profiler()
                 case "exit":
                     logger.info("exiting...")
                     break
@@ -318,22 +329,31 @@ class KeysightEM(ControllerBase):
         return instr
 
     def save_data_to_file(self):
-        if not os.path.isfile(self.filename):
-            logger.warning("File does not exist, data not saved")
-            return
-
-        with open(self.filename, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-
-            # remove overflow values from the data
-            current_array = np.array(self.current_list, dtype=float)
-            indexes = np.where(current_array < OVERFLOW_UPPER_LIMIT)
-            cl = np.array(self.current_list)[indexes]
-            tl = np.array(self.time_list)[indexes]
-            writer.writerows(zip(tl, cl))
-
-        self.time_list.clear()
-        self.current_list.clear()
+        with self.data_file_access() as allowed:
+            if not allowed:
+                # the UI is working on the file, the rows are written with the next batch
+                return
+            if not os.path.isfile(self.filename):
+                logger.warning("File does not exist, data not saved")
+                return
+
+            with open(self.filename, "a", newline="", encoding="utf-8") as f:
+                offset = f.tell()
+                writer = csv.writer(f)
+
+                # remove overflow values from the data
+                current_array = np.array(self.current_list, dtype=float)
+                indexes = np.where(current_array < OVERFLOW_UPPER_LIMIT)
+                cl = np.array(self.current_list)[indexes]
+                tl = np.array(self.time_list)[indexes]
+                writer.writerows(zip(tl, cl))
+                end_offset = f.tell()
+
+            if len(tl):
+                self.rows_appended(self.filename, offset, end_offset, tl[0], tl[-1], len(tl))
+
+            self.time_list.clear()
+            self.current_list.clear()
 
     async def get_trigger_based_data(self, start_time: float = 0):
         times = self.my_instrument.query(":FETCH:ARR:TIME? (@1);")
@@ -370,7 +390,7 @@ class KeysightEM(ControllerBase):
             await self.wait_for_device_ready()
 
             await self._run_blocking(self.my_instrument.write, command)
-            logger.info("Write to EM: %s", command)
+            logger.debug("Write to EM: %s", command)
             error_request = await self._run_blocking(self.my_instrument.query, "SYST:ERR?")
             if error_request != '+0,"No error"':
                 logger.error("Error: %s", error_request)
@@ -1,3 +1,4 @@
 #!/usr/bin/env python3
 
 from .arcus_performax_DMX_J_SA_stage import ArcusPerformaxDMXJSAStage
+from .stages_controller import StagesController
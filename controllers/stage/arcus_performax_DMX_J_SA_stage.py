@@ -6,11 +6,22 @@ from pathlib import Path
 from pylablib.devices import Arcus  # type: ignore
 import pylablib as pll  # type: ignore
 import asyncio
+import time
 
 
 logger = logging.getLogger()
 work_dir = Path(__file__).parent
 
+MIN_POLL_INTERVAL = 0.02  # seconds
+MAX_POLL_INTERVAL = 0.5  # seconds
+
+
+def adaptive_poll_interval(remaining_time: float) -> float:
+    """
+    Polls rarely while the arrival is far away and often close to it.
+    """
+    return min(max(remaining_time / 2, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
 
 class ArcusPerformaxDMXJSAStage:
     def __init__(self, name):
@@ -33,15 +44,30 @@ class ArcusPerformaxDMXJSAStage:
         self.current_limit_errors = None
         self.axis_status = None
         self.moving = None
+        self.jog_direction = None
+        self.speed_before_jog = None  # configured speed, restored when the jog stops
 
         self.connected = False
 
         self.name = name
 
-    async def update_pos_while_moving(self):
+    async def update_pos_while_moving(self, expected_duration: float = 0.0):
+        start = time.monotonic()
         while self.dev.is_moving():
             self.position = self.get_position()
-            await asyncio.sleep(0.1)
+            remaining = expected_duration - (time.monotonic() - start)
+            await asyncio.sleep(adaptive_poll_interval(remaining))
+        self.position = self.get_position()
+
+    def estimate_move_time(self, dist_in_mm, speed_in_mm_per_s=None):
+        """
+        Estimates the duration of a move in seconds, acceleration is neglected.
+        """
+        if speed_in_mm_per_s is None:
+            speed_in_mm_per_s = self.get_axis_speed()
+        if not speed_in_mm_per_s:
+            return 0.0
+        return abs(dist_in_mm) / speed_in_mm_per_s
 
     def get_axis_speed(self):
         return self.dev.get_axis_speed() * self.STEPS_PER_SECOND_TO_MMPS
@@ -54,11 +80,49 @@ class ArcusPerformaxDMXJSAStage:
 
     def move_by(self, dist_in_mm):
         self.dev.move_by(int(dist_in_mm * self.STEPS_PER_MM))
-        asyncio.create_task(self.update_pos_while_moving())
+        asyncio.create_task(
+            self.update_pos_while_moving(self.estimate_move_time(dist_in_mm))
+        )
 
     def move_to(self, pos_in_mm):
+        dist_in_mm = pos_in_mm - self.get_position()
+        self.start_move_to(pos_in_mm)
+        asyncio.create_task(
+            self.update_pos_while_moving(self.estimate_move_time(dist_in_mm))
+        )
+
+    def start_move_to(self, pos_in_mm):
+        """
+        Starts an absolute move without tracking the position, the caller polls.
+        """
         self.dev.move_to(int(pos_in_mm * self.STEPS_PER_MM))
-        asyncio.create_task(self.update_pos_while_moving())
+
+    def jog(self, velocity_in_mm_per_s):
+        """
+        Moves continuously with the given signed velocity until stopped, 0 stops the axis.
+        """
+        if velocity_in_mm_per_s == 0:
+            self.stop()
+            return
+        direction = "+" if velocity_in_mm_per_s > 0 else "-"
+        if self.speed_before_jog is None:
+            self.speed_before_jog = self.get_axis_speed()
+        self.set_axis_speed(abs(velocity_in_mm_per_s))
+        if not self.moving or self.jog_direction != direction:
+            if self.jog_direction is not None and self.jog_direction != direction:
+                self.dev.stop()  # reversing needs a stop first
+            self.dev.jog(direction)
+            self.jog_direction = direction
+            self.moving = True
+
+    def stop(self):
+        self.dev.stop()
+        if self.speed_before_jog is not None:
+            self.set_axis_speed(self.speed_before_jog)
+            self.speed_before_jog = None
+        self.jog_direction = None
+        self.moving = False
+        self.position = self.get_position()
 
     def get_full_status(self):
         self.status = self.dev.get_full_status()
@@ -98,6 +162,8 @@ class ArcusPerformaxDMXJSAStage:
     def close(self):
         if self.dev is not None:
             self.dev.close()
+            # a closed device is not polled by the health check anymore
+            self.dev = None  # type: ignore
             self.connected = False
 
     def connect(self, idx=0):
@@ -106,7 +172,8 @@ class ArcusPerformaxDMXJSAStage:
         self.status = self.get_full_status()
         self.connected = True
 
-    def list_usb_performax_devices(self):
+    @staticmethod
+    def list_usb_performax_devices():
         list_dev_names = {}
         try:
             for dev in Arcus.list_usb_performax_devices():
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+This module moves the x and y stage together so that both axes arrive at the same time.
+"""
+import asyncio
+import logging
+import time
+
+from controllers.stage.arcus_performax_DMX_J_SA_stage import (
+    ArcusPerformaxDMXJSAStage,
+    adaptive_poll_interval,
+)
+
+logger = logging.getLogger()
+
+
+class CoordinatedXYMove:
+    def __init__(
+        self,
+        stage_x: ArcusPerformaxDMXJSAStage,
+        stage_y: ArcusPerformaxDMXJSAStage,
+        min_speed: float = 0.05,  # mm/s
+    ):
+        self.stage_x = stage_x
+        self.stage_y = stage_y
+        self.min_speed = min_speed
+
+        self.target: tuple[float, float] = None  # type: ignore
+        self.start_time = 0.0
+        self.expected_duration = 0.0
+
+    def remaining_time(self) -> float:
+        """
+        Predicted time in seconds until both axes have arrived.
+        """
+        if self.target is None:
+            return 0.0
+        return max(self.expected_duration - (time.monotonic() - self.start_time), 0.0)
+
+    def start(self, x: float, y: float) -> asyncio.Task:
+        """
+        Starts both axes and returns a task that resolves once both have arrived.
+        """
+        return asyncio.create_task(self.move_to(x, y))
+
+    async def move_to(self, x: float, y: float) -> dict:
+        stage_x, stage_y = self.stage_x, self.stage_y
+        dist_x = abs(x - stage_x.get_position())
+        dist_y = abs(y - stage_y.get_position())
+
+        max_speed_x = stage_x.get_axis_speed()
+        max_speed_y = stage_y.get_axis_speed()
+
+        # the slower axis takes its full speed, the other one is slowed down to match
+        self.expected_duration = max(
+            stage_x.estimate_move_time(dist_x, max_speed_x),
+            stage_y.estimate_move_time(dist_y, max_speed_y),
+        )
+        if self.expected_duration > 0:
+            stage_x.set_axis_speed(
+                max(min(dist_x / self.expected_duration, max_speed_x), self.min_speed)
+            )
+            stage_y.set_axis_speed(
+                max(min(dist_y / self.expected_duration, max_speed_y), self.min_speed)
+            )
+
+        self.target = (x, y)
+        self.start_time = time.monotonic()
+        try:
+            stage_x.start_move_to(x)
+            stage_y.start_move_to(y)
+
+            while stage_x.dev.is_moving() or stage_y.dev.is_moving():
+                stage_x.position = stage_x.get_position()
+                stage_y.position = stage_y.get_position()
+                await asyncio.sleep(adaptive_poll_interval(self.remaining_time()))
+        finally:
+            stage_x.set_axis_speed(max_speed_x)
+            stage_y.set_axis_speed(max_speed_y)
+            self.target = None  # type: ignore
+
+        elapsed = time.monotonic() - self.start_time
+        stage_x.position = stage_x.get_position()
+        stage_y.position = stage_y.get_position()
+        logger.debug(
+            "xy move arrived after %.2f s, predicted %.2f s",
+            elapsed,
+            self.expected_duration,
+        )
+        return {
+            "x": stage_x.position,
+            "y": stage_y.position,
+            "elapsed": elapsed,
+            "predicted": self.expected_duration,
+        }
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+This module runs both Arcus stages in a dedicated controller process.
+"""
+import asyncio
+import logging
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Lock
+
+from controllers.stage.arcus_performax_DMX_J_SA_stage import ArcusPerformaxDMXJSAStage
+from controllers.stage.coordinated_move import CoordinatedXYMove
+from util.controller_base import ControllerBase
+from util.settings_handler import SettingsHandler
+
+logger = logging.getLogger()
+
+
+class StagesController(ControllerBase):
+    """
+    Owns the x and y stage and is the only place where the Arcus DLL is called
+    for motion and status. The UI only receives status snapshots through the pipe.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        pipe: Connection,
+        settings_handler: SettingsHandler,
+        write_lock: Lock | None = None,
+    ) -> None:
+        super().__init__(address, pipe, settings_handler, write_lock)
+
+        self.stages: dict[str, ArcusPerformaxDMXJSAStage] = {
+            "x": ArcusPerformaxDMXJSAStage("Stage X"),
+            "y": ArcusPerformaxDMXJSAStage("Stage Y"),
+        }
+
+        self.status_interval_idle = 1.0  # seconds
+        self.status_interval_moving = 0.1  # seconds
+        self.coordinated_move = CoordinatedXYMove(self.stages["x"], self.stages["y"])
+        self.wake_status_update: asyncio.Event = None  # type: ignore
+        self.xy_move_task: asyncio.Task = None  # type: ignore
+
+        # a jogging axis is stopped if the UI stops sending jog commands
+        self.jog_timeout = 1.0  # seconds
+        self.jog_deadlines: dict[str, float] = {}
+
+        logger.info("Stages Controller initialized")
+
+        self.listening_starter()
+
+    def listening_starter(self):
+        try:
+            asyncio.run(self.start_listening())
+        except Exception as e:
+            logger.warning(
+                "Exception occurred in start_listening() method. emptying pipe..."
+            )
+            logger.error(e)
+            time.sleep(0.5)
+            self.clear_pipe()
+            time.sleep(0.5)
+            logger.warning("restart the listening loop")
+            self.listening_starter()
+
+    async def start_listening(self):
+        logger.info("Stages Controller is listening for commands.")
+
+        loop = asyncio.get_event_loop()
+        self.wake_status_update = asyncio.Event()
+        loop.create_task(self.send_status_data())
+        loop.create_task(self.jog_watchdog())
+
+        while True:
+            # pipe.revc is blocking, so we need to run it in a separate thread to not block the event loop
+            received_command: str = await loop.run_in_executor(None, self.pipe.recv)
+            command, *args = received_command.split(" ")
+
+            try:
+                match command:
+                    case "connect":
+                        self.connect(args[0], int(args[1]))
+                    case "disconnect":
+                        self.stages[args[0]].close()
+                    case "move_by":
+                        self.stages[args[0]].move_by(float(args[1]))
+                    case "move_to":
+                        self.stages[args[0]].move_to(float(args[1]))
+                    case "move_xy":
+                        self.start_move_xy(int(args[0]), float(args[1]), float(args[2]))
+                    case "jog":
+                        self.jog(args[0], float(args[1]), int(args[2]))
+                    case "set_zero":
+                        self.stages[args[0]].set_zero()
+                    case "start_profiler":
+                        self.start_profiler()
+                    case "stop_profiler":
+                        self.stop_profiler()
+                    case "exit":
+                        logger.info("exiting...")
+                        for stage in self.stages.values():
+                            stage.close()
+                        break
+                    case _:
+                        logger.info("Unknown command")
+            except (IndexError, KeyError, ValueError) as e:
+                logger.error("Invalid stages command %s: %s", received_command, e)
+
+            # publish the effect of the command right away
+            self.wake_status_update.set()
+
+    def connect(self, axis: str, idx: int):
+        stage = self.stages[axis]
+        stage.close()
+        try:
+            stage.connect(idx)
+            logger.info("%s connected to device %s", stage.name, idx)
+        except Exception as e:
+            logger.error("Could not connect %s to device %s: %s", stage.name, idx, e)
+
+    def start_move_xy(self, move_id: int, x: float, y: float):
+        previous = self.xy_move_task
+        if previous and not previous.done():
+            previous.cancel()
+        self.xy_move_task = asyncio.create_task(self.move_xy(move_id, x, y, previous))
+
+    async def move_xy(self, move_id: int, x: float, y: float, previous: asyncio.Task | None = None):
+        """
+        Starts both axes together, scaled so that they arrive at the same time,
+        and reports back once both have reached the target.
+        """
+        try:
+            if previous is not None:
+                # the superseded move has to stop the axes before they are started again
+                await asyncio.wait([previous])
+
+            if not (self.stages["x"].connected and self.stages["y"].connected):
+                logger.error("Cannot do a xy move, both stages need to be connected")
+                self.pipe.send(
+                    {"event": "position_reached", "move_id": move_id, "error": "not connected"}
+                )
+                return
+
+            result = await self.coordinated_move.start(x, y)
+        except asyncio.CancelledError:
+            # a newer xy move replaces this one, its caller must not wait for the timeout
+            for stage in (self.stages["x"], self.stages["y"]):
+                try:
+                    stage.stop()
+                except Exception as e:
+                    logger.error("Could not stop %s: %s", stage.name, e)
+            self.pipe.send(
+                {"event": "position_reached", "move_id": move_id, "error": "superseded"}
+            )
+            raise
+        except Exception as e:
+            logger.error("xy move to %s, %s failed: %s", x, y, e)
+            self.pipe.send(
+                {"event": "position_reached", "move_id": move_id, "error": str(e)}
+            )
+            return
+
+        self.pipe.send({"event": "position_reached", "move_id": move_id, **result})
+
+    def jog(self, axis: str, velocity: float, seq: int):
+        stage = self.stages[axis]
+        try:
+            stage.jog(velocity)
+            error = None
+        except Exception as e:
+            logger.error("Jog of %s failed: %s", stage.name, e)
+            error = str(e)
+
+        if velocity == 0:
+            self.jog_deadlines.pop(axis, None)
+        else:
+            self.jog_deadlines[axis] = time.monotonic() + self.jog_timeout
+
+        # the UI measures the command latency with the acknowledgement
+        self.pipe.send({"event": "jog_ack", "axis": axis, "seq": seq, "error": error})
+
+    async def jog_watchdog(self):
+        while True:
+            await asyncio.sleep(0.1)
+            now = time.monotonic()
+            for axis, deadline in list(self.jog_deadlines.items()):
+                if now < deadline:
+                    continue
+                logger.warning("No jog command for %s in time, stopping", axis)
+                del self.jog_deadlines[axis]
+                try:
+                    self.stages[axis].stop()
+                except Exception as e:
+                    logger.error("Could not stop %s: %s", self.stages[axis].name, e)
+                self.wake_status_update.set()
+
+    def stage_snapshot(self, stage: ArcusPerformaxDMXJSAStage) -> dict:
+        healthy = stage.dev is not None and stage.is_healthy()
+        return {
+            "connected": stage.connected,
+            "healthy": healthy,
+            "position": stage.position,
+            "moving": stage.moving,
+            "axis_status": stage.axis_status,
+            "current_limit_errors": stage.current_limit_errors,
+            "axis_speed": stage.axis_speed,
+        }
+
+    async def send_status_data(self):
+        while True:
+            status_data = {
+                axis: self.stage_snapshot(stage) for axis, stage in self.stages.items()
+            }
+            self.pipe.send(
+                {
+                    "status_data": status_data,
+                    "healthy": all(s["healthy"] for s in status_data.values()),
+                    "xy_move_eta": self.coordinated_move.remaining_time(),
+                    "timestamp": time.time(),
+                }
+            )
+
+            moving = any(s["moving"] for s in status_data.values())
+            interval = (
+                self.status_interval_moving if moving else self.status_interval_idle
+            )
+            self.wake_status_update.clear()
+            try:
+                await asyncio.wait_for(self.wake_status_update.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
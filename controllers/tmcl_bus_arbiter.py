@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+This module contains a priority arbiter for the TMCL serial bus of the chopper wheel.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+logger = logging.getLogger()
+
+# lower number means higher priority
+MOTION = 0
+TELEMETRY = 1
+STATUS = 2
+
+PRIORITY_NAMES = {MOTION: "motion", TELEMETRY: "telemetry", STATUS: "status"}
+
+
+class TMCLBusArbiter:
+    """
+    Serialises all transactions on the TMCL serial interface.
+
+    Only one transaction is on the bus at any time. When the bus is released the
+    waiting transaction with the highest priority (motion > telemetry > status) is
+    served next, unless a transaction has waited longer than max_wait: then the
+    longest waiting one goes first, so the continuous telemetry of a rotation
+    cannot starve the status queries. The blocking pytrinamic call runs in a worker
+    thread so the controller event loop stays responsive while the serial line is
+    busy.
+    """
+
+    def __init__(self, stats_window: float = 10.0, max_wait: float = 0.5) -> None:
+        self.stats_window = stats_window  # seconds
+        self.max_wait = max_wait  # seconds
+
+        self._busy = False
+        # priority, sequence number, time queued, future
+        self._waiters: list[tuple[int, int, float, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+        self._cache: dict[str, tuple[float, Any]] = {}
+
+        self._stats = {priority: TransactionStats() for priority in PRIORITY_NAMES}
+        self._busy_intervals: deque[tuple[float, float]] = deque()
+
+    async def transact(
+        self, priority: int, func: Callable, *args, cache_key: str | None = None
+    ) -> Any:
+        """
+        Runs func(*args) exclusively on the bus.
+
+        Args:
+            priority: One of MOTION, TELEMETRY or STATUS.
+            func: The blocking function talking to the device.
+            cache_key: If given, the result is stored in the telemetry cache.
+        """
+        requested = time.perf_counter()
+        await self._acquire(priority)
+        started = time.perf_counter()
+
+        def finish(_):
+            ended = time.perf_counter()
+            self._stats[priority].add(started - requested, ended - started)
+            self._busy_intervals.append((ended, ended - started))
+            self._release()
+
+        transaction = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        # release the bus only once the serial transaction really finished,
+        # even if the awaiting task gets cancelled in the meantime
+        transaction.add_done_callback(finish)
+        result = await asyncio.shield(transaction)
+
+        if cache_key is not None:
+            self.remember(cache_key, result)
+        return result
+
+    async def query(
+        self,
+        priority: int,
+        cache_key: str,
+        func: Callable,
+        *args,
+        max_age: float = 1.0,
+    ) -> Any:
+        """
+        Serves the value from the cache if it is fresh enough, otherwise runs
+        the transaction and refreshes the cache.
+        """
+        cached = self.cached(cache_key, max_age)
+        if cached is not None:
+            self._stats[priority].cache_hits += 1
+            return cached
+        return await self.transact(priority, func, *args, cache_key=cache_key)
+
+    def remember(self, key: str, value: Any) -> None:
+        self._cache[key] = (time.monotonic(), value)
+
+    def cached(self, key: str, max_age: float) -> Any:
+        """
+        Returns the cached value for key or None if it is missing or stale.
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        timestamp, value = entry
+        if time.monotonic() - timestamp > max_age:
+            return None
+        return value
+
+    def get_stats(self) -> dict:
+        """
+        Returns the bus utilisation and the per class latencies in a pipe friendly dict.
+        """
+        now = time.perf_counter()
+        while self._busy_intervals and now - self._busy_intervals[0][0] > self.stats_window:
+            self._busy_intervals.popleft()
+        busy_time = sum(duration for _, duration in self._busy_intervals)
+        utilisation = min(busy_time / self.stats_window, 1.0)
+
+        return {
+            "utilisation": utilisation,
+            "headroom": 1.0 - utilisation,
+            "queued": len([w for w in self._waiters if not w[3].done()]),
+            "classes": {
+                PRIORITY_NAMES[priority]: stats.as_dict()
+                for priority, stats in self._stats.items()
+            },
+        }
+
+    async def _acquire(self, priority: int) -> None:
+        if not self._busy and not self._waiters:
+            self._busy = True
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters, (priority, next(self._counter), time.monotonic(), future)
+        )
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the bus was already handed to us, pass it on to the next waiter
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            future = self._next_waiter()
+            if not future.done():
+                # ownership of the bus is handed over directly
+                future.set_result(None)
+                return
+        self._busy = False
+
+    def _next_waiter(self) -> asyncio.Future:
+        """
+        Removes and returns the waiter with the highest priority, or the
+        longest waiting one if it has waited longer than max_wait.
+        """
+        # the sequence number is the order of arrival
+        oldest = min(self._waiters, key=lambda waiter: waiter[1])
+        overdue = time.monotonic() - oldest[2] >= self.max_wait
+        if overdue and oldest is not self._waiters[0]:
+            self._waiters.remove(oldest)
+            heapq.heapify(self._waiters)
+            return oldest[3]
+        return heapq.heappop(self._waiters)[3]
+
+
+class TransactionStats:
+    def __init__(self, history: int = 200) -> None:
+        self.count = 0
+        self.cache_hits = 0
+        self.max_latency = 0.0
+        self.latencies: deque[float] = deque(maxlen=history)
+        self.service_times: deque[float] = deque(maxlen=history)
+
+    def add(self, wait_time: float, service_time: float) -> None:
+        latency = wait_time + service_time
+        self.count += 1
+        self.max_latency = max(self.max_latency, latency)
+        self.latencies.append(latency)
+        self.service_times.append(service_time)
+
+    def as_dict(self) -> dict:
+        n = len(self.latencies)
+        return {
+            "count": self.count,
+            "cache_hits": self.cache_hits,
+            "mean_latency_ms": 1e3 * sum(self.latencies) / n if n else 0.0,
+            "max_latency_ms": 1e3 * self.max_latency,
+            "mean_service_ms": 1e3 * sum(self.service_times) / n if n else 0.0,
+        }
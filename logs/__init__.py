@@ -2,4 +2,4 @@
 This file is used to initialize the logs package.
 """
 
-from logs.logger import CustomFormatter, setup_logging
+from logs.logger import CustomFormatter, setup_logging, start_log_listener
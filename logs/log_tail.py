@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Server wide tail of the log for the log panes of the pages.
+
+A logging handler keeps the most recent records in a ring buffer and one
+timer pushes the new lines to the subscribed panes, filtered by level and
+module. The cost does not depend on the size of the log file or the number
+of open panes.
+"""
+import itertools
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from nicegui import ui
+
+from static.global_ui_props import *
+from util.instrumentation import instrumented
+
+LINE_FORMAT = "[%(levelname)s|%(module)s] %(asctime)s: %(message)s"
+
+
+@dataclass
+class LogLine:
+    seq: int
+    levelno: int
+    module: str
+    text: str
+
+
+@dataclass(eq=False)
+class LogSubscription:
+    callback: Callable[[list[LogLine]], None]
+    level: int = logging.INFO
+    modules: set[str] | None = None  # None means all modules
+
+    def matches(self, line: LogLine) -> bool:
+        return line.levelno >= self.level and (
+            not self.modules or line.module in self.modules
+        )
+
+
+class LogTail(logging.Handler):
+    def __init__(self, capacity: int = 2000, flush_interval: float = 0.5):
+        super().__init__(logging.DEBUG)
+        self.setFormatter(logging.Formatter(LINE_FORMAT, datefmt="%H:%M:%S"))
+        self.flush_interval = flush_interval  # seconds
+
+        self.lines: deque[LogLine] = deque(maxlen=capacity)
+        self.seq = itertools.count(1)
+        self.buffer_lock = threading.Lock()
+        self.flushed_seq = 0
+        self.subscriptions: list[LogSubscription] = []
+        self.modules: set[str] = set()
+        self.timer: ui.timer = None  # type: ignore
+
+    def emit(self, record: logging.LogRecord):
+        # called from any thread, formatting here keeps the record's args from being kept alive
+        try:
+            line = LogLine(0, record.levelno, record.module, self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        with self.buffer_lock:
+            line.seq = next(self.seq)
+            self.lines.append(line)
+            self.modules.add(line.module)
+
+    def start(self):
+        if self.timer is not None:
+            return
+        # global timer, shared by all clients
+        self.timer = ui.timer(self.flush_interval, self.push_new_lines)
+
+    def module_names(self) -> list[str]:
+        with self.buffer_lock:
+            return sorted(self.modules)
+
+    def recent(self, subscription: LogSubscription, count: int = 200) -> list[LogLine]:
+        with self.buffer_lock:
+            lines = list(self.lines)
+        return [line for line in lines if subscription.matches(line)][-count:]
+
+    def subscribe(
+        self,
+        callback: Callable[[list[LogLine]], None],
+        level: int = logging.INFO,
+        modules: set[str] | None = None,
+    ) -> LogSubscription:
+        """
+        The callback gets the recent matching lines right away and later only the new ones.
+        """
+        subscription = LogSubscription(callback, level, modules)
+        self.subscriptions.append(subscription)
+        if lines := self.recent(subscription):
+            callback(lines)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    @instrumented("LogTail.push_new_lines", budget="flush_interval")
+    def push_new_lines(self):
+        with self.buffer_lock:
+            new_lines = [line for line in self.lines if line.seq > self.flushed_seq]
+        if not new_lines:
+            return
+        self.flushed_seq = new_lines[-1].seq
+        for subscription in list(self.subscriptions):
+            if matching := [line for line in new_lines if subscription.matches(line)]:
+                subscription.callback(matching)
+
+
+log_tail = LogTail()
+
+
+def log_pane_ui():
+    """
+    Log pane with level and module filters, fed by log_tail.
+    """
+    levels = {
+        logging.DEBUG: "Debug",
+        logging.INFO: "Info",
+        logging.WARNING: "Warning",
+        logging.ERROR: "Error",
+    }
+    with ui.row().classes("w-full items-center no-wrap"):
+        level_select = (
+            ui.select(levels, value=logging.INFO, label="Level")
+            .props(props_select)
+            .classes("w-32")
+        )
+        module_select = (
+            ui.select(log_tail.module_names(), multiple=True, label="Modules", value=[])
+            .props(props_select + " use-chips clearable")
+            .classes("w-full")
+        )
+    pane = ui.log(max_lines=500).classes("w-full h-full")
+
+    def push(lines: list[LogLine]):
+        for line in lines:
+            pane.push(line.text)
+
+    subscription = log_tail.subscribe(push, level_select.value)
+
+    def on_filter_change():
+        subscription.level = level_select.value
+        subscription.modules = set(module_select.value or []) or None
+        pane.clear()
+        push(log_tail.recent(subscription))
+
+    def update_module_options():
+        module_select.options = log_tail.module_names()
+        module_select.update()
+
+    level_select.on_value_change(on_filter_change)
+    module_select.on_value_change(on_filter_change)
+    module_select.on("focus", update_module_options)
+    ui.context.client.on_disconnect(lambda: log_tail.unsubscribe(subscription))
@@ -4,10 +4,14 @@ This module contains a custom log formatter class that adds color
 and custom formatting to log messages.
 """
 
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import multiprocessing
+from multiprocessing.queues import Queue
 from pathlib import Path
-import os
+from typing import Callable
 
 
 class CustomFormatter(logging.Formatter):
@@ -34,29 +38,83 @@ class CustomFormatter(logging.Formatter):
         return formatter.format(record)
 
 
+# records of all processes go through this queue to the listener in the server
+log_queue: Queue = None  # type: ignore
+log_listener: logging.handlers.QueueListener = None  # type: ignore
+
+# records below are dropped where they are logged, before they cross the queue,
+# e.g. the debug record of every SCPI write of the electrometers; logging.DEBUG
+# passes them on to the listener, whose handlers then filter on their own levels
+QUEUE_LEVEL = logging.INFO
+
+
 def setup_logging():
+    """
+    Logs to the console until the listener is started, e.g. in the reloader
+    process of the dev mode, which never serves and must not write the file.
+    """
+    console = logging.StreamHandler()
+    console.setFormatter(CustomFormatter())
+    console.setLevel(logging.INFO)
+
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(QUEUE_LEVEL)
+    logger.addHandler(console)
+
+
+def start_log_listener():
+    """
+    Runs on startup of the server, so only the serving process writes the file.
+    The handlers run in the thread of a QueueListener, logging only puts the
+    record into the queue and never waits for the console or the disk.
+    """
+    global log_queue, log_listener
+    from logs.log_tail import log_tail
+
+    if log_listener is not None:
+        return
 
     working_directory = Path(__file__).parent
     path = working_directory / "logs.log"
 
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
     console = logging.StreamHandler()
     console.setFormatter(CustomFormatter())
     console.setLevel(logging.INFO)
 
-    file_logger = logging.FileHandler(path, mode="a", encoding="utf-8")
+    # appends to the file, full files are kept as logs.log.1 ...
+    file_logger = logging.handlers.RotatingFileHandler(
+        path, maxBytes=5 * 2**20, backupCount=10, encoding="utf-8", delay=True
+    )
     formatter = logging.Formatter(
         fmt="[%(levelname)s|%(module)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
     )
     file_logger.setFormatter(formatter)
     file_logger.setLevel(logging.INFO)
 
-    logger.addHandler(console)
-    logger.addHandler(file_logger)
+    log_queue = multiprocessing.Queue(-1)
+    log_listener = logging.handlers.QueueListener(
+        log_queue, console, file_logger, log_tail, respect_handler_level=True
+    )
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    use_log_queue(log_queue)
+
+
+def use_log_queue(queue: Queue):
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(QUEUE_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(queue))
+
 
-    # empty the logs file if it exists
-    if os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            logger.info("Logs file cleared")
+def run_with_log_queue(queue: Queue | None, target: Callable, *args):
+    """
+    Process target of the controllers, their records go to the listener of the server.
+    """
+    if queue is not None:
+        use_log_queue(queue)
+    target(*args)
@@ -5,17 +5,16 @@ Main module of ORBITOS.
 """
 
 import logging
-import os
 import signal
 import sys
+import uuid
 from pathlib import Path
-from components.meteo import MeteoComponent
 
-from components import create_layout, device_manager
-from components.bug_reports import BugReporter
-from components.dose_calibration import DoseCalibration
-from logs import setup_logging
+from components import create_layout, get_device_manager
+from logs import setup_logging, start_log_listener
+from logs.log_tail import log_pane_ui, log_tail
 from nicegui import Client, app, core, ui
+from util.instrumentation import metrics
 from util.simple_auth import AuthMiddleware
 
 working_directory = Path(__file__).parent
@@ -25,28 +24,34 @@ logger = logging.getLogger()
 @ui.page("/chopper_wheel")
 async def chopper_wheel_page():
     create_layout()
-    show_logs_with(device_manager.chopper_wheel_ui)  # type: ignore
+    show_logs_with(get_device_manager().chopper_wheel_ui)  # type: ignore
 
 
 @ui.page("/electrometer1")
 async def ion_chamber_page():
     create_layout()
-    show_logs_with(device_manager.ion_chamber_ui)  # type: ignore
+    show_logs_with(get_device_manager().ion_chamber_ui)  # type: ignore
 
 @ui.page("/electrometer2")
 async def electrometer():
     create_layout()
-    show_logs_with(device_manager.electrometer_ui)  # type: ignore
+    show_logs_with(get_device_manager().electrometer_ui)  # type: ignore
 
 @ui.page("/electrometers")
 async def electrometers():
     create_layout()
-    show_logs_with(device_manager.electrometers_ui)  # type: ignore
+    show_logs_with(get_device_manager().electrometers_ui)  # type: ignore
 
 
 @ui.page("/dose_calibration")
 async def dose_calibration():
-    dc = DoseCalibration()
+    # skimage and plotly.express are only imported when the page is first opened
+    from components.dose_calibration import DoseCalibration
+
+    # the tab storage needs the connection, it survives a reload but is not shared between tabs
+    await ui.context.client.connected()
+    session_id = app.storage.tab.setdefault("dose_calibration_session", str(uuid.uuid4()))
+    dc = DoseCalibration.for_session(session_id)
     create_layout([dc])
     show_logs_with(dc.create_ui)
 
@@ -54,7 +59,7 @@ async def dose_calibration():
 @ui.page("/stages")
 async def combo_view():
     create_layout()
-    show_logs_with(device_manager.stages_ui)  # type: ignore
+    show_logs_with(get_device_manager().stages_ui)  # type: ignore
 
 
 @ui.page("/lab_notes")
@@ -62,7 +67,7 @@ async def notes():
     create_layout()
 
     def actual_ui():
-        device_manager.lab_notes_ui()
+        get_device_manager().lab_notes_ui()
 
     show_logs_with(actual_ui)
 
@@ -71,7 +76,7 @@ async def flash():
     create_layout()
 
     def actual_ui():
-        device_manager.flash_ui()
+        get_device_manager().flash_ui()
 
     show_logs_with(actual_ui)
 
@@ -80,13 +85,15 @@ async def combined_dat_view():
     create_layout()
 
     def actual_ui():
-        device_manager.combined_data_view_ui()
+        get_device_manager().combined_data_view_ui()
 
     show_logs_with(actual_ui)
 
 
 @ui.page("/bug_reports")
 async def bug_reports():
+    from components.bug_reports import BugReporter
+
     create_layout()
     bug_reporter = BugReporter()
 
@@ -97,6 +104,9 @@ async def bug_reports():
 
 @ui.page("/meteo")
 async def meteo():
+    # openmeteo and requests_cache are only imported when the page is first opened
+    from components.meteo import MeteoComponent
+
     create_layout()
     meteo = MeteoComponent()
     show_logs_with(meteo.create_ui)  # type: ignore
@@ -129,40 +139,19 @@ async def main():
 
 
         with ui.card().classes("w-full p-4"):
-            device_manager.create_device_manager_ui()
+            get_device_manager().create_device_manager_ui()
 
     show_logs_with(actual_ui)
 
 
 def show_logs_with(actual_ui):
     if app.storage.user.get("show-with-logs", False):
-
-        path = working_directory / "logs" / "logs.log"
-
-        class Logs:
-            value = ""
-
-        logs = Logs()
-
-        def read_logs():
-            nonlocal logs
-            if os.path.exists(path):
-                with open(path, "r", encoding="utf-8") as f:
-                    logs.value = f.readlines()[-50:]
-                    logs.value = "".join(logs.value)
-
-        ui.timer(1, read_logs)
-
         with ui.splitter(value=60).classes("w-full") as splitter:
             with splitter.before:
                 actual_ui()
             with splitter.after:
-                with ui.element().classes("w-full h-full"):
-                    area = (
-                        ui.code(language="")
-                        .bind_content_from(logs, "value")
-                        .classes("w-full h-full")
-                    )
+                with ui.column().classes("w-full h-full"):
+                    log_pane_ui()
     else:
         actual_ui()
 
@@ -182,13 +171,14 @@ async def disconnect() -> None:
 
 async def cleanup():
     logger.info("Exiting ORBITOS application ...")
-    device_manager.reset_connections()
+    get_device_manager().reset_connections()
     await disconnect()
 
 
 if __name__ in {"__main__", "__mp_main__"}:
 
     setup_logging()
+    app.on_startup(start_log_listener)
 
     app.add_middleware(AuthMiddleware)
     app.on_shutdown(cleanup)
@@ -214,6 +204,9 @@ if __name__ in {"__main__", "__mp_main__"}:
         logger.info(f"ORBITOS ready to go on: {urls}")
 
     app.on_startup(on_start)
+    app.on_startup(get_device_manager)
+    app.on_startup(metrics.start)
+    app.on_startup(log_tail.start)
 
     ui.run(
         reload=reload,
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+ORBITOS server for the latency benchmark. It serves the real pages and the
+real DeviceManager / ConnectionManagerBase process topology, only the
+controller processes are replaced by the simulated devices.
+
+Started by run_benchmark.py inside a scratch copy of the repository, it is not
+meant to be run against the real data and settings directories.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import main  # noqa: E402 pylint: disable=unused-import,wrong-import-position  # registers the ORBITOS pages
+from components import get_device_manager  # noqa: E402 pylint: disable=wrong-import-position
+from nicegui import app, ui  # noqa: E402 pylint: disable=wrong-import-position
+from simulated_devices import SimulatedChopperWheel, SimulatedKeysightEM  # noqa: E402 pylint: disable=wrong-import-position
+from util.instrumentation import metrics  # noqa: E402 pylint: disable=wrong-import-position
+
+UI_BUFFER_METRIC = "bench.sample_to_ui_buffer"
+
+
+
+def simulated_managers() -> dict:
+    device_manager = get_device_manager()
+    return {
+        device_manager.cw_connection_manager: SimulatedChopperWheel,
+        device_manager.em_connection_manager: SimulatedKeysightEM,
+        device_manager.em_connection_manager_2: SimulatedKeysightEM,
+    }
+
+
+def observe_ui_buffer_latency(read_data_from_file, newest_timestamp):
+    """
+    Wraps the file reader of a component and records the age of the newest
+    sample once it has arrived in the UI buffer.
+    """
+
+    def wrapper(*args, **kwargs):
+        result = read_data_from_file(*args, **kwargs)
+        newest = newest_timestamp(result)
+        if newest is not None:
+            metrics.observe_duration(UI_BUFFER_METRIC, time.time() - newest)
+        return result
+
+    return wrapper
+
+
+def newest_em_sample(component):
+    def newest(_):
+        return component.time_list[-1].timestamp() if component.time_list else None
+
+    return newest
+
+
+def newest_cw_sample(result):
+    timestamps = result[0]
+    return timestamps[-1].timestamp() if timestamps else None
+
+
+def connect_simulated_devices(sample_rate: float):
+    device_manager = get_device_manager()
+    for em in (device_manager.em_connection_manager, device_manager.em_connection_manager_2):
+        em.component.read_data_from_file = observe_ui_buffer_latency(
+            em.component.read_data_from_file, newest_em_sample(em.component)
+        )
+    cw = device_manager.cw_connection_manager.component
+    cw.read_data_from_file = observe_ui_buffer_latency(cw.read_data_from_file, newest_cw_sample)
+
+    for manager, target in simulated_managers().items():
+        manager.target = target
+        manager.address = f"sim:{sample_rate}"
+        manager.start_process()
+
+
+@ui.page("/bench")
+async def bench_page():
+    """
+    The electrometer and chopper wheel pages in one, plus a probe with the
+    timestamp of the newest sample that reached the browser.
+    """
+    device_manager = get_device_manager()
+    device_manager.electrometers_ui()
+    device_manager.chopper_wheel_ui()
+
+    em = device_manager.em_connection_manager.component
+    probe = ui.label().classes("bench-probe")
+
+    def update_probe():
+        if em.time_list:
+            probe.text = f"{em.time_list[-1].timestamp():.3f}"
+
+    ui.timer(0.1, update_probe)
+
+
+@app.get("/bench/stats")
+def bench_stats():
+    histogram = metrics.durations.get(UI_BUFFER_METRIC)
+    ui_buffer = None
+    if histogram is not None:
+        ui_buffer = {
+            "count": histogram.count,
+            "mean": histogram.mean(),
+            "p95": histogram.quantile(0.95),
+            "max": histogram.max,
+        }
+    return {
+        "server_pid": os.getpid(),
+        "devices": {
+            manager.name: (manager.status_data or {}).get("bench")
+            for manager in simulated_managers()
+        },
+        "sample_to_ui_buffer": ui_buffer,
+    }
+
+
+@app.post("/bench/reset")
+def bench_reset():
+    metrics.durations.pop(UI_BUFFER_METRIC, None)
+    metrics.overruns.pop(UI_BUFFER_METRIC, None)
+    return {"ok": True}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=50060)
+    parser.add_argument("--rate", type=float, default=100, help="samples per second and device")
+    args = parser.parse_args()
+
+    app.on_startup(lambda: connect_simulated_devices(args.rate))
+    app.on_startup(metrics.start)
+    app.on_shutdown(lambda: get_device_manager().reset_connections())
+
+    ui.run(
+        reload=False,
+        show=False,
+        host="127.0.0.1",
+        port=args.port,
+        binding_refresh_interval=0.1,
+        show_welcome_message=False,
+        storage_secret="orbitos-benchmark",
+    )
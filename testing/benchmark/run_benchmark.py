@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark of ORBITOS with simulated devices.
+
+The repository is copied to a scratch directory with fresh default settings
+and without data, and bench_app.py is started there. The benchmark then
+connects 1, 2 and 4 headless browsers and measures for each step:
+
+- sample -> file latency, reported by the simulated controllers
+- sample -> UI buffer latency, measured in the server
+- sample -> browser latency, measured in the browsers through the websocket
+- sustained samples per second per device
+- CPU and memory of the server and its controller processes
+
+Usage (Linux, headless):
+
+    pip install psutil playwright && playwright install chromium
+    python testing/benchmark/run_benchmark.py --save-baseline
+    python testing/benchmark/run_benchmark.py --baseline testing/benchmark/baseline.json
+
+The exit code is 1 if a metric regressed by more than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+repository = Path(__file__).parent.parent.parent
+default_baseline = Path(__file__).parent / "baseline.json"
+
+PROBE_SCRIPT = """
+() => {
+    window.orbitosLatencies = [];
+    const probe = document.querySelector('.bench-probe');
+    new MutationObserver(() => {
+        const sampleTime = parseFloat(probe.textContent);
+        if (!isNaN(sampleTime)) {
+            window.orbitosLatencies.push(Date.now() / 1000 - sampleTime);
+        }
+    }).observe(probe, {childList: true, characterData: true, subtree: true});
+}
+"""
+
+
+def prepare_scratch_copy() -> Path:
+    scratch = Path(tempfile.mkdtemp(prefix="orbitos-bench-"))
+    target = scratch / "orbitos"
+    shutil.copytree(
+        repository,
+        target,
+        ignore=shutil.ignore_patterns(".git", "data", "profiles", "__pycache__", "*.log"),
+    )
+    # the settings point to the data files of the real installation
+    for default in (target / "settings").rglob("*_default.json"):
+        shutil.copy(default, str(default).replace("_default.json", ".json"))
+    return target
+
+
+def get_json(url: str, method: str = "GET") -> dict:
+    request = urllib.request.Request(url, method=method)
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def wait_for_server(base_url: str, timeout: float = 60):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            return get_json(f"{base_url}/bench/stats")
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"benchmark server did not start within {timeout} s")
+
+
+def summarize(values: list[float]) -> dict | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        "mean_ms": sum(values) / len(values) * 1e3,
+        "p95_ms": values[min(int(0.95 * len(values)), len(values) - 1)] * 1e3,
+        "max_ms": values[-1] * 1e3,
+    }
+
+
+class ResourceSampler:
+    """
+    CPU and memory of the server process and all its children.
+    """
+
+    def __init__(self, pid: int):
+        import psutil  # type: ignore
+
+        self.psutil = psutil
+        self.server = psutil.Process(pid)
+        self.processes: dict = {}
+
+    def all_processes(self) -> list:
+        processes = [self.server, *self.server.children(recursive=True)]
+        for process in processes:
+            if process.pid not in self.processes:
+                process.cpu_percent(None)  # the first call only starts the measurement
+                self.processes[process.pid] = process
+        return processes
+
+    def start(self):
+        self.processes = {}
+        self.all_processes()
+
+    def stop(self) -> dict:
+        cpu = 0.0
+        rss = 0
+        for process in self.all_processes():
+            try:
+                cpu += process.cpu_percent(None)
+                rss += process.memory_info().rss
+            except self.psutil.NoSuchProcess:
+                pass
+        return {"cpu_percent": cpu, "rss_mb": rss / 2**20}
+
+
+async def measure_phase(base_url: str, browser, n_browsers: int, sampler: ResourceSampler, warmup: float, duration: float) -> dict:
+    pages = []
+    if n_browsers:
+        for _ in range(n_browsers):
+            page = await browser.new_page()
+            await page.goto(f"{base_url}/bench")
+            await page.wait_for_selector(".bench-probe", state="attached")
+            pages.append(page)
+    await asyncio.sleep(warmup)
+
+    for page in pages:
+        await page.evaluate(PROBE_SCRIPT)
+    get_json(f"{base_url}/bench/reset", method="POST")
+    before = get_json(f"{base_url}/bench/stats")
+    sampler.start()
+    start = time.monotonic()
+
+    await asyncio.sleep(duration)
+
+    resources = sampler.stop()
+    elapsed = time.monotonic() - start
+    after = get_json(f"{base_url}/bench/stats")
+
+    browser_latencies: list[float] = []
+    for page in pages:
+        browser_latencies += await page.evaluate("window.orbitosLatencies")
+        await page.close()
+
+    samples_per_second = {}
+    sample_to_file_ms = {}
+    for name, stats in after["devices"].items():
+        if not stats:
+            continue
+        written_before = (before["devices"].get(name) or {}).get("samples_written", 0)
+        samples_per_second[name] = (stats["samples_written"] - written_before) / elapsed
+        sample_to_file_ms[name] = stats["sample_to_file_mean"] * 1e3
+
+    ui_buffer = after["sample_to_ui_buffer"]
+    return {
+        "browsers": n_browsers,
+        **resources,
+        "samples_per_second": samples_per_second,
+        "sample_to_file_ms": sample_to_file_ms,
+        "sample_to_ui_buffer_ms": ui_buffer
+        and {
+            "mean_ms": ui_buffer["mean"] * 1e3,
+            "p95_ms": ui_buffer["p95"] * 1e3,
+            "max_ms": ui_buffer["max"] * 1e3,
+        },
+        "sample_to_browser_ms": summarize(browser_latencies),
+    }
+
+
+async def run_phases(base_url: str, browser_counts: list[int], warmup: float, duration: float) -> dict:
+    stats = wait_for_server(base_url)
+    sampler = ResourceSampler(stats["server_pid"])
+
+    phases = {}
+    if any(browser_counts):
+        from playwright.async_api import async_playwright  # type: ignore
+
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=True)
+            for n in browser_counts:
+                print(f"measuring with {n} browser(s) ...")
+                phases[str(n)] = await measure_phase(base_url, browser, n, sampler, warmup, duration)
+            await browser.close()
+    else:
+        phases["0"] = await measure_phase(base_url, None, 0, sampler, warmup, duration)
+    return phases
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and key != "browsers":
+            flat[name] = float(value)
+    return flat
+
+
+def compare_to_baseline(phases: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Returns the metrics that are worse than the baseline by more than the tolerance.
+    Throughput has to stay high, everything else has to stay low.
+    """
+    regressions = []
+    current = flatten(phases)
+    for name, reference in flatten(baseline["phases"]).items():
+        value = current.get(name)
+        if value is None or reference == 0:
+            continue
+        if "samples_per_second" in name:
+            regressed = value < reference * (1 - tolerance)
+        else:
+            regressed = value > reference * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{name}: {value:.2f} (baseline {reference:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rate", type=float, default=100, help="samples per second and device")
+    parser.add_argument("--browsers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--warmup", type=float, default=5, help="seconds")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per step")
+    parser.add_argument("--port", type=int, default=50060)
+    parser.add_argument("--output", type=Path, default=None, help="write the results as json")
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--save-baseline", action="store_true", help=f"write the results to {default_baseline}")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    scratch = prepare_scratch_copy()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            str(scratch / "testing" / "benchmark" / "bench_app.py"),
+            "--port",
+            str(args.port),
+            "--rate",
+            str(args.rate),
+        ],
+        cwd=scratch,
+    )
+    try:
+        phases = asyncio.run(
+            run_phases(f"http://127.0.0.1:{args.port}", args.browsers, args.warmup, args.duration)
+        )
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(scratch.parent, ignore_errors=True)
+
+    results = {
+        "config": {"rate": args.rate, "duration": args.duration, "python": sys.version.split()[0]},
+        "phases": phases,
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        default_baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"baseline written to {default_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(phases, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
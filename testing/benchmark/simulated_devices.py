@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Simulated controllers for the latency benchmark. They run in their own process
+like the real controllers, write the same data files and answer the same pipe
+protocol, but generate their samples instead of talking to hardware.
+
+The address selects the sample rate, e.g. "sim:200" for 200 samples per second.
+"""
+import asyncio
+import csv
+import logging
+import math
+import os
+import random
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Lock
+
+from util.controller_base import ControllerBase
+from util.settings_handler import SettingsHandler
+
+logger = logging.getLogger()
+
+
+def sample_rate_from_address(address: str, default: float = 10.0) -> float:
+    try:
+        return float(address.split(":", 1)[1])
+    except (IndexError, ValueError):
+        return default
+
+
+class SimulatedController(ControllerBase):
+    """
+    Generates samples at a fixed rate and appends them to the data file in
+    batches every write_interval seconds, like the real controllers do.
+    """
+
+    write_interval = 0.1  # seconds
+
+    def __init__(
+        self,
+        address: str,
+        pipe: Connection,
+        settings_handler: SettingsHandler,
+        write_lock: Lock | None = None,
+    ) -> None:
+        super().__init__(address, pipe, settings_handler, write_lock)
+        self.sample_rate = sample_rate_from_address(address)
+        self.send_status_data_timeout = 1  # seconds
+
+        self.samples_written = 0
+        self.sample_to_file_sum = 0.0  # seconds, summed over all written samples
+        self.sample_to_file_max = 0.0  # seconds
+        self.rows: list[tuple] = []
+
+        asyncio.run(self.start_listening())
+
+    def make_row(self, timestamp: float) -> tuple:
+        raise NotImplementedError
+
+    async def start_listening(self):
+        logger.info("%s is simulating %s samples/s", type(self).__name__, self.sample_rate)
+        loop = asyncio.get_event_loop()
+        loop.create_task(self.generate_samples())
+        loop.create_task(self.save_data())
+        loop.create_task(self.send_status_data())
+
+        while True:
+            received_command: str = await loop.run_in_executor(None, self.pipe.recv)
+            command = received_command.split(" ")[0]
+            match command:
+                case "settings_changed":
+                    self.settings_handler.read_settings()
+                    self.filename = self.settings_handler.settings["filename"]
+                case "start_profiler":
+                    self.start_profiler()
+                case "stop_profiler":
+                    self.stop_profiler()
+                case "exit":
+                    break
+                case _:
+                    logger.debug("Simulated controller ignores %s", command)
+
+    async def generate_samples(self):
+        period = 1 / self.sample_rate
+        next_sample = time.time()
+        while True:
+            now = time.time()
+            while next_sample <= now:
+                self.rows.append(self.make_row(next_sample))
+                next_sample += period
+            await asyncio.sleep(max(next_sample - time.time(), 0.001))
+
+    async def save_data(self):
+        while True:
+            await asyncio.sleep(self.write_interval)
+            with self.data_file_access() as allowed:
+                if not allowed or not self.rows or not os.path.isfile(self.filename):
+                    continue
+                rows, self.rows = self.rows, []
+                with open(self.filename, "a", newline="", encoding="utf-8") as f:
+                    offset = f.tell()
+                    csv.writer(f).writerows(rows)
+                    end_offset = f.tell()
+                self.rows_appended(self.filename, offset, end_offset, rows[0][0], rows[-1][0], len(rows))
+            written = time.time()
+            for row in rows:
+                delay = written - float(row[0])
+                self.sample_to_file_sum += delay
+                self.sample_to_file_max = max(self.sample_to_file_max, delay)
+            self.samples_written += len(rows)
+
+    def bench_status(self) -> dict:
+        return {
+            "samples_written": self.samples_written,
+            "sample_to_file_mean": self.sample_to_file_sum / max(self.samples_written, 1),
+            "sample_to_file_max": self.sample_to_file_max,
+        }
+
+    async def send_status_data(self):
+        while True:
+            self.pipe.send({"status_data": self.status_data(), "healthy": True})
+            await asyncio.sleep(self.send_status_data_timeout)
+
+    def status_data(self) -> dict:
+        return {"bench": self.bench_status()}
+
+
+class SimulatedKeysightEM(SimulatedController):
+    # columns: time, current
+    def make_row(self, timestamp: float) -> tuple:
+        current = 1e-9 * (1 + 0.5 * math.sin(timestamp)) + random.gauss(0, 1e-11)
+        return (timestamp, current)
+
+
+class SimulatedChopperWheel(SimulatedController):
+    # columns: timestamp, velocity, angular_position
+    def make_row(self, timestamp: float) -> tuple:
+        angle = (timestamp * 360) % 360
+        return (timestamp, 1.0 + random.gauss(0, 0.01), angle)
+
+    def status_data(self) -> dict:
+        return {"are_we_home_yet": False, "bench": self.bench_status()}
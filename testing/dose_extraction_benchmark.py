@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the circle dose extraction of the dose calibration page.
+
+Times the bounding box pipeline of dose_extraction.py against the former
+full-image meshgrid and per-pixel loop on a synthetic scan (or a given one)
+and checks that both give the same heatmap, with the dose evaluated by the
+formula and gathered from the lookup table of dose_lut.py.
+
+Usage:
+
+    python testing/dose_extraction_benchmark.py
+    python testing/dose_extraction_benchmark.py --scan film.tif --radius 300
+"""
+import argparse
+import importlib.util
+import time
+from pathlib import Path
+
+import numpy as np  # type: ignore
+
+repository = Path(__file__).parent.parent
+
+
+def load_module(name: str):
+    # loaded by path, the dose_calibration package would import the whole UI
+    spec = importlib.util.spec_from_file_location(
+        name, repository / "components" / "dose_calibration" / f"{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+dose_extraction = load_module("dose_extraction")
+dose_lut = load_module("dose_lut")
+
+# EBT3_new_METAS_ImageJwRGB
+PARS = np.array([5.19, 8.40, 167.13, -0.87])
+MAX_EXPECTED_DOSE = 20
+
+
+def inv_green_saunders(pixel_value, Do, PVmin, PVmax, beta):
+    val = Do * ((pixel_value - PVmin) / (PVmax - pixel_value)) ** (1 / beta)
+    return np.nan_to_num(val)
+
+
+def to_dose(pixels):
+    return inv_green_saunders(dose_extraction.to_gray(pixels), *PARS)
+
+
+def reference_heatmap(image, center, radius):
+    """
+    The former implementation: full-image mask and a loop over the circle's pixels.
+    """
+    center_x, center_y = center
+    image_gray = np.dot(image[..., :3], [0.2989, 0.5870, 0.1140])
+    height, width = image_gray.shape
+    X, Y = np.meshgrid(np.arange(width), np.arange(height))
+    mask = (X - center_x) ** 2 + (Y - center_y) ** 2 <= radius**2
+    circle_pixels = inv_green_saunders(image_gray[mask], *PARS)
+    circle_coords = np.column_stack((Y[mask], X[mask]))
+
+    min_x, min_y = int(center_x - radius), int(center_y - radius)
+    max_x, max_y = int(center_x + radius), int(center_y + radius)
+    heatmap = np.zeros((max_y - min_y + 1, max_x - min_x + 1))
+    for coords, value in zip(circle_coords, circle_pixels):
+        y, x = coords
+        if min_x < x < max_x and min_y < y < max_y:
+            heatmap[y - min_y - 1, x - min_x - 1] = value if value < MAX_EXPECTED_DOSE else 0
+    return heatmap
+
+
+def best_of(repeat: int, func, *args) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scan", type=Path, help="film scan, synthetic if omitted")
+    parser.add_argument("--width", type=int, default=4000, help="of the synthetic scan")
+    parser.add_argument("--height", type=int, default=5000, help="of the synthetic scan")
+    parser.add_argument("--radius", type=float, default=200.5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.scan:
+        from skimage import io
+
+        image = io.imread(args.scan)
+    else:
+        rng = np.random.default_rng(0)
+        image = rng.integers(20, 160, size=(args.height, args.width, 3), dtype=np.uint8)
+    height, width = image.shape[:2]
+    print(f"Scan {width} x {height} px, circle radius {args.radius} px")
+
+    lut = dose_lut.DoseLookupTable(PARS)
+    lut.dose(image[:1, :1])  # builds the table
+
+    # in the middle, at the corner (partly outside) and on a fractional center
+    centers = [(width / 2, height / 2), (10.0, 15.0), (width / 3 + 0.37, height / 4 + 0.81)]
+    for center in centers:
+        expected = reference_heatmap(image, center, args.radius)
+        result = dose_extraction.extract_circle_dose(
+            image, center, args.radius, to_dose, MAX_EXPECTED_DOSE
+        )
+        if not np.array_equal(expected, result.heatmap):
+            raise SystemExit(f"heatmaps differ for the circle at {center}")
+        result = dose_extraction.extract_circle_dose(
+            image, center, args.radius, lut.dose, MAX_EXPECTED_DOSE
+        )
+        # the table is evaluated at the exact weighted gray values, not their float sums
+        if not np.allclose(expected, result.heatmap, rtol=1e-12, atol=0):
+            raise SystemExit(f"lookup table heatmap differs for the circle at {center}")
+
+    center = centers[0]
+    before = best_of(1, reference_heatmap, image, center, args.radius)
+    after = best_of(
+        args.repeat,
+        dose_extraction.extract_circle_dose,
+        image,
+        center,
+        args.radius,
+        to_dose,
+        MAX_EXPECTED_DOSE,
+    )
+    with_lut = best_of(
+        args.repeat,
+        dose_extraction.extract_circle_dose,
+        image,
+        center,
+        args.radius,
+        lut.dose,
+        MAX_EXPECTED_DOSE,
+    )
+    print(f"Full image and loop:        {before * 1e3:10.1f} ms")
+    print(f"Bounding box:               {after * 1e3:10.1f} ms ({before / after:.0f}x faster)")
+    print(f"Bounding box, lookup table: {with_lut * 1e3:10.1f} ms ({before / with_lut:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
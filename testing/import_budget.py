@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Import time budget of ORBITOS.
+
+Imports main in a fresh interpreter with -X importtime, the same work the
+dev-mode reload does on every save, and checks that
+
+- the total import time stays within the budget
+- none of the heavy modules that are only needed by single pages or after
+  startup (skimage, pandas, plotly, openmeteo, ...) are imported
+
+Usage:
+
+    python testing/import_budget.py
+    python testing/import_budget.py --budget 1.5 --top 20
+
+The exit code is 1 if the budget is exceeded or a heavy module is imported.
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+repository = Path(__file__).parent.parent
+
+# must not be imported by "import main", they are imported on first use
+HEAVY_MODULES = [
+    "skimage",
+    "pandas",
+    "plotly.express",
+    "openmeteo_requests",
+    "requests_cache",
+    "retry_requests",
+    "pyvisa",
+    "pytrinamic",
+    "pylablib",
+]
+
+CHECK_SCRIPT = """
+import sys
+import main
+print("HEAVY:" + ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[float, str]]:
+    """
+    Cumulative import time in seconds of every top level import.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented by two spaces per level after the space
+        # following the separator, only the top level ones add up to the total
+        if not name[1:].startswith(" "):
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to show")
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHECK_SCRIPT.format(heavy=HEAVY_MODULES)],
+        cwd=repository,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit(f"import main failed with exit code {result.returncode}")
+
+    imports = parse_importtime(result.stderr)
+    total = sum(seconds for seconds, _ in imports)
+    heavy = [m for m in result.stdout.split("HEAVY:", 1)[-1].strip().split(",") if m]
+
+    print("Slowest top level imports of main:")
+    for seconds, name in sorted(imports, reverse=True)[: args.top]:
+        print(f"  {seconds * 1e3:8.1f} ms  {name}")
+    print(f"Total: {total:.2f} s (budget {args.budget:.2f} s)")
+
+    failed = False
+    if total > args.budget:
+        print("Import time budget exceeded.")
+        failed = True
+    if heavy:
+        print(f"Heavy modules imported by main: {', '.join(heavy)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
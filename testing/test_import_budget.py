@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests of the -X importtime parsing of import_budget.py, run with
+
+    python -m pytest testing/test_import_budget.py
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from import_budget import parse_importtime  # noqa: E402
+
+NESTED_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:        50 |        150 | io
+import time:        20 |         20 |       c
+import time:        30 |         50 |     b
+import time:        40 |         90 |   a
+import time:       200 |        290 | main
+"""
+
+
+def test_only_top_level_imports_count():
+    imports = parse_importtime(NESTED_OUTPUT)
+    assert imports == [(150e-6, "io"), (290e-6, "main")]
+    assert sum(seconds for seconds, _ in imports) == pytest.approx(440e-6)
+
+
+def test_real_importtime_output():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import json"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    names = [name for _, name in parse_importtime(result.stderr)]
+    assert "json" in names
+    assert "json.decoder" not in names
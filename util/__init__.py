@@ -1,11 +1,27 @@
 """
 This module contains the util package.
+
+The classes are imported on first use, importing a single util module does not
+pull in plotly and the other heavy dependencies of the rest.
 """
+import importlib
+
+_lazy_attributes = {
+    "ComponentBase": ".component_base",
+    "ConnectionManagerBase": ".connection_manager_base",
+    "ConnectionStatusChip": ".connection_status_chip",
+    "ControllerBase": ".controller_base",
+    "SettingsHandler": ".settings_handler",
+    "DataFileHandler": ".data_file_handler",
+    "AuthMiddleware": ".simple_auth",
+    "logout_buttons": ".simple_auth",
+    "login": ".simple_auth",
+}
+
+__all__ = list(_lazy_attributes)
+
 
-from .component_base import ComponentBase
-from .connection_manager_base import ConnectionManagerBase
-from .connection_status_chip import ConnectionStatusChip
-from .controller_base import ControllerBase
-from .settings_handler import SettingsHandler
-from .data_file_handler import *
-from .simple_auth import *
+def __getattr__(name: str):
+    if name in _lazy_attributes:
+        return getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,10 +4,13 @@ from multiprocessing import Pipe, Process
 import asyncio
 
 from nicegui import ui
+import logs.logger
+from logs.logger import run_with_log_queue
 from util.component_base import ComponentBase
 from util.connection_status_chip import ConnectionStatusChip
 from util.controller_base import ControllerBase
 from util.data_file_handler import DataFileHandler
+from util.instrumentation import instrumented, metrics
 from util.settings_handler import SettingsHandler
 
 logger = logging.getLogger()
@@ -25,6 +28,7 @@ class ConnectionManagerBase:
         self.address: str = None  # type: ignore
         self.healthy: ReactiveHealthIndicator = ReactiveHealthIndicator(False)
         self.status_data = None
+        self.profile_written: asyncio.Future | None = None
         self.status_data_timer = ui.timer(5.2, self.recv_status_data, active=False)
 
     def connection_menu_ui(self):
@@ -40,12 +44,24 @@ class ConnectionManagerBase:
     def health_check_indicator(self):
         self.chip = ConnectionStatusChip(self.healthy)
 
+    @instrumented(
+        "ConnectionManagerBase.recv_status_data", budget="status_data_timer.interval"
+    )
     async def recv_status_data(self):
         if self.pipe.poll(timeout=self.status_data_timer.interval - 0.2):
+            depth = 0
+            snapshot = None
             while self.pipe.poll():
                 answer = self.pipe.recv()
-            self.healthy.value = bool(answer["healthy"])
-            self.status_data = answer["status_data"]
+                depth += 1
+                if isinstance(answer, dict) and answer.get("event") == "profile_written":
+                    self.on_profile_written(answer)
+                else:
+                    snapshot = answer
+            metrics.set_pipe_depth(self.name, depth)
+            if snapshot is not None:
+                self.healthy.value = bool(snapshot["healthy"])
+                self.status_data = snapshot["status_data"]
         else:
             self.healthy.value = False
 
@@ -55,6 +71,26 @@ class ConnectionManagerBase:
     def set_dark_mode(self, value: bool):
         self.component.set_dark_mode(value)
 
+    async def stop_profiler(self, timeout: float) -> str | None:
+        """
+        Stops the profiler of the controller and returns the path of the
+        profile it wrote, None if it did not reply within timeout seconds.
+        """
+        self.profile_written = asyncio.get_running_loop().create_future()
+        self.pipe.send("stop_profiler")
+        try:
+            event = await asyncio.wait_for(self.profile_written, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s did not reply with its profile within %s s", self.name, timeout)
+            return None
+        finally:
+            self.profile_written = None
+        return event["path"]
+
+    def on_profile_written(self, event: dict):
+        if self.profile_written is not None and not self.profile_written.done():
+            self.profile_written.set_result(event)
+
     def connect_to_address(self, e):
         self.address = e.value
         self.start_process()
@@ -67,9 +103,17 @@ class ConnectionManagerBase:
     def start_process(self):
         self.kill_process()
         if self.address and self.child_pipe and self.settings_handler:
+            self.data_file_handler.renew_write_lock()
             self.process = Process(
-                target=self.target,
-                args=(self.address, self.child_pipe, self.settings_handler),
+                target=run_with_log_queue,
+                args=(
+                    logs.logger.log_queue,
+                    self.target,
+                    self.address,
+                    self.child_pipe,
+                    self.settings_handler,
+                    self.data_file_handler.write_lock,
+                ),
             )
             self.process.start()
             self.status_data_timer.active = True
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 import logging.config
+from contextlib import contextmanager
+from multiprocessing.synchronize import Lock
+from util.sampling_profiler import SamplingProfiler
 from util.settings_handler import SettingsHandler
+from util.segment_rotation import SegmentRotator
+from util.time_index import TimeIndexWriter
 from multiprocessing.connection import Connection
 
 logger = logging.getLogger()
@@ -9,17 +14,73 @@ logger = logging.getLogger()
 
 class ControllerBase:
     def __init__(
-        self, address: str, pipe: Connection, settings_handler: SettingsHandler
+        self,
+        address: str,
+        pipe: Connection,
+        settings_handler: SettingsHandler,
+        write_lock: Lock | None = None,
     ):
         self.pipe = pipe
+        # the DataFileHandler takes it to pause the appends during copies and clears
+        self.write_lock = write_lock
         self.settings_handler = settings_handler
         self.filename = settings_handler.settings["filename"]
         self.address = address
         self.send_status_data_timeout = 5  # seconds
         self.send_settings_within_next_update = False
+        self.profiler = SamplingProfiler(f"{type(self).__name__} {address}")
+        self.time_index = TimeIndexWriter()
+        self.segment_rotator = SegmentRotator()
 
         # self.clear_pipe()
 
+    @contextmanager
+    def data_file_access(self):
+        """
+        Yields False while the UI works on the data file, the caller then keeps
+        its rows and tries again with the next batch. Never blocks.
+        """
+        if self.write_lock is None:
+            yield True
+            return
+        acquired = self.write_lock.acquire(block=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.write_lock.release()
+
+    def rows_appended(
+        self,
+        filename: str,
+        offset: int,
+        end_offset: int,
+        first_timestamp: float,
+        last_timestamp: float,
+        n_rows: int,
+    ):
+        """
+        To be called by the subclasses after every batch appended to the data file,
+        offset and end_offset are the file positions before and after the batch.
+        """
+        if n_rows == 0:
+            return
+        self.time_index.add_batch(filename, offset, first_timestamp, n_rows)
+        try:
+            self.segment_rotator.rows_written(
+                filename, first_timestamp, last_timestamp, n_rows, end_offset - offset
+            )
+        except OSError as e:
+            logger.error("Segment rotation of %s failed: %s", filename, e)
+
+    def start_profiler(self):
+        self.profiler.start()
+
+    def stop_profiler(self):
+        # the server waits for the reply before it lists the profiles
+        path = self.profiler.stop()
+        self.pipe.send({"event": "profile_written", "path": str(path) if path else None})
+
     def clear_pipe(self):
         while self.pipe.poll():
             self.pipe.recv()
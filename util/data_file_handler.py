@@ -2,19 +2,33 @@
 """
 This module represents a chopper wheel device.
 """
+import asyncio
 import csv
+import gzip
 import logging
+import multiprocessing
 import os
 import shutil
 import time
+from contextlib import contextmanager
 from multiprocessing.connection import Connection
 from pathlib import Path
-import tempfile
+from typing import Callable
 from static.global_ui_props import *
 
-from nicegui import ui
-
+from nicegui import background_tasks, core, run, ui
+
+from util.download_stream import download_url, register_download_source
+from util.file_watcher import file_watcher
+from util.segment_rotation import (
+    forget_segments,
+    load_manifest,
+    move_segments,
+    segment_path,
+    stream_files,
+)
 from util.settings_handler import SettingsHandler
+from util.time_index import TimeIndexReader, index_filename, remove_index
 
 logger = logging.getLogger()
 
@@ -47,6 +61,32 @@ class DataFileHandler:
         self.set_been_pressed = False
 
         self.filename_of_download_inputfield = ""
+        self.time_index = TimeIndexReader()
+        register_download_source(self.additional_path, self)
+
+        # set from the file watcher thread, the readers only look at the flags
+        self.file_changed = True
+        self.file_shrunk = False
+        self.bytes_grown = 0
+        self.watched_filename: str = None  # type: ignore
+        self.data_listeners: list[Callable] = []
+        self.clear_listeners: list[Callable] = []
+
+        # sealed segments known to the reader, the ones sealed since the last
+        # read still hold rows after last_position_read
+        self.known_segments = len(self.sealed_segments())
+        self.unread_segments: list[str] = []
+
+        # held by the controller while it appends a batch, see exclusive_file_operation
+        self.write_lock = multiprocessing.Lock()
+        self.pause_timeout = 10  # seconds
+
+    def renew_write_lock(self):
+        """
+        A new lock for every controller process. A killed controller may still
+        hold the old one, which would then never be released.
+        """
+        self.write_lock = multiprocessing.Lock()
 
     def change_full_filename(self, new_filename):
         self.full_filename = str(new_filename)
@@ -75,39 +115,235 @@ class DataFileHandler:
 
     def create_file(self):
         # if the file already exists, log and do nothing
-        if os.path.exists(self.full_filename):
+        if not self._write_header_if_missing():
             self.log_and_notify(
                 f"File {self.full_filename} already exists, appending data."
             )
-            return
+
+    def _write_header_if_missing(self) -> bool:
+        if os.path.exists(self.full_filename):
+            return False
         with open(self.full_filename, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow(self.headers)
+        return True
 
-    def _delete_file(self):
+    @contextmanager
+    def write_access(self):
+        """
+        For rows written by the server itself: yields False while a file
+        operation holds the write lock, the caller then tries again later.
+        Never blocks.
+        """
+        write_lock = self.write_lock
+        acquired = write_lock.acquire(block=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                write_lock.release()
+
+    async def exclusive_file_operation(self, description: str, func: Callable, *args):
+        """
+        Runs the blocking func on the I/O executor while the controller pauses
+        writing. The controller only holds the write lock while it appends a
+        batch, so once we have it there is no append in flight; the rows measured
+        meanwhile stay buffered in the controller and are written after we release
+        it. Raises if the controller does not pause within pause_timeout.
+        """
+        notification = ui.notification(
+            f"{description} ...", spinner=True, timeout=None, position="top"
+        )
+        # the lock is renewed when the controller restarts, release the one acquired
+        write_lock = self.write_lock
+        try:
+            acquired = await run.io_bound(write_lock.acquire, True, self.pause_timeout)
+            if not acquired:
+                raise TimeoutError("the controller did not pause writing")
+            try:
+                return await run.io_bound(func, *args)
+            finally:
+                write_lock.release()
+        except Exception as e:
+            logger.error("%s failed: %s", description, e)
+            raise
+        finally:
+            notification.dismiss()
+
+    def read_last_row(self, block_size: int = 1024) -> list[str] | None:
+        """
+        Returns the last data row of the file without reading the whole file,
+        or None if the file has no data rows.
+        """
+        if not os.path.exists(self.full_filename):
+            return None
+        with open(self.full_filename, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            tail = b""
+            # read backwards until the tail contains a complete last line
+            while position > 0 and tail.rstrip(b"\r\n").count(b"\n") < 1:
+                position = max(position - block_size, 0)
+                f.seek(position)
+                tail = f.read(end - position)
+        lines = tail.decode("utf-8").splitlines()
+        if not lines or (position == 0 and len(lines) < 2):
+            # empty file or only the header
+            return None
+        return next(csv.reader([lines[-1]]))
+
+    def offset_for_time(self, start_time: float) -> int:
+        """
+        Byte offset from which on the rows of the data file are newer than
+        start_time, 0 means read from the start including the header.
+        """
+        return self.time_index.offset_for_time(self.full_filename, start_time)
+
+    def latest_indexed_time(self) -> float | None:
+        return self.time_index.latest_time(self.full_filename)
+
+    def stream_files(self, start_time: float | None = None) -> list[str]:
+        """
+        The sealed segments and the current file, see util.segment_rotation.
+        """
+        return stream_files(self.full_filename, start_time)
+
+    def sealed_segments(self) -> list[dict]:
+        return load_manifest(self.full_filename)["segments"]
+
+    async def delete_file(self):
+        try:
+            await self.exclusive_file_operation("Deleting data", self._delete_file)
+        except Exception as e:
+            self.log_and_notify(f"Could not delete {self.full_filename}. Error: {e}")
+            return
         self.last_position_read = 0
-        os.remove(self.full_filename)
-        self.create_file()
+        self.known_segments = 0
+        self.unread_segments = []
+        for callback in self.clear_listeners:
+            callback()
         self.log_and_notify(f"File {self.full_filename} has been emptied.")
 
+    def _delete_file(self):
+        os.remove(self.full_filename)
+        remove_index(self.full_filename)
+        # the sealed segments stay on disk but are not part of the data anymore
+        forget_segments(self.full_filename)
+        self._write_header_if_missing()
+
     def _ensure_directory_exists(self):
         os.makedirs(os.path.dirname(self.full_filename), exist_ok=True)
 
     def _is_it_a_new_filename(self):
         if self.full_filename != self.full_filename_old:
             self.last_position_read = 0
+            self.known_segments = len(self.sealed_segments())
+            self.unread_segments = []
             self.full_filename_old = self.full_filename
             return True
         return False
 
+    def watch_file(self):
+        if self.watched_filename == self.full_filename:
+            return
+        if self.watched_filename is not None:
+            file_watcher.unsubscribe(self.watched_filename, self.on_file_event)
+        file_watcher.subscribe(self.full_filename, self.on_file_event)
+        self.watched_filename = self.full_filename
+        self.file_changed = True
+
+    def on_file_event(self, path: str, grown_by: int):
+        """
+        Called in the file watcher thread.
+        """
+        if grown_by < 0:
+            self.file_shrunk = True
+        else:
+            self.bytes_grown += grown_by
+        self.file_changed = True
+        if self.data_listeners and core.loop is not None:
+            core.loop.call_soon_threadsafe(self.notify_data_listeners)
+
+    def add_data_listener(self, callback: Callable):
+        """
+        The callback is called on the event loop as soon as data arrives.
+        """
+        self.data_listeners.append(callback)
+
+    def add_clear_listener(self, callback: Callable):
+        """
+        The callback is called after the file has been emptied by the UI.
+        """
+        self.clear_listeners.append(callback)
+
+    def notify_data_listeners(self):
+        for callback in self.data_listeners:
+            result = callback()
+            if asyncio.iscoroutine(result):
+                background_tasks.create(result)
+
+    def file_replaced(self):
+        """
+        The file got smaller: either the controller sealed it as a segment and
+        the rows not read yet are at the end of the segment, or it was
+        truncated or replaced and is read again from the start.
+        """
+        segments = self.sealed_segments()
+        sealed = segments[self.known_segments :]
+        self.known_segments = len(segments)
+        if not sealed:
+            self.last_position_read = 0
+            return
+        for segment in sealed:
+            path = segment_path(self.full_filename, segment)
+            if path is None:
+                logger.warning("Segment %s is gone, its last rows are not shown", segment["filename"])
+            else:
+                self.unread_segments.append(path)
+
+    def read_sealed_rows(self) -> list[list[str]]:
+        """
+        The rows of the segments sealed since the last read from
+        last_position_read on. The new file is then read after its header, so
+        the rows read before stay valid.
+        """
+        paths, self.unread_segments = self.unread_segments, []
+        if not paths or self.last_position_read == 0:
+            # everything is read again anyway
+            return []
+        rows = []
+        for path in paths:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rb") as f:
+                f.seek(self.last_position_read)
+                lines = f.read().decode("utf-8").splitlines()
+            if self.last_position_read == 0:
+                lines = lines[1:]  # header
+            rows.extend(row for row in csv.reader(lines) if row)
+            self.last_position_read = 0
+        with open(self.full_filename, "rb") as f:
+            self.last_position_read = len(f.readline())
+        return rows
+
     def new_data_or_new_file(self):
         if not os.path.exists(self.full_filename):
             self._ensure_directory_exists()
         if self._is_it_a_new_filename():
+            self.watch_file()
             return True
+        self.watch_file()
+        if file_watcher.is_watching(self.full_filename):
+            if self.file_shrunk:
+                self.file_shrunk = False
+                self.file_replaced()
+            changed, self.file_changed = self.file_changed, False
+            self.bytes_grown = 0
+            return changed
         mod_time = os.path.getmtime(self.full_filename)
         if mod_time > self.last_mod_time:
             self.last_mod_time = mod_time
+            if os.path.getsize(self.full_filename) < self.last_position_read:
+                self.file_replaced()
             return True
         return False
 
@@ -116,9 +352,9 @@ class DataFileHandler:
             ui.label(f'Are you sure you want to delete "{self.full_filename}"?')
             with ui.row().classes("w-full justify-center items-center"):
 
-                def confirm_action():
+                async def confirm_action():
                     dialog.close()
-                    self._delete_file()
+                    await self.delete_file()
 
                 ui.button("Yes!", on_click=confirm_action).props(props_button)
                 ui.button("No!", on_click=dialog.close).props(props_button)
@@ -127,23 +363,21 @@ class DataFileHandler:
             props_button
         ).tooltip("Delete the current content of data file.")
 
-    def copy_current_data_to_new_temp_file(self):
-        ending = time.strftime("%H-%M-%S")
-        copy_filename = self.full_filename.replace(".csv", f"_{ending}.csv")
-        copy_filename = os.path.join(
-            tempfile.gettempdir(), os.path.basename(copy_filename)
-        )
-        shutil.copyfile(self.full_filename, copy_filename)
-        self.log_and_notify(f"File {self.full_filename} has been copied to a new file.")
-        return copy_filename
-
-    def copy_current_data_to_new_file(self):
+    async def copy_current_data_to_new_file(self):
         copy_filename = self.get_current_full_filename()
         try:
-            shutil.copyfile(self.full_filename, copy_filename)
-            self.set_filename(copy_filename)
+            await self.exclusive_file_operation(
+                f"Copying data to {copy_filename}", self._copy_file, copy_filename
+            )
         except Exception as e:
             self.log_and_notify(f"Could not copy file to {copy_filename}. Error: {e}")
+            return
+        await self.set_filename(copy_filename)
+
+    def _copy_file(self, copy_filename: str):
+        shutil.copyfile(self.full_filename, copy_filename)
+        if os.path.exists(index_filename(self.full_filename)):
+            shutil.copyfile(index_filename(self.full_filename), index_filename(copy_filename))
 
     def alternative_filename_ui(self):
         size_limit = 20
@@ -179,7 +413,11 @@ class DataFileHandler:
             .classes("w-full")
         )
 
-    def download_file(self, filename=None):
+    def download_file(self, filename=None, start: float | None = None, end: float | None = None):
+        """
+        Streams the data compressed through /download, see util.download_stream.
+        The sealed segments of the file (the current one without filename) are included.
+        """
         timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
 
         if self.filename_of_download_inputfield != "":
@@ -189,15 +427,48 @@ class DataFileHandler:
         else:
             download_filename = str(timestamp) + "_" + self.filename
 
-        if filename is None:
-            filename = self.full_filename
-
-        ui.download(src=filename, filename=download_filename)
+        file = None if filename is None else Path(filename).name
+        url = download_url(
+            self.additional_path, file=file, start=start, end=end, filename=download_filename
+        )
+        ui.download(src=url)
 
     def download_file_button_ui(self):
         ui.button("Download data", on_click=self.download_file, color="positive").props(
             props_button
-        ).tooltip("Download the current data file.")
+        ).tooltip("Download the data compressed, including the sealed segments.")
+
+    def segments_button_ui(self):
+        with ui.dialog() as dialog, ui.card():
+            self.segments_ui()
+            ui.button("Close", on_click=dialog.close).props(props_button)
+
+        def open_dialog():
+            self.segments_ui.refresh()  # pylint: disable=no-member
+            dialog.open()
+
+        ui.button("Segments", on_click=open_dialog).props(props_button).tooltip(
+            "Download the sealed segments of the data file. The data file is sealed and a new one is started once it gets too large."
+        )
+
+    @ui.refreshable
+    def segments_ui(self):
+        segments = self.sealed_segments()
+        if not segments:
+            ui.label("No sealed segments yet.")
+            return
+        for segment in segments:
+            path = segment_path(self.full_filename, segment)
+            if path is None:
+                continue
+            start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(segment["first_time"]))
+            end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(segment["last_time"]))
+            with ui.row().classes("w-full items-center no-wrap"):
+                ui.label(f"{start} - {end}, {segment['rows']} rows, {os.path.getsize(path) / 2**20:.1f} MB")
+                ui.button(
+                    icon="download",
+                    on_click=lambda path=path: ui.download(src=path, filename=Path(path).name),
+                ).props(props_button)
 
     def save_download_clear_button_ui(self):
         ui.button("Save, Download and Clear", on_click=self.save_download_clear).props(
@@ -206,18 +477,35 @@ class DataFileHandler:
             f"Save current data to a new file with timestamp under {self.base_path}, download it and clear the current file."
         )
 
-    def save_download_clear(self):
+    async def save_download_clear(self):
         timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
 
         copy_filename = Path(self.full_filename).with_name(
             f"{timestamp}__{self.filename}"
         )
         try:
-            shutil.copyfile(self.full_filename, copy_filename)
-            self.download_file(filename=copy_filename)
-            self._delete_file()
+            await self.exclusive_file_operation(
+                "Saving data", self._move_file, str(copy_filename)
+            )
         except Exception as e:
-            self.log_and_notify(f"Could not copy file to {copy_filename}. Error: {e}")
+            self.log_and_notify(f"Could not move file to {copy_filename}. Error: {e}")
+            return
+        self.last_position_read = 0
+        self.known_segments = 0
+        self.unread_segments = []
+        for callback in self.clear_listeners:
+            callback()
+        self.download_file(filename=copy_filename)
+        self.log_and_notify(f"Data moved to {copy_filename}, {self.full_filename} has been emptied.")
+
+    def _move_file(self, copy_filename: str):
+        # renaming instead of copying is instant regardless of the file size
+        os.replace(self.full_filename, copy_filename)
+        if os.path.exists(index_filename(self.full_filename)):
+            os.replace(index_filename(self.full_filename), index_filename(copy_filename))
+        # the saved file keeps the rows rotated out into sealed segments, they are downloaded with it
+        move_segments(self.full_filename, copy_filename)
+        self._write_header_if_missing()
 
     def log_and_notify(self, message):
         """
@@ -226,13 +514,16 @@ class DataFileHandler:
         logger.info(message)
         ui.notify(message)
 
-    def set_filename(self, new_full_filename=None):
+    async def set_filename(self, new_full_filename=None):
         if new_full_filename is None:
             new_full_filename = self.get_current_full_filename()
         self.change_full_filename(new_full_filename)
         self.set_been_pressed = True
         self.create_ui.refresh()  # pylint: disable=no-member
-        self.create_file()
+        if not await run.io_bound(self._write_header_if_missing):
+            self.log_and_notify(
+                f"File {self.full_filename} already exists, appending data."
+            )
         self.pipe.send(f"setting filename {self.full_filename}")
         self.write_new_filename_to_settings()
         self.log_and_notify(
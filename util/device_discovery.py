@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Shared cache of the devices that can be connected to.
+"""
+import logging
+import time
+from typing import Any, Callable
+
+from nicegui import run, ui
+
+try:
+    import pyudev  # type: ignore
+except ImportError:  # not available on the windows lab pc
+    pyudev = None
+
+logger = logging.getLogger()
+
+
+class DeviceDiscovery:
+    """
+    Scans for devices in the background and keeps the results, so connection
+    menus can render instantly.
+
+    Cheap scanners (e.g. serial ports) run on every tick and their result is
+    diffed against the cache. A change, a udev hot-plug event or the periodic
+    full refresh also re-runs the expensive scanners (e.g. the Arcus DLL).
+    """
+
+    def __init__(self, interval: float = 2.0, full_refresh_interval: float = 30.0):
+        self.interval = interval  # seconds
+        self.full_refresh_interval = full_refresh_interval  # seconds
+
+        self.scanners: dict[str, tuple[Callable[[], Any], bool]] = {}
+        self.cache: dict[str, Any] = {}
+        self.listeners: dict[str, list[Callable[[], None]]] = {}
+
+        self.hotplug_detected = True
+        self.last_full_refresh = 0.0
+        self.timer: ui.timer = None  # type: ignore
+        self.udev_observer = None
+
+    def register(
+        self, kind: str, scanner: Callable[[], Any], cheap: bool = False, default=None
+    ):
+        """
+        Registers a scanner, e.g. register("serial", list_serial_ports, cheap=True).
+        """
+        if kind not in self.scanners:
+            self.scanners[kind] = (scanner, cheap)
+            self.cache.setdefault(kind, default)
+            self.hotplug_detected = True
+        self.start()
+
+    def subscribe(self, kind: str, callback: Callable[[], None]):
+        """
+        The callback is called on the event loop whenever the devices of kind change.
+        """
+        self.listeners.setdefault(kind, []).append(callback)
+
+    def get(self, kind: str):
+        return self.cache.get(kind)
+
+    def invalidate(self):
+        self.hotplug_detected = True
+
+    def start(self):
+        if self.timer is not None:
+            return
+        # global timer, first scan is done right away
+        self.timer = ui.timer(self.interval, self.refresh)
+        self.start_udev_monitor()
+
+    def start_udev_monitor(self):
+        if pyudev is None:
+            return
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by("usb")
+            monitor.filter_by("tty")
+            self.udev_observer = pyudev.MonitorObserver(
+                monitor, callback=lambda device: self.invalidate(), name="udev-monitor"
+            )
+            self.udev_observer.start()
+            logger.info("Device discovery listens for udev hot-plug events")
+        except Exception as e:
+            logger.warning("Could not start udev monitor, polling only: %s", e)
+
+    async def refresh(self):
+        changed_kinds = []
+
+        for kind, (scanner, cheap) in self.scanners.items():
+            if not cheap:
+                continue
+            if await self.scan(kind, scanner):
+                changed_kinds.append(kind)
+                self.hotplug_detected = True
+
+        full_refresh_due = (
+            time.monotonic() - self.last_full_refresh > self.full_refresh_interval
+        )
+        if self.hotplug_detected or full_refresh_due:
+            self.hotplug_detected = False
+            self.last_full_refresh = time.monotonic()
+            for kind, (scanner, cheap) in self.scanners.items():
+                if cheap:
+                    continue
+                if await self.scan(kind, scanner):
+                    changed_kinds.append(kind)
+
+        for kind in changed_kinds:
+            logger.debug("Devices of kind %s changed: %s", kind, self.cache[kind])
+            for callback in self.listeners.get(kind, []):
+                callback()
+
+    async def scan(self, kind: str, scanner: Callable[[], Any]) -> bool:
+        try:
+            result = await run.io_bound(scanner)
+        except Exception as e:
+            logger.error("Device scan for %s failed: %s", kind, e)
+            return False
+        if result == self.cache.get(kind):
+            return False
+        self.cache[kind] = result
+        return True
+
+
+def list_serial_ports() -> list[str]:
+    import serial.tools.list_ports  # type: ignore
+
+    return sorted(port.device for port in serial.tools.list_ports.comports())
+
+
+def list_visa_resources() -> list[str]:
+    import pyvisa
+
+    rm = pyvisa.ResourceManager("@py")
+    try:
+        return sorted(rm.list_resources())
+    finally:
+        rm.close()
+
+
+device_discovery = DeviceDiscovery()
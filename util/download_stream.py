@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Streaming download of the measurement data.
+
+GET /download/<source> streams the data of a registered DataFileHandler, i.e.
+its sealed segments and the current file, compressed with zstd (if zstandard
+is installed) or gzip. The data is read and compressed chunk by chunk in the
+worker threads of the server, without a temporary copy. Only the rows that
+were complete when the request arrived are sent, rows appended meanwhile are
+not, so the download is a consistent snapshot.
+
+Query parameters:
+    file         a file of the source's directory with its sealed segments instead of the current stream
+    start, end   unix timestamps, only rows within [start, end] are sent
+    compression  "zstd", "gzip" or "none"
+    filename     name of the downloaded file, without the compression suffix
+"""
+import gzip
+import itertools
+import logging
+import os
+import zlib
+from pathlib import Path
+from typing import IO, Iterator
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from nicegui import app
+
+from util.segment_rotation import stream_files
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger()
+
+CHUNK_SIZE = 2**20  # bytes
+
+# additional_path of the DataFileHandler -> handler
+download_sources: dict = {}
+
+MEDIA_TYPES = {"zstd": "application/zstd", "gzip": "application/gzip", "none": "text/csv"}
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+
+def default_compression() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def register_download_source(name: str, data_file_handler):
+    download_sources[name] = data_file_handler
+
+
+def download_url(
+    source: str,
+    file: str | None = None,
+    start: float | None = None,
+    end: float | None = None,
+    compression: str | None = None,
+    filename: str | None = None,
+) -> str:
+    params = {
+        "file": file,
+        "start": start,
+        "end": end,
+        "compression": compression or default_compression(),
+        "filename": filename,
+    }
+    query = urlencode({key: value for key, value in params.items() if value is not None})
+    return f"/download/{source}?{query}"
+
+
+def make_compressor(compression: str):
+    """
+    Returns an object with compress(data) and flush() like zlib's.
+    """
+    if compression == "zstd":
+        if zstandard is None:
+            raise HTTPException(400, "zstd is not available, install zstandard")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip header
+    if compression == "none":
+        return None
+    raise HTTPException(400, f"unknown compression {compression}")
+
+
+def open_snapshot(handler, file: str | None, start: float | None) -> list[tuple[IO[bytes], int, int]]:
+    """
+    Opens the files of the download right away, so a segment rotation during
+    the download does not matter, and notes how far they may be read.
+    Returns (file object, start offset, end offset or -1 for everything).
+    """
+    if file is not None:
+        path = Path(handler.full_filename).parent / file
+        if Path(file).name != file or not path.is_file():
+            raise HTTPException(404, f"{file} not found")
+        paths = stream_files(str(path), start)
+    else:
+        paths = stream_files(handler.full_filename, start)
+
+    parts = []
+    for path in paths:
+        if path.endswith(".gz"):
+            # sealed segments do not change anymore
+            parts.append((gzip.open(path, "rb"), 0, -1))
+            continue
+        f = open(path, "rb")
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        if start is not None and path == handler.full_filename:
+            offset = handler.offset_for_time(start)
+        parts.append((f, offset, size))
+    return parts
+
+
+def read_lines(f: IO[bytes], offset: int, size: int) -> Iterator[bytes]:
+    """
+    Blocks of complete lines from offset up to size.
+    """
+    f.seek(offset)
+    remaining = size - offset if size >= 0 else None
+    rest = b""
+    while remaining is None or remaining > 0:
+        block = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        block = rest + block
+        end = block.rfind(b"\n") + 1
+        rest = block[end:]
+        if end:
+            yield block[:end]
+    # a last line without line break is still being written
+    if size < 0 and rest:
+        yield rest + b"\n"
+
+
+def filter_rows(block: bytes, start: float | None, end: float | None) -> bytes:
+    rows = []
+    for line in block.splitlines(keepends=True):
+        try:
+            timestamp = float(line.split(b",", 1)[0])
+        except ValueError:
+            continue
+        if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+            rows.append(line)
+    return b"".join(rows)
+
+
+def generate(parts, headers: list[str], start: float | None, end: float | None, compressor) -> Iterator[bytes]:
+    try:
+        header_sent = False
+        chunks = []
+        for f, offset, size in parts:
+            blocks = read_lines(f, offset, size)
+            if offset == 0:
+                # every file starts with the header, it is sent only once
+                first = next(blocks, b"")
+                split = first.find(b"\n") + 1
+                if not header_sent and split:
+                    chunks.append(first[:split])
+                    header_sent = True
+                blocks = itertools.chain([first[split:]], blocks)
+            if not header_sent and headers:
+                # no header line in the file, e.g. empty or read from an offset
+                chunks.append((",".join(headers) + "\r\n").encode("utf-8"))
+                header_sent = True
+            for block in blocks:
+                if start is not None or end is not None:
+                    block = filter_rows(block, start, end)
+                chunks.append(block)
+                data = b"".join(chunks)
+                chunks = []
+                if compressor is None:
+                    yield data
+                elif compressed := compressor.compress(data):
+                    yield compressed
+        data = b"".join(chunks)
+        if compressor is None:
+            yield data
+        else:
+            yield compressor.compress(data) + compressor.flush()
+    finally:
+        for f, _, _ in parts:
+            f.close()
+
+
+@app.get("/download/{source}")
+def download_endpoint(
+    source: str,
+    file: str | None = None,
+    start: float | None = None,
+    end: float | None = None,
+    compression: str = "gzip",
+    filename: str | None = None,
+):
+    # runs in a worker thread of the server, not on the event loop
+    if not app.storage.user.get("authenticated", False):
+        raise HTTPException(403, "not logged in")
+    handler = download_sources.get(source)
+    if handler is None:
+        raise HTTPException(404, f"unknown data source {source}")
+
+    compressor = make_compressor(compression)
+    parts = open_snapshot(handler, file, start)
+    if filename is None:
+        filename = file or handler.filename
+    logger.info("Streaming %s of %s (%s)", file or "all data", source, compression)
+    return StreamingResponse(
+        generate(parts, handler.headers, start, end, compressor),
+        media_type=MEDIA_TYPES[compression],
+        headers={"Content-Disposition": f'attachment; filename="{filename}{SUFFIXES[compression]}"'},
+    )
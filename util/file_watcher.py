@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Process wide file watcher. Subscribers are called with the path and the number
+of bytes the file grew by whenever a watched file changes; a negative number
+means the file was truncated or replaced.
+
+Uses inotify / ReadDirectoryChangesW through watchfiles if it is installed and
+falls back to polling the size and mtime of the files otherwise.
+"""
+import logging
+import os
+import threading
+from typing import Callable
+
+try:
+    import watchfiles  # type: ignore
+except ImportError:
+    watchfiles = None
+
+logger = logging.getLogger()
+
+FileCallback = Callable[[str, int], None]
+
+
+class FileWatcher:
+    """
+    The callbacks run in the watcher thread, they have to be quick and thread safe.
+    """
+
+    def __init__(self, poll_interval: float = 0.1):
+        self.poll_interval = poll_interval  # seconds, only used without watchfiles
+
+        self.subscribers: dict[str, list[FileCallback]] = {}
+        self.states: dict[str, tuple[int, int]] = {}  # size, mtime in ns
+        self.lock = threading.Lock()
+        self.thread: threading.Thread = None  # type: ignore
+        # set to make the watch loop pick up new directories
+        self.restart_event = threading.Event()
+
+    @staticmethod
+    def normalize(path) -> str:
+        return os.path.normcase(os.path.abspath(str(path)))
+
+    def subscribe(self, path, callback: FileCallback):
+        path = self.normalize(path)
+        with self.lock:
+            new_directory = os.path.dirname(path) not in self.directories()
+            self.subscribers.setdefault(path, []).append(callback)
+            self.states.setdefault(path, file_state(path))
+        if new_directory:
+            self.restart_event.set()
+        self.start()
+
+    def unsubscribe(self, path, callback: FileCallback):
+        path = self.normalize(path)
+        with self.lock:
+            callbacks = self.subscribers.get(path, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.subscribers.pop(path, None)
+                self.states.pop(path, None)
+
+    def is_watching(self, path) -> bool:
+        return self.thread is not None and self.normalize(path) in self.subscribers
+
+    def directories(self) -> set[str]:
+        return {os.path.dirname(path) for path in self.subscribers}
+
+    def start(self):
+        if self.thread is not None:
+            return
+        target = self.watch_loop if watchfiles is not None else self.poll_loop
+        self.thread = threading.Thread(target=target, name="file-watcher", daemon=True)
+        self.thread.start()
+        logger.debug(
+            "File watcher started (%s)", "watchfiles" if watchfiles is not None else "polling"
+        )
+
+    def watch_loop(self):
+        while True:
+            self.restart_event.clear()
+            with self.lock:
+                directories = [d for d in self.directories() if os.path.isdir(d)]
+            if not directories:
+                self.restart_event.wait(1)
+                continue
+            try:
+                for changes in watchfiles.watch(
+                    *directories, stop_event=self.restart_event, debounce=50, step=20
+                ):
+                    self.check({self.normalize(path) for _, path in changes}, reported=True)
+            except Exception as e:
+                logger.error("File watcher failed, restarting: %s", e)
+                self.restart_event.wait(1)
+
+    def poll_loop(self):
+        while True:
+            with self.lock:
+                paths = set(self.subscribers)
+            self.check(paths)
+            self.restart_event.wait(self.poll_interval)
+            self.restart_event.clear()
+
+    def check(self, paths: set[str], reported: bool = False):
+        """
+        Changes reported by the OS always count, polled files only if their
+        size or mtime changed.
+        """
+        events = []
+        with self.lock:
+            for path in paths:
+                if path not in self.subscribers:
+                    continue
+                state = file_state(path)
+                previous = self.states.get(path, (0, 0))
+                if state == previous and not reported:
+                    continue
+                self.states[path] = state
+                events.append((path, state[0] - previous[0], list(self.subscribers[path])))
+
+        for path, grown_by, callbacks in events:
+            for callback in callbacks:
+                try:
+                    callback(path, grown_by)
+                except Exception as e:
+                    logger.error("File watcher callback for %s failed: %s", path, e)
+
+
+def file_state(path: str) -> tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+file_watcher = FileWatcher()
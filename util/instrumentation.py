@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Lightweight instrumentation of the timer callbacks and the event loop of the
+NiceGUI server. The collected metrics are served to logged in users on
+/metrics in the Prometheus text format and shown in the diagnostics panel of
+the right drawer.
+"""
+import asyncio
+import functools
+import logging
+import math
+import time
+from operator import attrgetter
+from typing import Callable
+
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+from nicegui import app, ui
+
+logger = logging.getLogger()
+
+# upper bounds of the duration histogram buckets in seconds
+DURATION_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, math.inf)
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket that contains the q-quantile.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound if bound != math.inf else self.max
+        return self.max
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.durations: dict[str, Histogram] = {}
+        self.overruns: dict[str, int] = {}
+        self.loop_lag = Histogram()
+        self.last_loop_lag = 0.0
+        self.pipe_depths: dict[str, int] = {}
+
+        self.loop_lag_interval = 0.5  # seconds
+        self.loop_lag_timer: ui.timer = None  # type: ignore
+        self.last_loop_lag_check = 0.0
+
+    def observe_duration(self, name: str, duration: float, budget: float | None = None):
+        histogram = self.durations.get(name)
+        if histogram is None:
+            histogram = self.durations[name] = Histogram()
+            self.overruns[name] = 0
+        histogram.observe(duration)
+        if budget is not None and duration > budget:
+            self.overruns[name] += 1
+
+    def set_pipe_depth(self, name: str, depth: int):
+        self.pipe_depths[name] = depth
+
+    def start(self):
+        """
+        Starts measuring the event loop lag, must be called once the event loop runs.
+        """
+        if self.loop_lag_timer is not None:
+            return
+        self.last_loop_lag_check = time.perf_counter()
+        self.loop_lag_timer = ui.timer(self.loop_lag_interval, self.measure_loop_lag)
+
+    def measure_loop_lag(self):
+        now = time.perf_counter()
+        # the timer fires late by the time the event loop was blocked
+        self.last_loop_lag = max(now - self.last_loop_lag_check - self.loop_lag_interval, 0.0)
+        self.last_loop_lag_check = now
+        self.loop_lag.observe(self.last_loop_lag)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP orbitos_callback_duration_seconds Duration of instrumented callbacks.",
+            "# TYPE orbitos_callback_duration_seconds histogram",
+        ]
+        for name, histogram in self.durations.items():
+            lines += histogram_lines("orbitos_callback_duration_seconds", histogram, f'callback="{name}"')
+
+        lines += [
+            "# HELP orbitos_callback_overruns_total Callback runs that took longer than their timer interval.",
+            "# TYPE orbitos_callback_overruns_total counter",
+        ]
+        for name, count in self.overruns.items():
+            lines.append(f'orbitos_callback_overruns_total{{callback="{name}"}} {count}')
+
+        lines += [
+            "# HELP orbitos_event_loop_lag_seconds Delay of a periodic timer on the event loop.",
+            "# TYPE orbitos_event_loop_lag_seconds histogram",
+        ]
+        lines += histogram_lines("orbitos_event_loop_lag_seconds", self.loop_lag)
+
+        lines += [
+            "# HELP orbitos_pipe_queue_depth Messages waiting in a controller pipe when it was read.",
+            "# TYPE orbitos_pipe_queue_depth gauge",
+        ]
+        for name, depth in self.pipe_depths.items():
+            lines.append(f'orbitos_pipe_queue_depth{{pipe="{name}"}} {depth}')
+        return "\n".join(lines) + "\n"
+
+    def summary_rows(self) -> list[dict]:
+        return [
+            {
+                "callback": name,
+                "count": histogram.count,
+                "mean": f"{histogram.mean() * 1e3:.1f}",
+                "p95": f"{histogram.quantile(0.95) * 1e3:.0f}",
+                "max": f"{histogram.max * 1e3:.1f}",
+                "overruns": self.overruns[name],
+            }
+            for name, histogram in sorted(
+                self.durations.items(), key=lambda item: item[1].sum, reverse=True
+            )
+        ]
+
+    def create_ui(self):
+        """
+        Diagnostics panel, only updated while it is visible.
+        """
+        columns = [
+            {"name": "callback", "label": "Callback", "field": "callback", "align": "left"},
+            {"name": "count", "label": "Runs", "field": "count"},
+            {"name": "mean", "label": "Mean [ms]", "field": "mean"},
+            {"name": "p95", "label": "p95 [ms]", "field": "p95"},
+            {"name": "max", "label": "Max [ms]", "field": "max"},
+            {"name": "overruns", "label": "Overruns", "field": "overruns"},
+        ]
+        loop_label = ui.label()
+        pipe_label = ui.label()
+        table = ui.table(columns=columns, rows=[], row_key="callback").props("dense flat").classes("w-full")
+
+        def update():
+            loop_label.text = (
+                f"Event loop lag: {self.last_loop_lag * 1e3:.0f} ms now, "
+                f"p95 {self.loop_lag.quantile(0.95) * 1e3:.0f} ms, max {self.loop_lag.max * 1e3:.0f} ms"
+            )
+            pipe_label.text = "Pipe queue depth: " + (
+                ", ".join(f"{name}: {depth}" for name, depth in self.pipe_depths.items()) or "-"
+            )
+            table.rows = self.summary_rows()
+            table.update()
+
+        update()
+        return ui.timer(2, update)
+
+
+def histogram_lines(metric: str, histogram: Histogram, labels: str = "") -> list[str]:
+    separator = "," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == math.inf else repr(bound)
+        lines.append(f'{metric}_bucket{{{labels}{separator}le="{le}"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{metric}_sum{suffix} {histogram.sum}")
+    lines.append(f"{metric}_count{suffix} {histogram.count}")
+    return lines
+
+
+def instrumented(name: str, budget: float | str | None = None):
+    """
+    Records the duration of every call of the decorated function or coroutine.
+    The budget is the timer interval in seconds, or the name of the attribute of
+    self holding it; calls that take longer are counted as overruns.
+    """
+
+    def get_budget(args) -> float | None:
+        if isinstance(budget, str):
+            try:
+                return attrgetter(budget)(args[0])
+            except (AttributeError, IndexError):
+                return None
+        return budget
+
+    def decorator(func: Callable):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metrics.observe_duration(name, time.perf_counter() - start, get_budget(args))
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe_duration(name, time.perf_counter() - start, get_budget(args))
+
+        return wrapper
+
+    return decorator
+
+
+metrics = MetricsRegistry()
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    # the middleware only guards the pages, not the other routes
+    if not app.storage.user.get("authenticated", False):
+        raise HTTPException(403, "not logged in")
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
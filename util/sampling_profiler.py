@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Low overhead sampling profiler that can be switched on and off while ORBITOS
+is running. A background thread periodically records the stacks of all other
+threads of the process; the result is written in the speedscope format and
+can be opened on https://www.speedscope.app.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger()
+profiles_directory = Path(__file__).parent.parent / "profiles"
+
+Frame = tuple[str, str, int]  # function name, file, first line
+
+
+class SamplingProfiler:
+    def __init__(self, name: str, interval: float = 0.005):
+        self.name = name
+        self.interval = interval  # seconds between samples
+
+        # seconds spent per thread and stack
+        self.samples: dict[str, Counter[tuple[Frame, ...]]] = {}
+        self.thread: threading.Thread = None  # type: ignore
+        self.stop_event = threading.Event()
+        self.start_time = 0.0
+        self.duration = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples = {}
+        self.stop_event.clear()
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(
+            target=self.sample_loop, name="sampling-profiler", daemon=True
+        )
+        self.thread.start()
+        logger.info("Sampling profiler started in %s (pid %s)", self.name, os.getpid())
+
+    def stop(self) -> Path | None:
+        """
+        Stops sampling and returns the path of the written profile.
+        """
+        if not self.running:
+            return None
+        self.stop_event.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.start_time
+        path = self.save()
+        logger.info("Sampling profiler stopped in %s, profile written to %s", self.name, path)
+        return path
+
+    def sample_loop(self):
+        own_id = threading.get_ident()
+        last_sample = time.perf_counter()
+        while not self.stop_event.wait(self.interval):
+            # the real time between samples, the wait is longer than the interval under load
+            now = time.perf_counter()
+            elapsed, last_sample = now - last_sample, now
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                thread_name = thread_names.get(thread_id, str(thread_id))
+                self.samples.setdefault(thread_name, Counter())[tuple(stack)] += elapsed
+
+    def to_speedscope(self) -> dict:
+        frames: list[dict] = []
+        frame_index: dict[Frame, int] = {}
+        profiles = []
+        for thread_name, stacks in self.samples.items():
+            samples = []
+            weights = []
+            for stack, seconds in stacks.items():
+                indices = []
+                for frame in stack:
+                    if frame not in frame_index:
+                        frame_index[frame] = len(frames)
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                    indices.append(frame_index[frame])
+                samples.append(indices)
+                weights.append(seconds)
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": f"{self.name} - {thread_name}",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            )
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.name} ({self.duration:.1f} s)",
+            "exporter": "orbitos sampling profiler",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def save(self) -> Path:
+        profiles_directory.mkdir(exist_ok=True)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        safe_name = "".join(c if c.isalnum() else "_" for c in self.name)
+        path = profiles_directory / f"{timestamp}_{safe_name}.speedscope.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_speedscope(), f)
+        return path
+
+
+def list_profiles(newer_than: float = 0.0) -> list[Path]:
+    if not profiles_directory.exists():
+        return []
+    return sorted(
+        (p for p in profiles_directory.glob("*.speedscope.json") if p.stat().st_mtime >= newer_than),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Segment rotation of the measurement files.
+
+The controllers always append to the active data file. Once it exceeds the
+row, size or duration limit it is sealed: renamed to <name>_segNNNN.csv,
+recorded in the manifest <name>.csv.manifest.json and compressed in the
+background, and a new active file with the same header is started. Readers
+use stream_files() to treat the sealed segments and the active file as one
+logical stream.
+"""
+import gzip
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import orjson
+
+from util.time_index import index_filename, remove_index
+
+logger = logging.getLogger()
+
+
+def manifest_filename(active_filename: str) -> str:
+    return f"{active_filename}.manifest.json"
+
+
+def load_manifest(active_filename: str) -> dict:
+    try:
+        with open(manifest_filename(active_filename), "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {"segments": []}
+
+
+def write_manifest(active_filename: str, manifest: dict):
+    # write and rename, so readers never see a half written manifest
+    path = manifest_filename(active_filename)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, path)
+
+
+def segment_path(active_filename: str, segment: dict) -> str | None:
+    """
+    Path of the segment as it is on disk right now, compressed or not.
+    """
+    directory = Path(active_filename).parent
+    # the manifest may not know yet that the segment was compressed
+    for name in (segment.get("compressed"), segment["filename"], f"{segment['filename']}.gz"):
+        if name and (directory / name).exists():
+            return str(directory / name)
+    return None
+
+
+def stream_files(active_filename: str, start_time: float | None = None) -> list[str]:
+    """
+    The sealed segments (oldest first) and the active file, optionally only
+    those with data newer than start_time. Compressed segments end with .gz.
+    """
+    files = []
+    for segment in load_manifest(active_filename)["segments"]:
+        if start_time is not None and segment.get("last_time", float("inf")) < start_time:
+            continue
+        path = segment_path(active_filename, segment)
+        if path is not None:
+            files.append(path)
+    if os.path.exists(active_filename):
+        files.append(active_filename)
+    return files
+
+
+def next_segment_number(active_filename: str) -> int:
+    """
+    One more than the highest segment number on disk, so segments detached
+    from the stream (see forget_segments) are never overwritten.
+    """
+    path = Path(active_filename)
+    pattern = re.compile(rf"{re.escape(path.stem)}_seg(\d+){re.escape(path.suffix)}(\.gz)?")
+    numbers = [
+        int(match.group(1))
+        for name in os.listdir(path.parent)
+        if (match := pattern.fullmatch(name))
+    ]
+    return max(numbers, default=0) + 1
+
+
+def move_segments(active_filename: str, new_filename: str):
+    """
+    Attaches the sealed segments of active_filename to new_filename, e.g. when
+    the active file is renamed. The segment files stay where they are.
+    """
+    try:
+        os.replace(manifest_filename(active_filename), manifest_filename(new_filename))
+    except FileNotFoundError:
+        pass
+
+
+def forget_segments(active_filename: str):
+    """
+    Detaches the sealed segments from the stream, the files stay on disk as archive.
+    """
+    try:
+        os.remove(manifest_filename(active_filename))
+    except FileNotFoundError:
+        pass
+
+
+class SegmentRotator:
+    """
+    Used by the writer of a data file, i.e. in the controller process.
+    Limits that are None are not checked.
+    """
+
+    def __init__(
+        self,
+        max_rows: int | None = None,
+        max_bytes: int | None = 50 * 2**20,
+        max_duration: float | None = None,  # seconds
+        compress: bool = True,
+    ):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self.compress = compress
+
+        self.active_filename: str = None  # type: ignore
+        self.rows = 0
+        self.bytes = 0
+        self.first_time: float = None  # type: ignore
+        self.last_time: float = None  # type: ignore
+        self.manifest_lock = threading.Lock()
+
+    def start_tracking(self, active_filename: str, first_time: float):
+        self.active_filename = active_filename
+        self.rows = 0
+        self.bytes = os.path.getsize(active_filename)
+        self.first_time = read_first_timestamp(active_filename) or first_time
+
+    def rows_written(self, active_filename: str, first_time: float, last_time: float, n_rows: int, n_bytes: int):
+        """
+        Called after every batch appended to the active file.
+        """
+        if n_rows == 0:
+            return
+        if active_filename != self.active_filename:
+            self.start_tracking(active_filename, float(first_time))
+        else:
+            self.bytes += n_bytes
+        if self.first_time is None:
+            self.first_time = float(first_time)
+        self.rows += n_rows
+        self.last_time = float(last_time)
+
+        if self.limit_reached():
+            self.rotate()
+
+    def limit_reached(self) -> bool:
+        return (
+            (self.max_rows is not None and self.rows >= self.max_rows)
+            or (self.max_bytes is not None and self.bytes >= self.max_bytes)
+            or (
+                self.max_duration is not None
+                and self.last_time - self.first_time >= self.max_duration
+            )
+        )
+
+    def rotate(self):
+        active = self.active_filename
+        with open(active, "r", newline="", encoding="utf-8") as f:
+            header = f.readline()
+
+        with self.manifest_lock:
+            manifest = load_manifest(active)
+            number = next_segment_number(active)
+            path = Path(active)
+            sealed = str(path.with_name(f"{path.stem}_seg{number:04d}{path.suffix}"))
+            if os.path.exists(sealed) or os.path.exists(f"{sealed}.gz"):
+                # only possible if another process seals the same file, never overwrite a segment
+                logger.error("Not sealing %s, %s already exists", active, sealed)
+                return
+            try:
+                os.replace(active, sealed)
+            except PermissionError as e:
+                # on windows a reader may have the file open, try again with the next batch
+                logger.warning("Could not seal %s yet: %s", active, e)
+                return
+            if os.path.exists(index_filename(active)):
+                os.replace(index_filename(active), index_filename(sealed))
+
+            with open(active, "w", newline="", encoding="utf-8") as f:
+                f.write(header)
+
+            segment = {
+                "filename": Path(sealed).name,
+                "compressed": None,
+                "first_time": self.first_time,
+                "last_time": self.last_time,
+                "rows": self.rows,
+                "bytes": os.path.getsize(sealed),
+                "sealed_at": time.time(),
+            }
+            manifest["segments"].append(segment)
+            write_manifest(active, manifest)
+
+        logger.info("Sealed %s after %s rows, %s bytes", sealed, self.rows, segment["bytes"])
+        self.rows = 0
+        self.bytes = len(header.encode("utf-8"))
+        self.first_time = None  # type: ignore
+
+        if self.compress:
+            threading.Thread(
+                target=self.compress_segment,
+                args=(active, sealed),
+                name="segment-compression",
+                daemon=True,
+            ).start()
+
+    def compress_segment(self, active: str, sealed: str):
+        compressed = f"{sealed}.gz"
+        if os.path.exists(compressed):
+            logger.error("Not compressing %s, %s already exists", sealed, compressed)
+            return
+        try:
+            with open(sealed, "rb") as src, gzip.open(compressed, "wb") as dst:
+                shutil.copyfileobj(src, dst, 2**20)
+        except OSError as e:
+            logger.error("Could not compress %s: %s", sealed, e)
+            return
+
+        with self.manifest_lock:
+            manifest = load_manifest(active)
+            for segment in manifest["segments"]:
+                if segment["filename"] == Path(sealed).name:
+                    segment["compressed"] = Path(compressed).name
+            write_manifest(active, manifest)
+        # the byte offsets of the index do not apply to the compressed file
+        remove_index(sealed)
+        try:
+            os.remove(sealed)
+        except PermissionError as e:
+            logger.warning("Could not remove %s after compression: %s", sealed, e)
+
+
+def read_first_timestamp(filename: str) -> float | None:
+    try:
+        with open(filename, "r", newline="", encoding="utf-8") as f:
+            f.readline()
+            first_row = f.readline()
+        return float(first_row.split(",", 1)[0])
+    except (OSError, ValueError):
+        return None
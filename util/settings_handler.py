@@ -2,15 +2,25 @@
 """
 This module represents a chopper wheel device.
 """
+import asyncio
 import logging
 from multiprocessing.connection import Connection
 import os
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import orjson
 
+from nicegui import background_tasks
+
+from util.file_watcher import file_watcher
+
 logger = logging.getLogger()
 
+# one thread, so the writes of quick successive changes stay in order
+settings_executor = ThreadPoolExecutor(1, thread_name_prefix="settings")
+
 
 class SettingsHandler:
     def __init__(
@@ -20,6 +30,8 @@ class SettingsHandler:
         additional_path: str = "",
     ) -> None:
         self.last_mod_time = 0.0
+        self.file_changed = True  # set by the file watcher
+        self.watched_filename = None
         self.working_directory = Path(__file__).parent.parent
         self.filename = Path(
             str(self.working_directory / "settings" / additional_path / filename)
@@ -43,20 +55,48 @@ class SettingsHandler:
         self.settings_changed()
 
     def settings_changed(self):
-        self._write_settings()
+        """
+        On an event loop (the UI) the file is written on the I/O executor and
+        the controller is told afterwards, otherwise right away.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_settings()
+            self._notify_controller()
+            return
+        background_tasks.create(self._write_settings_and_notify(), name="write settings")
+
+    async def _write_settings_and_notify(self):
+        try:
+            # serialized here, the dict may change while the file is written
+            data = orjson.dumps(self.settings, option=orjson.OPT_INDENT_2)
+            await asyncio.get_running_loop().run_in_executor(settings_executor, self._write_file, data)
+        except OSError as e:
+            logger.error("Could not write %s: %s", self.filename, e)
+            return
+        self._notify_controller()
+
+    def _notify_controller(self):
         if self.pipe:
             self.pipe.send("settings_changed")
 
     def _write_settings(self):
-        with open(self.filename, "w", encoding="utf-8") as f:
-            f.write(orjson.dumps(self.settings, option=orjson.OPT_INDENT_2).decode())
+        self._write_file(orjson.dumps(self.settings, option=orjson.OPT_INDENT_2))
+
+    def _write_file(self, data: bytes):
+        # written next to it and renamed, the controller never reads a half written file
+        tmp = f"{self.filename}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.filename)
         self.log(f"Settings have been updated in {self.filename}.")
 
     def reset_to_default_settings(self):
-        if os.path.isfile(self.filename):
-            os.remove(self.filename)
         default_name = str(self.filename).replace(".json", "_default.json")
-        shutil.copy(default_name, self.filename)
+        tmp = f"{self.filename}.{threading.get_ident()}.tmp"
+        shutil.copy(default_name, tmp)
+        os.replace(tmp, self.filename)
         self.log(f"Settings have been reset to default in {self.filename}.")
 
     def _ensure_directory_exists(self):
@@ -71,6 +111,9 @@ class SettingsHandler:
             return True
         return False
 
+    def on_file_event(self, path: str, grown_by: int):
+        self.file_changed = True
+
     def new_data_or_new_file(self):
         """
         Check if the file has been modified.
@@ -79,6 +122,15 @@ class SettingsHandler:
             self._ensure_directory_exists()
         if self._is_it_a_new_filename():
             return True
+        if self.watched_filename != self.filename:
+            if self.watched_filename is not None:
+                file_watcher.unsubscribe(self.watched_filename, self.on_file_event)
+            file_watcher.subscribe(self.filename, self.on_file_event)
+            self.watched_filename = self.filename
+            self.file_changed = True
+        if file_watcher.is_watching(self.filename):
+            changed, self.file_changed = self.file_changed, False
+            return changed
         mod_time = os.path.getmtime(self.filename)
         if mod_time > self.last_mod_time:
             self.last_mod_time = mod_time
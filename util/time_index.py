@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Sparse time -> byte offset index of the measurement files.
+
+The writers append an entry "timestamp,offset" to a sidecar file next to the
+data file (data.csv -> data.csv.idx) every few rows or every second, where
+offset is the position of the row with that timestamp. Readers look up the
+offset of a time window and seek there instead of reading the whole file.
+"""
+import bisect
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+
+def index_filename(data_filename: str) -> str:
+    return f"{data_filename}.idx"
+
+
+def remove_index(data_filename: str):
+    """
+    Must be called whenever the data file is truncated or replaced.
+    """
+    try:
+        os.remove(index_filename(data_filename))
+    except FileNotFoundError:
+        pass
+
+
+class TimeIndexWriter:
+    def __init__(self, every_rows: int = 1000, every_seconds: float = 1.0):
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+
+        self.data_filename: str = None  # type: ignore
+        self.rows_since_entry = 0
+        self.last_entry_time = 0.0
+
+    def add_batch(self, data_filename: str, offset: int, first_timestamp: float, n_rows: int):
+        """
+        Called by the writer for every batch of rows appended to the data file,
+        offset is the file position before the batch was written.
+        """
+        if n_rows == 0:
+            return
+        now = time.monotonic()
+        due = (
+            data_filename != self.data_filename
+            or self.rows_since_entry >= self.every_rows
+            or now - self.last_entry_time >= self.every_seconds
+        )
+        if due:
+            try:
+                with open(index_filename(data_filename), "a", encoding="utf-8") as f:
+                    f.write(f"{float(first_timestamp)},{offset}\n")
+            except OSError as e:
+                logger.error("Could not write the time index of %s: %s", data_filename, e)
+                return
+            self.data_filename = data_filename
+            self.rows_since_entry = 0
+            self.last_entry_time = now
+        self.rows_since_entry += n_rows
+
+
+class TimeIndexReader:
+    """
+    Keeps the entries of one index in memory and only reads what was appended
+    since the last lookup.
+    """
+
+    def __init__(self):
+        self.data_filename: str = None  # type: ignore
+        self.timestamps: list[float] = []
+        self.offsets: list[int] = []
+        self.position = 0
+
+    def reset(self, data_filename: str):
+        self.data_filename = data_filename
+        self.timestamps = []
+        self.offsets = []
+        self.position = 0
+
+    def refresh(self, data_filename: str):
+        path = index_filename(data_filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.reset(data_filename)
+            return
+        # a recreated index is smaller than what was read before
+        if data_filename != self.data_filename or stat.st_size < self.position:
+            self.reset(data_filename)
+        if stat.st_size == self.position:
+            return
+
+        with open(path, "rb") as f:
+            f.seek(self.position)
+            chunk = f.read()
+        # only complete lines, the writer may be in the middle of one
+        complete = chunk[: chunk.rfind(b"\n") + 1]
+        self.position += len(complete)
+        for line in complete.splitlines():
+            try:
+                timestamp, offset = line.split(b",")
+                timestamp, offset = float(timestamp), int(offset)
+            except ValueError:
+                continue
+            # timestamps must increase for the bisection, e.g. a clock jump starts over
+            if self.timestamps and timestamp < self.timestamps[-1]:
+                self.timestamps.clear()
+                self.offsets.clear()
+            self.timestamps.append(timestamp)
+            self.offsets.append(offset)
+
+    def offset_for_time(self, data_filename: str, start_time: float) -> int:
+        """
+        Offset of a row at or before the first row with a timestamp >= start_time,
+        0 (read from the start) if there is no usable index.
+        """
+        self.refresh(data_filename)
+        i = bisect.bisect_right(self.timestamps, start_time) - 1
+        if i < 0:
+            return 0
+        offset = self.offsets[i]
+        try:
+            if offset >= os.path.getsize(data_filename):
+                # the index does not belong to this file anymore
+                return 0
+        except OSError:
+            return 0
+        return offset
+
+    def latest_time(self, data_filename: str) -> float | None:
+        self.refresh(data_filename)
+        return self.timestamps[-1] if self.timestamps else None